@@ -16,6 +16,33 @@ class AppCreateRequest(BaseModel):
     tags: List[str] = Field(default_factory=list, title="Tags for Categorization")
     region: str = Field(..., title="Hosting Region")  # e.g., US-East, Europe-West
 
+class IngestQuotaRequest(BaseModel):
+    """
+    Request model for an app's ingest quota.
+    """
+    ingest_rate_limit: Optional[float] = Field(None, title="Events per second", gt=0)  # None keeps the default
+    ingest_burst: Optional[float] = Field(None, title="Burst size in events", ge=1)
+
+class SamplingRule(BaseModel):
+    """
+    Share of sessions whose events of a type are stored.
+    """
+    event_type: str = Field(..., title="Event Type", max_length=100)  # "*" matches types without a rule
+    rate: float = Field(1.0, title="Share of sessions kept", gt=0, le=1)
+    max_events_per_second: Optional[float] = Field(None, title="Adaptive target in stored events per second", gt=0)
+
+class SamplingPolicyRequest(BaseModel):
+    """
+    Request model for an app's server-side sampling rules.
+    """
+    rules: List[SamplingRule] = Field(default_factory=list, title="Sampling Rules")  # empty stores every event
+
+class RetentionPolicyRequest(BaseModel):
+    """
+    Request model for an app's raw event retention.
+    """
+    retention_days: Optional[int] = Field(None, title="Days to keep raw events", ge=0)  # None keeps the default, 0 keeps forever
+
 class AppModel(BaseModel):
     """
     Data model for storing app details.
@@ -35,3 +62,7 @@ class AppModel(BaseModel):
     status: str = Field(default="Active", title="App Status")  # Default to Active
     created_at: datetime = Field(default_factory=datetime.now, title="Creation Timestamp")
     created_by: str = Field(..., title="Created By User ID")
+    retention_days: Optional[int] = Field(None, title="Days to keep raw events")  # None uses RETENTION_DEFAULT_DAYS
+    ingest_rate_limit: Optional[float] = Field(None, title="Ingest events per second")  # None uses INGEST_RATE_LIMIT
+    ingest_burst: Optional[float] = Field(None, title="Ingest burst size")
+    sampling_rules: List[dict] = Field(default_factory=list, title="Server-side sampling rules")
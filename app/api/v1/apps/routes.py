@@ -1,6 +1,6 @@
 from fastapi import APIRouter, Depends
 from app.api.v1.auth.dependencies import get_current_user
-from app.api.v1.apps.models import AppCreateRequest
+from app.api.v1.apps.models import AppCreateRequest, IngestQuotaRequest, RetentionPolicyRequest, SamplingPolicyRequest
 from app.api.v1.apps.services import AppService
 
 app_router = APIRouter()
@@ -19,6 +19,28 @@ async def get_app(app_id: str, user: dict = Depends(get_current_user)):
     """
     return await AppService.get_app(app_id, user["user_id"])
 
+@app_router.put("/{app_id}/quota", tags=["Apps"])
+async def set_ingest_quota(app_id: str, quota: IngestQuotaRequest, user: dict = Depends(get_current_user)):
+    """
+    Sets the App's ingest quota in events per second, with an optional burst size.
+    """
+    return await AppService.set_ingest_quota(app_id, user["user_id"], quota)
+
+@app_router.put("/{app_id}/sampling", tags=["Apps"])
+async def set_sampling(app_id: str, policy: SamplingPolicyRequest, user: dict = Depends(get_current_user)):
+    """
+    Sets which share of sessions the App's high-volume event types are stored for.
+    """
+    return await AppService.set_sampling(app_id, user["user_id"], policy)
+
+@app_router.put("/{app_id}/retention", tags=["Apps"])
+async def set_retention(app_id: str, policy: RetentionPolicyRequest, user: dict = Depends(get_current_user)):
+    """
+    Sets how many days of raw events the App keeps; older sessions are compacted and archived.
+    0 keeps raw events forever, null falls back to the server default.
+    """
+    return await AppService.set_retention(app_id, user["user_id"], policy)
+
 @app_router.get("/", tags=["Apps"])
 async def get_user_apps(user: dict = Depends(get_current_user)):
     """
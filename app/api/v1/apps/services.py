@@ -2,7 +2,7 @@ import secrets
 from datetime import datetime, timezone
 from fastapi import HTTPException
 from app.core.database import MongoDB
-from app.api.v1.apps.models import AppModel, AppCreateRequest
+from app.api.v1.apps.models import AppModel, AppCreateRequest, IngestQuotaRequest, RetentionPolicyRequest, SamplingPolicyRequest
 
 class AppService:
     @staticmethod
@@ -51,6 +51,58 @@ class AppService:
 
         return app
 
+    @staticmethod
+    async def set_ingest_quota(app_id: str, user_id: str, quota: IngestQuotaRequest):
+        """
+        Sets the app's ingest rate limit and burst; API processes pick it up on the next request.
+        """
+        db = MongoDB.get_db()
+        result = await db.apps.update_one(
+            {"app_id": app_id, "owner_id": user_id},
+            {"$set": quota.model_dump()},
+        )
+
+        if not result.matched_count:
+            raise HTTPException(status_code=404, detail="App not found or unauthorized")
+
+        return {"message": "Ingest quota updated", "app_id": app_id, **quota.model_dump()}
+
+    @staticmethod
+    async def set_sampling(app_id: str, user_id: str, policy: SamplingPolicyRequest):
+        """
+        Replaces the app's sampling rules; consumers pick them up within SAMPLING_RULES_TTL_SECONDS.
+        """
+        rules = {rule.event_type: rule.model_dump() for rule in policy.rules}
+        if len(rules) < len(policy.rules):
+            raise HTTPException(status_code=400, detail="Each event type may have only one sampling rule")
+
+        db = MongoDB.get_db()
+        result = await db.apps.update_one(
+            {"app_id": app_id, "owner_id": user_id},
+            {"$set": {"sampling_rules": list(rules.values())}},
+        )
+
+        if not result.matched_count:
+            raise HTTPException(status_code=404, detail="App not found or unauthorized")
+
+        return {"message": "Sampling rules updated", "app_id": app_id, "sampling_rules": list(rules.values())}
+
+    @staticmethod
+    async def set_retention(app_id: str, user_id: str, policy: RetentionPolicyRequest):
+        """
+        Sets how many days of raw events an app keeps before they are archived.
+        """
+        db = MongoDB.get_db()
+        result = await db.apps.update_one(
+            {"app_id": app_id, "owner_id": user_id},
+            {"$set": {"retention_days": policy.retention_days}},
+        )
+
+        if not result.matched_count:
+            raise HTTPException(status_code=404, detail="App not found or unauthorized")
+
+        return {"message": "Retention policy updated", "app_id": app_id, "retention_days": policy.retention_days}
+
     @staticmethod
     async def get_user_apps(user_id: str):
         """
@@ -1,5 +1,6 @@
+import functools
 import httpx
-from fastapi import HTTPException, Security, Depends
+from fastapi import HTTPException, Security, Depends, Request
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials, APIKeyHeader
 from clerk_backend_api import Clerk
 from clerk_backend_api.jwks_helpers import AuthenticateRequestOptions
@@ -9,13 +10,19 @@ from app.core.database import MongoDB
 from typing import Callable
 from app.api.v1.auth.services import sync_user
 from app.api.v1.auth.apikeys import APIKeyService
+from app.core.metrics import AUTH_LATENCY, timed
 
-# Initialize Clerk SDK
-clerk_sdk = Clerk(bearer_auth=settings.CLERK_SECRET_KEY)
+@functools.lru_cache(maxsize=1)
+def get_clerk() -> Clerk:
+    """
+    Returns the Clerk SDK client, created on first authentication.
+    """
+    return Clerk(bearer_auth=settings.CLERK_SECRET_KEY)
 
 # Security Token Scheme
 security = HTTPBearer()
 
+@timed(AUTH_LATENCY, "verify_token")
 def verify_token(credentials: HTTPAuthorizationCredentials = Security(security)):
     """
     Middleware to authenticate API requests using Clerk JWT.
@@ -26,7 +33,7 @@ def verify_token(credentials: HTTPAuthorizationCredentials = Security(security))
         request.headers["Authorization"] = f"Bearer {credentials.credentials}"
 
         # Authenticate request with Clerk
-        request_state = clerk_sdk.authenticate_request(
+        request_state = get_clerk().authenticate_request(
             request,
             AuthenticateRequestOptions(authorized_parties=['https://localhost:3000', 'https://127.0.0.1:3000'])  # Dev Mode
         )
@@ -87,7 +94,8 @@ def require_role(required_role: str) -> Callable:
 
 api_key_header = APIKeyHeader(name="X-API-KEY", auto_error=False)
 
-async def verify_api_key(api_key: str = Security(api_key_header)):
+@timed(AUTH_LATENCY, "verify_api_key")
+async def verify_api_key(request: Request, api_key: str = Security(api_key_header)):
     """
     Middleware to authenticate external services using API keys.
     """
@@ -95,4 +103,5 @@ async def verify_api_key(api_key: str = Security(api_key_header)):
         raise HTTPException(status_code=403, detail="API Key is missing")
 
     user_id = await APIKeyService.verify_api_key(api_key)
+    request.state.tenant = user_id
     return {"user_id": user_id}
\ No newline at end of file
@@ -0,0 +1,101 @@
+import asyncio
+from contextlib import asynccontextmanager
+from fastapi import HTTPException
+from app.core.config import settings
+from app.core.metrics import INGEST_REJECTED, Gauge
+from app.core.logger import get_logger
+
+logger = get_logger("admission")
+
+class IngestAdmission:
+    """
+    Admission control in front of EventQueue publishes.
+
+    Tracks in-flight publishes in this worker and the broker queue depth, and
+    sheds ingest load with 429/503 + Retry-After once the configured
+    watermarks are crossed, so the rest of the API stays responsive.
+    """
+    in_flight: int = 0
+    queue_depth: int = 0
+    rejected: int = 0
+    _monitor: asyncio.Task = None
+
+    @classmethod
+    def check(cls):
+        """
+        Cheap pre-check, run before the SDK key lookup so shed requests cost nothing.
+        """
+        if cls.queue_depth >= settings.INGEST_QUEUE_HIGH_WATERMARK:
+            cls.rejected += 1
+            INGEST_REJECTED.inc("backlog")
+            raise HTTPException(
+                status_code=503,
+                detail="Event pipeline is backlogged, retry later",
+                headers={"Retry-After": str(settings.INGEST_RETRY_AFTER_BACKLOG)},
+            )
+
+        if cls.in_flight >= settings.INGEST_MAX_IN_FLIGHT:
+            cls.rejected += 1
+            INGEST_REJECTED.inc("in_flight")
+            raise HTTPException(
+                status_code=429,
+                detail="Too many events in flight, retry later",
+                headers={"Retry-After": str(settings.INGEST_RETRY_AFTER_BUSY)},
+            )
+
+    @classmethod
+    @asynccontextmanager
+    async def admit(cls):
+        """
+        Tracks the publish as in flight while it runs. The watermarks are
+        checked once, up front, by the `ingest_admission` dependency.
+        """
+        cls.in_flight += 1
+        try:
+            yield
+        finally:
+            cls.in_flight -= 1
+
+    @classmethod
+    def start_monitor(cls, get_channel):
+        """
+        Starts polling the broker queue depth in the background.
+        """
+        if cls._monitor is None or cls._monitor.done():
+            cls._monitor = asyncio.create_task(cls._poll_queue_depth(get_channel))
+
+    @classmethod
+    async def stop_monitor(cls):
+        """
+        Stops the queue depth poller.
+        """
+        if cls._monitor is not None:
+            cls._monitor.cancel()
+            try:
+                await cls._monitor
+            except asyncio.CancelledError:
+                pass
+            cls._monitor = None
+
+    @classmethod
+    async def _poll_queue_depth(cls, get_channel):
+        while True:
+            try:
+                channel = await get_channel()
+                queue = await channel.declare_queue(settings.EVENT_QUEUE, passive=True, robust=False)
+                cls.queue_depth = queue.declaration_result.message_count
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # Keep the last known depth; a broker outage surfaces on publish
+                logger.warning("Failed to poll event queue depth: %s", e)
+            await asyncio.sleep(settings.INGEST_QUEUE_POLL_SECONDS)
+
+async def ingest_admission():
+    """
+    Dependency that sheds ingest requests before any other work is done.
+    """
+    IngestAdmission.check()
+
+Gauge("artello_ingest_in_flight", "Publishes currently in flight in this worker", lambda: IngestAdmission.in_flight)
+Gauge("artello_event_queue_depth", "Last polled broker queue depth", lambda: IngestAdmission.queue_depth)
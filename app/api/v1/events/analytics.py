@@ -1,13 +1,21 @@
-from fastapi import APIRouter, Depends
+from datetime import date, datetime
+from fastapi import APIRouter, Depends, Query
+from fastapi.responses import StreamingResponse
 from app.api.v1.auth.dependencies import verify_api_key
+from app.api.v1.apps.services import AppService
 from app.api.v1.events.queries import EventQueries
+from app.api.v1.events.export import gzip_ndjson, resume_cursor
+from app.api.v1.events.heavy_hitters import HeavyHitterQueries
+from app.api.v1.events.rates import RateQueries
+from app.api.v1.events.transitions import TransitionQueries
 
 analytics_router = APIRouter()
 
 @analytics_router.get("/flow/{session_id}", tags=["Analytics"])
 async def get_event_flow(session_id: str, app: dict = Depends(verify_api_key)):
     """
-    Retrieves the ordered event sequence for a session.
+    Retrieves the ordered event sequence for a session. An SDK session id
+    spans all its server sessions; `<id>#<n>` selects one of them.
     """
     return await EventQueries.get_event_flow(session_id)
 
@@ -24,3 +32,107 @@ async def get_event_counts(session_id: str, app: dict = Depends(verify_api_key))
     Retrieves the count of different event types in a session.
     """
     return await EventQueries.get_event_counts(session_id)
+
+@analytics_router.get("/apps/{app_id}/next/{event_type}", tags=["Analytics"])
+async def get_next_events(
+    app_id: str,
+    event_type: str,
+    start_date: date = None,
+    end_date: date = None,
+    limit: int = Query(10, ge=1, le=100),
+    app: dict = Depends(verify_api_key),
+):
+    """
+    Retrieves what users do right after an event type, from the transition matrix.
+    """
+    await AppService.get_app(app_id, app["user_id"])
+    return await TransitionQueries.get_next_events(app_id, event_type, start_date, end_date, limit)
+
+@analytics_router.get("/apps/{app_id}/paths", tags=["Analytics"])
+async def get_top_paths(
+    app_id: str,
+    length: int = Query(3, ge=2, le=10),
+    limit: int = Query(10, ge=1, le=100),
+    start_event: str = None,
+    start_date: date = None,
+    end_date: date = None,
+    app: dict = Depends(verify_api_key),
+):
+    """
+    Retrieves the most frequent event paths of a given length.
+    """
+    await AppService.get_app(app_id, app["user_id"])
+    return await TransitionQueries.get_top_paths(app_id, length, limit, start_event, start_date, end_date)
+
+@analytics_router.get("/apps/{app_id}/sankey", tags=["Analytics"])
+async def get_sankey(
+    app_id: str,
+    steps: int = Query(4, ge=2, le=10),
+    width: int = Query(8, ge=1, le=50),
+    start_event: str = None,
+    start_date: date = None,
+    end_date: date = None,
+    app: dict = Depends(verify_api_key),
+):
+    """
+    Retrieves Sankey nodes and links of event flows from session starts.
+    """
+    await AppService.get_app(app_id, app["user_id"])
+    return await TransitionQueries.get_sankey(app_id, steps, width, start_event, start_date, end_date)
+
+@analytics_router.get("/apps/{app_id}/top/{dimension}", tags=["Analytics"])
+async def get_top_values(
+    app_id: str,
+    dimension: str,
+    window: str = "day",
+    limit: int = Query(10, ge=1, le=100),
+    app: dict = Depends(verify_api_key),
+):
+    """
+    Retrieves the most frequent values of `event_type` or `payload.<field>`
+    over the last hour, day or week, from the consumers' streaming summaries.
+    """
+    await AppService.get_app(app_id, app["user_id"])
+    return await HeavyHitterQueries.get_top_values(app_id, dimension, window, limit)
+
+@analytics_router.get("/apps/{app_id}/rates", tags=["Analytics"])
+async def get_event_rates(
+    app_id: str,
+    event_type: str = None,
+    resolution: str = "minute",
+    window: int = Query(None, ge=1),
+    step: int = Query(None, ge=1),
+    app: dict = Depends(verify_api_key),
+):
+    """
+    Retrieves live event counts per second or minute (or per `step` seconds)
+    for the last `window` seconds (default: an hour, or the ring's span if
+    shorter), from in-memory ring buffers. A window longer than the
+    resolution's ring is rejected with 400.
+    """
+    await AppService.get_app(app_id, app["user_id"])
+    return await RateQueries.get_event_rates(app_id, event_type, resolution, window, step)
+
+@analytics_router.get("/apps/{app_id}/export", tags=["Analytics"])
+async def export_events(
+    app_id: str,
+    start: datetime = None,
+    end: datetime = None,
+    cursor: str = None,
+    after_timestamp: str = None,
+    after_event_id: str = None,
+    app: dict = Depends(verify_api_key),
+):
+    """
+    Streams the app's events in [start, end) as gzip-compressed NDJSON,
+    ordered by timestamp and event_id. To resume an interrupted export, pass
+    the `timestamp` and `event_id` of the last complete line received as
+    `after_timestamp` and `after_event_id` (or a cursor from the export CLI).
+    """
+    await AppService.get_app(app_id, app["user_id"])
+    cursor = resume_cursor(cursor, after_timestamp, after_event_id)
+    return StreamingResponse(
+        gzip_ndjson(app_id, start, end, cursor),
+        media_type="application/gzip",
+        headers={"Content-Disposition": f'attachment; filename="{app_id}-events.ndjson.gz"'},
+    )
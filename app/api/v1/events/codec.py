@@ -0,0 +1,243 @@
+"""
+Compact binary envelope for messages between EventQueue and the consumer.
+
+Layout (all integers big-endian):
+
+    header   magic "AE" | version u8 | flags u8 | count u16 | body length u32
+    body     `count` records, zlib-compressed when FLAG_ZLIB is set
+    record   field count u8, then per field: field id u8 | length | value
+
+Field ids are interned below so key names are never repeated on the wire.
+Lengths are u16, or u32 when the high bit of the field id is set, which lets
+a decoder skip field ids it does not know about.
+
+A record holds either the fields of a decoded event, or a `RawEvent`: the
+SDK request body exactly as the API received it, with the authenticated
+app_id, the event_id and the time the API received it. The ingest path only
+produces raw records, so bodies are still decoded once, in the consumer; in
+a batch, zlib removes the key names the raw bodies repeat.
+"""
+import json
+import struct
+import zlib
+from datetime import datetime, timedelta, timezone
+from typing import Iterable, List, NamedTuple, Optional, Union
+
+MAGIC = b"AE"
+VERSION = 1
+
+CONTENT_TYPE_JSON = "application/json"
+CONTENT_TYPE_BINARY = "application/vnd.artello.event+binary"
+
+FLAG_ZLIB = 0x01
+FLAG_BATCH = 0x02
+
+HEADER = struct.Struct(">2sBBHI")
+TIMESTAMP = struct.Struct(">qh")
+RECEIVED_AT = struct.Struct(">d")
+SHORT_FIELD = struct.Struct(">BH")
+LONG_FIELD = struct.Struct(">BI")
+WIDE = 0x80
+
+# Interned field ids. Never renumber; only append.
+FIELD_EVENT_ID = 1
+FIELD_SESSION_ID = 2
+FIELD_APP_ID = 3
+FIELD_EVENT_TYPE = 4
+FIELD_ACTION = 5
+FIELD_PAYLOAD = 6
+FIELD_TIMESTAMP = 7
+FIELD_BODY = 8
+FIELD_RECEIVED_AT = 9
+
+STRING_FIELDS = (
+    (FIELD_EVENT_ID, "event_id"),
+    (FIELD_SESSION_ID, "session_id"),
+    (FIELD_APP_ID, "app_id"),
+    (FIELD_EVENT_TYPE, "event_type"),
+    (FIELD_ACTION, "action"),
+)
+FIELD_NAMES = dict(STRING_FIELDS)
+
+# Offsets that cannot be expressed in minutes mark a naive timestamp
+NAIVE_OFFSET = -0x8000
+
+class CodecError(ValueError):
+    """
+    Raised when a queue message cannot be decoded.
+    """
+
+class RawEvent(NamedTuple):
+    """
+    An SDK request body as accepted by the API, not decoded yet.
+    """
+    body: bytes
+    app_id: Optional[str]
+    event_id: Optional[str]
+    received_at: Optional[float]
+
+def event_data_id(event: Union[dict, RawEvent]) -> Optional[str]:
+    """
+    The event_id of a record, without decoding a raw body.
+    """
+    return event.event_id if isinstance(event, RawEvent) else event.get("event_id")
+
+def event_data(event: Union[dict, RawEvent]) -> dict:
+    """
+    The fields of a decoded record, or of a raw body decoded here: the body
+    with the authenticated app_id and, when the SDK sent no timestamp, the
+    time the API received it.
+    """
+    if not isinstance(event, RawEvent):
+        return event
+    data = json.loads(event.body)
+    if event.app_id:
+        data["app_id"] = event.app_id
+    if event.received_at is not None and "timestamp" not in data:
+        data["timestamp"] = datetime.fromtimestamp(event.received_at).astimezone()
+    return data
+
+def _encode_timestamp(value: datetime) -> bytes:
+    offset = value.utcoffset()
+    if offset is None:
+        micros = (value - datetime(1970, 1, 1)) // timedelta(microseconds=1)
+        return TIMESTAMP.pack(micros, NAIVE_OFFSET)
+    micros = (value - datetime(1970, 1, 1, tzinfo=timezone.utc)) // timedelta(microseconds=1)
+    return TIMESTAMP.pack(micros, offset // timedelta(minutes=1))
+
+def _decode_timestamp(value: bytes) -> datetime:
+    micros, offset = TIMESTAMP.unpack(value)
+    if offset == NAIVE_OFFSET:
+        return datetime(1970, 1, 1) + timedelta(microseconds=micros)
+    utc = datetime(1970, 1, 1, tzinfo=timezone.utc) + timedelta(microseconds=micros)
+    return utc.astimezone(timezone(timedelta(minutes=offset)))
+
+def _field(out: list, field_id: int, value: bytes):
+    if len(value) > 0xFFFF:
+        out.append(LONG_FIELD.pack(field_id | WIDE, len(value)))
+    else:
+        out.append(SHORT_FIELD.pack(field_id, len(value)))
+    out.append(value)
+
+def _encode_record(event, out: list):
+    """
+    Appends one event (a RawEvent, an EventModel or a plain dict) to `out`.
+    """
+    fields = []
+    if isinstance(event, RawEvent):
+        for field_id, value in ((FIELD_APP_ID, event.app_id), (FIELD_EVENT_ID, event.event_id)):
+            if value is not None:
+                _field(fields, field_id, value.encode())
+        if event.received_at is not None:
+            _field(fields, FIELD_RECEIVED_AT, RECEIVED_AT.pack(event.received_at))
+        _field(fields, FIELD_BODY, event.body)
+        out.append(bytes((len(fields) // 2,)))
+        out.extend(fields)
+        return
+
+    data = event if isinstance(event, dict) else event.__dict__
+    for field_id, name in STRING_FIELDS:
+        value = data.get(name)
+        if value is not None:
+            _field(fields, field_id, value.encode())
+
+    _field(fields, FIELD_PAYLOAD, json.dumps(data.get("payload"), separators=(",", ":"), default=str).encode())
+
+    timestamp = data.get("timestamp")
+    if isinstance(timestamp, str):
+        timestamp = datetime.fromisoformat(timestamp)
+    if timestamp is not None:
+        _field(fields, FIELD_TIMESTAMP, _encode_timestamp(timestamp))
+
+    out.append(bytes((len(fields) // 2,)))
+    out.extend(fields)
+
+def encode(events: Iterable, compress: bool = False, compress_min_bytes: Optional[int] = None) -> bytes:
+    """
+    Encodes one or more events into a single binary message body. The body is
+    zlib-compressed when `compress` is set or it reaches `compress_min_bytes`.
+    """
+    records = []
+    count = 0
+    for event in events:
+        _encode_record(event, records)
+        count += 1
+
+    if count > 0xFFFF:
+        raise CodecError("Too many events for one message")
+
+    body = b"".join(records)
+    flags = FLAG_BATCH if count > 1 else 0
+    if compress or (compress_min_bytes is not None and len(body) >= compress_min_bytes):
+        body = zlib.compress(body, 6)
+        flags |= FLAG_ZLIB
+
+    return HEADER.pack(MAGIC, VERSION, flags, count, len(body)) + body
+
+def unpack(message: bytes) -> List[Union[dict, RawEvent]]:
+    """
+    The records of a binary message body: event dicts, or RawEvents whose
+    bodies are left for `event_data` to decode.
+    """
+    view = memoryview(message)
+    if len(view) < HEADER.size:
+        raise CodecError("Truncated header")
+
+    magic, version, flags, count, length = HEADER.unpack_from(view)
+    if magic != MAGIC:
+        raise CodecError("Bad magic")
+    if version != VERSION:
+        raise CodecError(f"Unsupported envelope version {version}")
+
+    body = view[HEADER.size:HEADER.size + length]
+    if len(body) != length:
+        raise CodecError("Truncated body")
+    if flags & FLAG_ZLIB:
+        try:
+            body = memoryview(zlib.decompress(body))
+        except zlib.error as e:
+            raise CodecError(f"Bad compressed body: {e}") from e
+
+    events = []
+    pos = 0
+    try:
+        for _ in range(count):
+            n_fields = body[pos]
+            pos += 1
+            event = {}
+            for _ in range(n_fields):
+                field_id = body[pos]
+                if field_id & WIDE:
+                    field_id, size = LONG_FIELD.unpack_from(body, pos)
+                    field_id &= ~WIDE
+                    pos += LONG_FIELD.size
+                else:
+                    field_id, size = SHORT_FIELD.unpack_from(body, pos)
+                    pos += SHORT_FIELD.size
+                value = body[pos:pos + size]
+                pos += size
+
+                if field_id == FIELD_PAYLOAD:
+                    event["payload"] = json.loads(bytes(value))
+                elif field_id == FIELD_TIMESTAMP:
+                    event["timestamp"] = _decode_timestamp(value)
+                elif field_id == FIELD_BODY:
+                    event["body"] = bytes(value)
+                elif field_id == FIELD_RECEIVED_AT:
+                    event["received_at"] = RECEIVED_AT.unpack(value)[0]
+                elif field_id in FIELD_NAMES:
+                    event[FIELD_NAMES[field_id]] = str(value, "utf-8")
+                # Unknown field ids are skipped for forward compatibility
+            if "body" in event:
+                event = RawEvent(event["body"], event.get("app_id"), event.get("event_id"), event.get("received_at"))
+            events.append(event)
+    except (IndexError, struct.error) as e:
+        raise CodecError(f"Corrupt record: {e}") from e
+
+    return events
+
+def decode(message: bytes) -> List[dict]:
+    """
+    Decodes a binary message body into event dicts ready for EventModel validation.
+    """
+    return [event_data(event) for event in unpack(message)]
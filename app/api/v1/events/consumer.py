@@ -1,97 +1,339 @@
+import asyncio
 import json
+import time
 import aio_pika
-from datetime import datetime, timezone
+from collections import defaultdict
+from neo4j.exceptions import ClientError, ConstraintError
 from app.core.database import Neo4jDB, MongoDB
+from typing import List, Union
 from app.api.v1.events.models import EventModel
+from app.api.v1.events import codec
+from app.api.v1.events.services import RECEIVED_AT_HEADER
+from app.api.v1.events.retry import declare_retry_topology, park_failed_message
+from app.api.v1.events.dedup import DedupWindow, DUPLICATE, SUSPECT
+from app.api.v1.events.session_tail import SessionTailCache
+from app.api.v1.events.sessionizer import Sessionizer, ServerSession
+from app.api.v1.events.rollups import Rollups
+from app.api.v1.events.sampling import Sampler
+from app.api.v1.events import heavy_hitters, rates, sketches, transitions  # register their aggregates with Rollups
 from app.core.config import settings
+from app.core.metrics import CONSUMER_BATCH, EVENTS_STORED, NEO4J_WRITE_LATENCY, QUEUE_LAG
+from app.core.logger import get_logger
 
-async def process_event():
+logger = get_logger("consumer")
+
+async def process_event(prefetch_count: int = None, stop: asyncio.Event = None):
     """
     Background worker to consume events from RabbitMQ and store them in Neo4j.
+
+    Deliveries are buffered and handled in batches; events of different
+    sessions in a batch are stored concurrently, events of the same session
+    in order. Setting `stop` cancels the consumer, finishes the batch in
+    flight and returns unprocessed prefetched messages to the queue.
     """
+    stop = stop or asyncio.Event()
     connection = await aio_pika.connect_robust(settings.RABBITMQ_URL)
     async with connection:
         channel = await connection.channel()
-        queue = await channel.declare_queue("event_queue", durable=True)
+        await channel.set_qos(prefetch_count=prefetch_count or settings.CONSUMER_PREFETCH)
+        queue = await channel.declare_queue(settings.EVENT_QUEUE, durable=True)
+        await declare_retry_topology(channel)
+        await ensure_graph_schema()
+        await Rollups.restore()
+
+        buffer = asyncio.Queue()
+        consumer_tag = await queue.consume(buffer.put)
+        stopping = asyncio.create_task(stop.wait())
+        maintenance = asyncio.create_task(SessionTailCache.run_maintenance())
+        rollups = asyncio.create_task(Rollups.run_flusher())
+        try:
+            while not stop.is_set():
+                receiving = asyncio.create_task(buffer.get())
+                await asyncio.wait({receiving, stopping}, return_when=asyncio.FIRST_COMPLETED)
+                if not receiving.done():
+                    receiving.cancel()
+                    break
 
-        async for message in queue:
-            async with message.process():
-                event_data = json.loads(message.body)
-                await store_event_in_neo4j(EventModel(**event_data))
+                batch = [receiving.result()]
+                while len(batch) < settings.CONSUMER_BATCH_SIZE and not buffer.empty():
+                    batch.append(buffer.get_nowait())
+                await process_batch(channel, batch)
+        finally:
+            stopping.cancel()
+            maintenance.cancel()
+            rollups.cancel()
+            await queue.cancel(consumer_tag)
+            while not buffer.empty():
+                await buffer.get_nowait().nack(requeue=True)
+            try:
+                await SessionTailCache.flush()
+            except Exception as e:
+                logger.warning("Could not flush LAST_EVENT pointers on shutdown: %r", e)
+            await Rollups.flush(final=True)
 
-async def store_event_in_neo4j(event: EventModel):
+async def process_batch(channel: aio_pika.abc.AbstractChannel, messages: List[aio_pika.abc.AbstractIncomingMessage]):
+    """
+    Stores a batch of messages, then acks each one. Failures are parked in
+    retry/dead-letter queues so the loop keeps flowing; only a failure to
+    park puts the message back. A message carrying several events (a binary
+    batch) parks only the events that failed, each as a message of its own,
+    so a retry does not store the others twice.
+    """
+    CONSUMER_BATCH.observe(len(messages))
+    now = time.time()
+    units = {}
+    failed = defaultdict(dict)
+    lanes = defaultdict(list)
+    for message in messages:
+        published_at = (message.headers or {}).get("x-published-at")
+        if published_at is not None:
+            QUEUE_LAG.observe(max(0.0, now - published_at))
+        try:
+            units[message.delivery_tag] = message_units(message)
+        except Exception as e:
+            failed[message.delivery_tag][None] = e
+            continue
+        for index, unit in enumerate(units[message.delivery_tag]):
+            try:
+                event = decode_event(unit)
+            except Exception as e:
+                failed[message.delivery_tag][index] = e
+                continue
+            lanes[event.session_id].append((message.delivery_tag, index, event))
+
+    async def run_lane(items):
+        for delivery_tag, index, event in items:
+            try:
+                await handle_event(event)
+            except Exception as e:
+                failed[delivery_tag][index] = e
+
+    await asyncio.gather(*(run_lane(items) for items in lanes.values()))
+
+    for message in messages:
+        errors = failed.get(message.delivery_tag)
+        try:
+            if errors and (None in errors or len(units[message.delivery_tag]) == 1):
+                await park_failed_message(channel, message, next(iter(errors.values())))
+            elif errors:
+                for index, error in errors.items():
+                    unit = units[message.delivery_tag][index]
+                    await park_failed_message(
+                        channel, message, error,
+                        body=codec.encode([unit]), message_id=codec.event_data_id(unit),
+                    )
+            await message.ack()
+        except Exception as e:
+            logger.warning("Could not settle message, requeueing: %r", e, extra={"app_id": message.app_id, "event_id": message.message_id})
+            await message.nack(requeue=True)
+
+def message_units(message: aio_pika.abc.AbstractIncomingMessage) -> List[Union[dict, codec.RawEvent]]:
+    """
+    The events a queued message carries, negotiating the format from its
+    content type. The JSON format carries one raw SDK body, with the
+    authenticated app in the AMQP `app_id` property and the time the API
+    received it in a header; the binary format carries a batch of them.
+    """
+    if message.content_type == codec.CONTENT_TYPE_BINARY:
+        return codec.unpack(message.body)
+    received_at = (message.headers or {}).get(RECEIVED_AT_HEADER)
+    return [codec.RawEvent(message.body, message.app_id, message.message_id, received_at)]
+
+def decode_event(unit: Union[dict, codec.RawEvent]) -> EventModel:
+    """
+    Decodes one event exactly once. Events sent without a timestamp get the
+    time the API received them, not the time they are consumed, which can be
+    much later after queue lag, spooling or retries.
+    """
+    return EventModel.model_validate(codec.event_data(unit))
+
+def decode_events(message: aio_pika.abc.AbstractIncomingMessage) -> List[EventModel]:
+    """
+    Decodes every event of a queued message.
+    """
+    return [decode_event(unit) for unit in message_units(message)]
+
+SCHEMA_QUERIES = [
+    # Backs the dedup window and the session tail cache's direct appends.
+    # Event ids are chosen by the SDK, so they are unique per app only.
+    "CREATE CONSTRAINT event_app_event_id_unique IF NOT EXISTS FOR (e:Event) REQUIRE (e.app_id, e.event_id) IS UNIQUE",
+    "DROP CONSTRAINT event_id_unique IF EXISTS",
+    "CREATE INDEX session_id_index IF NOT EXISTS FOR (s:Session) ON (s.session_id)",
+    # Backs the sessionizer's lookup of a client's latest server session
+    "CREATE INDEX session_client_id_index IF NOT EXISTS FOR (s:Session) ON (s.client_session_id)",
+    # Backs keyset pagination of an app's events in exports
+    "CREATE INDEX event_app_time_index IF NOT EXISTS FOR (e:Event) ON (e.app_id, e.timestamp)",
+]
+
+async def ensure_graph_schema():
+    """
+    Creates the constraints and indexes the write path relies on.
+    """
+    async with Neo4jDB.get_driver().session() as neo4j_session:
+        for query in SCHEMA_QUERIES:
+            try:
+                await (await neo4j_session.run(query)).consume()
+            except ClientError as e:
+                # e.g. existing duplicate events block the constraint; dedup still runs in memory
+                logger.warning("Could not apply schema `%s`: %s", query, e.message)
+
+async def event_exists(app_id: str, event_id: str) -> bool:
+    query = "MATCH (e:Event {app_id: $app_id, event_id: $event_id}) RETURN count(e) > 0 AS found"
+    async with Neo4jDB.get_driver().session() as neo4j_session:
+        record = await (await neo4j_session.run(query, app_id=app_id, event_id=event_id)).single()
+        return record["found"]
+
+async def handle_event(event: EventModel):
+    """
+    Drops retried SDK events already stored, then stores the rest in their
+    server session unless the app samples them out. Duplicates are acked
+    without a write and counted.
+    """
+    state = DedupWindow.check(event.app_id, event.event_id)
+    if state == DUPLICATE or (state == SUSPECT and await event_exists(event.app_id, event.event_id)):
+        DedupWindow.count_duplicate()
+        return
+
+    # Sampled-out events still extend the session, so they do not cause splits
+    server_session = await Sessionizer.assign(event.app_id, event.session_id, event.timestamp)
+    weight = await Sampler.weight(event.app_id, event.event_type, event.session_id)
+    if weight is None:
+        DedupWindow.remember(event.app_id, event.event_id)
+        return
+    event.session_id = server_session.session_id
+    try:
+        await store_event_in_neo4j(event, server_session, weight)
+    except ConstraintError:
+        DedupWindow.count_duplicate()
+    DedupWindow.remember(event.app_id, event.event_id)
+
+# Both write queries first take the session node's write lock (SET then REMOVE
+# a dummy property), so concurrent writers of a session run their
+# "tail has no NEXT" check and the CREATE one after another instead of both
+# extending the same tail.
+
+# Appends to a cached session tail; returns no row if the tail was already extended
+APPEND_EVENT_QUERY = """
+MATCH (s:Session {session_id: $session_id})
+SET s._lock = true
+REMOVE s._lock
+WITH s
+MATCH (last_event:Event {app_id: $app_id, event_id: $prev_event_id})
+WHERE NOT (last_event)-[:NEXT]->()
+CREATE (new_event:Event {
+    event_id: $event_id,
+    app_id: $app_id,
+    session_id: $session_id,
+    event_type: $event_type,
+    timestamp: $timestamp,
+    payload: $payload,
+    weight: $weight
+})
+CREATE (last_event)-[:NEXT]->(new_event)
+RETURN new_event.event_id AS event_id, last_event.event_type AS prev_type
+"""
+
+# Full path for cache misses. The tail is found by following NEXT from
+# LAST_EVENT, because LAST_EVENT may lag behind cached appends.
+STORE_EVENT_QUERY = """
+MERGE (s:Session {session_id: $session_id})
+ON CREATE SET s.app_id = $app_id, s.client_session_id = $client_session_id, s.segment = $segment
+SET s._lock = true
+REMOVE s._lock
+
+WITH s
+OPTIONAL MATCH (s)-[:LAST_EVENT]->(pointer:Event)
+OPTIONAL MATCH (pointer)-[:NEXT*0..]->(last_event:Event)
+WHERE NOT (last_event)-[:NEXT]->()
+
+CREATE (new_event:Event {
+    event_id: $event_id,
+    app_id: $app_id,
+    session_id: $session_id,
+    event_type: $event_type,
+    timestamp: $timestamp,
+    payload: $payload,
+    weight: $weight
+})
+
+FOREACH (_ IN CASE WHEN last_event IS NULL THEN [1] ELSE [] END |
+    CREATE (s)-[:HAS_EVENT]->(new_event)
+)
+
+FOREACH (_ IN CASE WHEN last_event IS NOT NULL THEN [1] ELSE [] END |
+    CREATE (last_event)-[:NEXT]->(new_event)
+)
+
+WITH s, new_event, last_event
+OPTIONAL MATCH (s)-[old_last_event:LAST_EVENT]->(prev_event:Event)
+DELETE old_last_event
+MERGE (s)-[:LAST_EVENT]->(new_event)
+RETURN last_event.event_type AS prev_type
+"""
+
+async def store_event_in_neo4j(event: EventModel, server_session: ServerSession = None, weight: float = 1.0):
     """
     Stores an event in Neo4j and links it sequentially in the session's event chain.
+    A sampled event stores its `weight`; unsampled ones leave it unset.
     """
-    neo4j_driver = Neo4jDB.driver
-    mongo_db = MongoDB.get_db()
+    server_session = server_session or ServerSession(event.session_id, event.session_id, 0)
+    neo4j_driver = Neo4jDB.get_driver()
 
     session_id = event.session_id
     app_id = event.app_id
     event_id = event.event_id
-    event_type = event.event_type
-    timestamp = event.timestamp.isoformat()
-    payload = event.payload
+    params = {
+        "event_id": event_id,
+        "app_id": app_id,
+        "session_id": session_id,
+        "event_type": event.event_type,
+        "timestamp": event.timestamp.isoformat(),
+        "payload": json.dumps(event.payload, default=str),
+        "weight": weight if weight != 1 else None,
+    }
+
+    # Fast path: the session and its tail are known, append directly
+    prev_event_id = SessionTailCache.get(session_id)
+    if prev_event_id is not None:
+        with NEO4J_WRITE_LATENCY.time("append"):
+            async with neo4j_driver.session() as neo4j_session:
+                result = await neo4j_session.run(APPEND_EVENT_QUERY, prev_event_id=prev_event_id, **params)
+                record = await result.single()
+        if record is not None:
+            SessionTailCache.put(session_id, event_id, dirty=True)
+            Rollups.observe(event, record["prev_type"], weight=weight)
+            EVENTS_STORED.inc()
+            return
+        SessionTailCache.discard(session_id)
 
     # Ensure session exists in MongoDB (for referencing in APIs)
+    mongo_db = MongoDB.get_db()
     session = await mongo_db.sessions.find_one({"session_id": session_id})
     if not session:
-        await mongo_db.sessions.insert_one({"session_id": session_id, "app_id": app_id})
-
-    # Convert datetime objects in payload to strings
-    def serialize_payload(data):
-        if isinstance(data, dict):
-            return {k: serialize_payload(v) for k, v in data.items()}
-        elif isinstance(data, list):
-            return [serialize_payload(i) for i in data]
-        elif isinstance(data, datetime):
-            return data.isoformat()
-        return data
-
-    serialized_payload = serialize_payload(payload)
+        await mongo_db.sessions.insert_one({
+            "session_id": session_id,
+            "app_id": app_id,
+            "client_session_id": server_session.client_session_id,
+            "segment": server_session.segment,
+        })
 
     # Store event in Neo4j and braid it in session flow
-    query = """
-    MERGE (s:Session {session_id: $session_id})
-    ON CREATE SET s.app_id = $app_id
-
-    WITH s
-    OPTIONAL MATCH (s)-[:LAST_EVENT]->(last_event:Event)
-
-    CREATE (new_event:Event {
-        event_id: $event_id,
-        event_type: $event_type,
-        timestamp: $timestamp,
-        payload: $payload
-    })
-
-    FOREACH (_ IN CASE WHEN last_event IS NULL THEN [1] ELSE [] END |
-        CREATE (s)-[:HAS_EVENT]->(new_event)
-    )
-
-    FOREACH (_ IN CASE WHEN last_event IS NOT NULL THEN [1] ELSE [] END |
-        CREATE (last_event)-[:NEXT]->(new_event)
-    )
-
-    WITH s, new_event
-    OPTIONAL MATCH (s)-[old_last_event:LAST_EVENT]->(prev_event:Event)
-    DELETE old_last_event
-    MERGE (s)-[:LAST_EVENT]->(new_event)
-    """
-
-    async with neo4j_driver.session() as neo4j_session:
-        result = await neo4j_session.run(
-            query,
-            session_id=session_id,
-            app_id=app_id,
-            event_id=event_id,
-            event_type=event_type,
-            timestamp=timestamp,
-            payload=json.dumps(serialized_payload),
-        )
-
-        summary = await result.consume()
+    log_fields = {"app_id": app_id, "session_id": session_id, "event_id": event_id}
+    with NEO4J_WRITE_LATENCY.time("full"):
+        async with neo4j_driver.session() as neo4j_session:
+            result = await neo4j_session.run(
+                STORE_EVENT_QUERY,
+                client_session_id=server_session.client_session_id,
+                segment=server_session.segment,
+                **params,
+            )
+            record = await result.single()
+            summary = await result.consume()
+
         if summary.counters.nodes_created > 0:
-            print(f"Event {event_id} successfully stored and linked in Neo4j.")
+            SessionTailCache.put(session_id, event_id)
+            Rollups.observe(event, record["prev_type"] if record else None, weight=weight)
+            EVENTS_STORED.inc()
+            logger.debug("Event stored and linked in Neo4j", extra=log_fields)
         else:
-            print(f"Failed to store event {event_id} in Neo4j.")
+            logger.warning("Failed to store event in Neo4j", extra=log_fields)
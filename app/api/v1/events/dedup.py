@@ -0,0 +1,109 @@
+"""
+Bounded, per-app window of recently stored event_ids.
+
+An exact LRU answers "definitely stored" for the most recent ids. A rotating
+Bloom filter covers a much longer window in a few bits per id: a negative
+answer means the event is new and needs no lookup at all, while a positive
+answer outside the LRU is confirmed against the graph before the event is
+dropped. The `(Event.app_id, Event.event_id)` uniqueness constraint is the
+final backstop for races between workers.
+"""
+from collections import OrderedDict
+from app.core.config import settings
+from app.core.metrics import EVENTS_DEDUPLICATED
+
+NEW = 0
+DUPLICATE = 1
+SUSPECT = 2
+
+class BloomFilter:
+    """
+    Fixed-size Bloom filter using double hashing over Python's string hash.
+    Hashes are salted per process, so filters are never persisted.
+    """
+    __slots__ = ("bits", "size", "hashes", "count")
+
+    def __init__(self, capacity: int, hashes: int = 7):
+        # ~9.6 bits per item gives ~1% false positives at capacity with k=7
+        self.size = max(64, int(capacity * 9.6))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.hashes = hashes
+        self.count = 0
+
+    def _positions(self, key: str):
+        h = hash(key) & 0xFFFFFFFFFFFFFFFF
+        h1, h2 = h & 0xFFFFFFFF, (h >> 32) | 1
+        size = self.size
+        return [(h1 + i * h2) % size for i in range(self.hashes)]
+
+    def add(self, key: str):
+        bits = self.bits
+        for pos in self._positions(key):
+            bits[pos >> 3] |= 1 << (pos & 7)
+        self.count += 1
+
+    def __contains__(self, key: str) -> bool:
+        bits = self.bits
+        for pos in self._positions(key):
+            if not bits[pos >> 3] & (1 << (pos & 7)):
+                return False
+        return True
+
+class AppWindow:
+    __slots__ = ("recent", "current", "previous")
+
+    def __init__(self):
+        self.recent = OrderedDict()
+        self.current = BloomFilter(settings.DEDUP_BLOOM_CAPACITY)
+        self.previous = None
+
+    def check(self, event_id: str) -> int:
+        if event_id in self.recent:
+            self.recent.move_to_end(event_id)
+            return DUPLICATE
+        if event_id in self.current or (self.previous is not None and event_id in self.previous):
+            return SUSPECT
+        return NEW
+
+    def add(self, event_id: str):
+        self.recent[event_id] = None
+        if len(self.recent) > settings.DEDUP_LRU_SIZE:
+            self.recent.popitem(last=False)
+
+        # Rotate generations so the filter never saturates
+        if self.current.count >= settings.DEDUP_BLOOM_CAPACITY:
+            self.previous = self.current
+            self.current = BloomFilter(settings.DEDUP_BLOOM_CAPACITY)
+        self.current.add(event_id)
+
+class DedupWindow:
+    apps: OrderedDict = OrderedDict()
+
+    @classmethod
+    def _window(cls, app_id: str) -> AppWindow:
+        window = cls.apps.get(app_id)
+        if window is None:
+            window = cls.apps[app_id] = AppWindow()
+            if len(cls.apps) > settings.DEDUP_MAX_APPS:
+                cls.apps.popitem(last=False)
+        else:
+            cls.apps.move_to_end(app_id)
+        return window
+
+    @classmethod
+    def check(cls, app_id: str, event_id: str) -> int:
+        """
+        Returns NEW, DUPLICATE, or SUSPECT (seen by the filter, must be confirmed).
+        """
+        return cls._window(app_id).check(event_id)
+
+    @classmethod
+    def remember(cls, app_id: str, event_id: str):
+        """
+        Records an event_id once it is known to be stored.
+        """
+        cls._window(app_id).add(event_id)
+
+    @classmethod
+    def count_duplicate(cls):
+        EVENTS_DEDUPLICATED.inc()
@@ -0,0 +1,153 @@
+"""
+Bulk export of an app's raw events as NDJSON.
+
+Events are read in pages of `EXPORT_PAGE_SIZE` ordered by
+`(timestamp, event_id)`, each page resuming strictly after the previous one
+(keyset pagination on the `event_app_time_index`), so memory use does not
+depend on the size of the export and any page boundary is a valid resume
+point. A cursor is the urlsafe base64 of the JSON `[timestamp, event_id]` of
+the last exported event; HTTP clients, which receive lines rather than pages,
+resume after the `timestamp` and `event_id` of their last complete line.
+
+Lines have the shape the ingest API and `app.cli.backfill` accept:
+
+    {"event_id": ..., "session_id": ..., "app_id": ..., "event_type": ..., "timestamp": ..., "payload": {...}}
+
+Sampled events (see `sampling`) add their `"weight"` before the payload.
+
+Pages are read through `query_limits.read()` in the `export` class, so each
+page runs with its own transaction timeout and concurrent exports share a
+small number of connections.
+
+Time bounds compare against the stored ISO timestamps, so they are exact
+for events sent in UTC, as the SDK does. Only events stored with their
+`app_id` are exported; `tag_legacy_events` adds it to older ones.
+"""
+import base64
+import binascii
+import json
+import zlib
+from datetime import datetime, timezone
+from typing import AsyncIterator, Optional, Tuple
+from fastapi import HTTPException
+from app.core.config import settings
+from app.core.database import Neo4jDB
+from app.api.v1.events.query_limits import EXPORT, read
+
+EXPORT_PAGE_QUERY = """
+MATCH (e:Event)
+WHERE e.app_id = $app_id AND e.timestamp >= $start AND e.timestamp < $end
+  AND (e.timestamp > $after_timestamp OR (e.timestamp = $after_timestamp AND e.event_id > $after_event_id))
+RETURN e.event_id AS event_id, e.session_id AS session_id, e.event_type AS event_type,
+       e.timestamp AS timestamp, e.payload AS payload, e.weight AS weight
+ORDER BY e.timestamp, e.event_id
+LIMIT $limit
+"""
+
+# Copies app and session ids onto events stored before events carried them
+TAG_LEGACY_EVENTS_QUERY = """
+MATCH (s:Session)-[:HAS_EVENT]->(:Event)-[:NEXT*0..]->(e:Event)
+WHERE e.app_id IS NULL AND s.app_id IS NOT NULL
+CALL {
+    WITH s, e
+    SET e.app_id = s.app_id, e.session_id = s.session_id
+} IN TRANSACTIONS OF $batch_size ROWS
+"""
+
+# Sorts after every ISO timestamp, so an open end includes all events
+OPEN_END = "\uffff"
+
+def encode_cursor(timestamp: str, event_id: str) -> str:
+    return base64.urlsafe_b64encode(json.dumps([timestamp, event_id]).encode()).decode()
+
+def resume_cursor(cursor: Optional[str], after_timestamp: Optional[str], after_event_id: Optional[str]) -> Optional[str]:
+    """
+    The cursor resuming after an exported line, given either as a cursor or
+    as the line's `timestamp` and `event_id`.
+    """
+    if after_timestamp is None and after_event_id is None:
+        decode_cursor(cursor)
+        return cursor
+    if cursor or after_timestamp is None or after_event_id is None:
+        raise HTTPException(status_code=400, detail="Resume with a cursor or with both after_timestamp and after_event_id.")
+    return encode_cursor(after_timestamp, after_event_id)
+
+def decode_cursor(cursor: Optional[str]) -> Tuple[str, str]:
+    """
+    The `(timestamp, event_id)` a cursor resumes after; ("", "") for the start.
+    """
+    if not cursor:
+        return "", ""
+    try:
+        timestamp, event_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return str(timestamp), str(event_id)
+    except (ValueError, TypeError, binascii.Error):
+        raise HTTPException(status_code=400, detail="Invalid export cursor.")
+
+def time_bound(value: Optional[datetime], default: str) -> str:
+    if value is None:
+        return default
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc)
+    return value.isoformat()
+
+def to_line(record: dict, app_id: str) -> str:
+    payload = record["payload"]
+    # Stored as JSON text; spliced in rather than decoded and re-encoded.
+    # Events stored without one export `{}`, which the ingest API requires.
+    if payload is None:
+        payload = "{}"
+    elif not isinstance(payload, str):
+        payload = json.dumps(payload, default=str)
+    weight = record.get("weight")
+    weight = f'"weight":{json.dumps(weight)},' if weight is not None else ""
+    return (
+        f'{{"event_id":{json.dumps(record["event_id"])},"session_id":{json.dumps(record["session_id"])},'
+        f'"app_id":{json.dumps(app_id)},"event_type":{json.dumps(record["event_type"])},'
+        f'"timestamp":{json.dumps(record["timestamp"])},{weight}"payload":{payload or "{}"}}}\n'
+    )
+
+async def export_pages(app_id: str, start: datetime = None, end: datetime = None,
+                       cursor: str = None) -> AsyncIterator[Tuple[str, str]]:
+    """
+    Yields `(ndjson text, cursor after it)` per page of the app's events in `[start, end)`.
+    """
+    after_timestamp, after_event_id = decode_cursor(cursor)
+    params = {
+        "app_id": app_id,
+        "start": time_bound(start, ""),
+        "end": time_bound(end, OPEN_END),
+        "limit": settings.EXPORT_PAGE_SIZE,
+    }
+    while True:
+        records = await read(
+            EXPORT, EXPORT_PAGE_QUERY, after_timestamp=after_timestamp, after_event_id=after_event_id, **params
+        )
+        if not records:
+            return
+        after_timestamp, after_event_id = records[-1]["timestamp"], records[-1]["event_id"]
+        yield "".join(to_line(record, app_id) for record in records), encode_cursor(after_timestamp, after_event_id)
+        if len(records) < settings.EXPORT_PAGE_SIZE:
+            return
+
+async def gzip_ndjson(app_id: str, start: datetime = None, end: datetime = None,
+                      cursor: str = None) -> AsyncIterator[bytes]:
+    """
+    The export as one gzip stream. Every page ends with a sync flush, so a
+    client that loses the connection can decompress what it received and
+    resume after the `timestamp` and `event_id` of its last complete line.
+    """
+    compressor = zlib.compressobj(settings.EXPORT_COMPRESS_LEVEL, zlib.DEFLATED, 31)
+    async for text, _ in export_pages(app_id, start, end, cursor):
+        yield compressor.compress(text.encode()) + compressor.flush(zlib.Z_SYNC_FLUSH)
+    yield compressor.flush()
+
+async def tag_legacy_events(batch_size: int = 10_000) -> int:
+    """
+    Adds `app_id` and `session_id` to events stored without them, in batches.
+    Returns the number of properties set.
+    """
+    async with Neo4jDB.get_driver().session() as neo4j_session:
+        result = await neo4j_session.run(TAG_LEGACY_EVENTS_QUERY, batch_size=batch_size)
+        summary = await result.consume()
+    return summary.counters.properties_set
@@ -0,0 +1,298 @@
+"""
+Streaming top-k of event types and payload fields over sliding windows.
+
+Every consumer process tracks, per app and dimension (`event_type` and
+`payload.<field>` for each of `HEAVY_HITTER_FIELDS`), Space-Saving summaries
+of `HEAVY_HITTER_CAPACITY` entries in time buckets of three granularities:
+
+    hour   12 buckets of 5 minutes
+    day    24 buckets of 1 hour
+    week    7 buckets of 1 day
+
+A window is the merge of its buckets. Space-Saving never misses a value
+whose count exceeds total/capacity, and reports each count with an upper
+bound on its overestimate (`error`). Memory is bounded by the capacity, the
+bucket counts and `HEAVY_HITTER_MAX_APPS` (least recently seen apps are
+dropped).
+
+Each process snapshots its changed trackers to Mongo under its
+`WORKER_ID` every `HEAVY_HITTER_SNAPSHOT_SECONDS` and on shutdown. Worker
+ids must be unique per process: the default `<hostname>-<pid>` is, and a
+restarted process starts empty while readers keep merging the snapshots
+its predecessor left. A configured, stable `WORKER_ID` is restored on
+startup instead, so the restart keeps its windows. Snapshots not updated
+for the longest window are deleted on startup. Readers merge the snapshots
+of all workers and cache the result for `HEAVY_HITTER_CACHE_SECONDS`.
+"""
+import heapq
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+from fastapi import HTTPException
+from pymongo import ReplaceOne
+from app.core.config import settings
+from app.core.database import MongoDB
+from app.core.metrics import QUERY_LATENCY, timed
+from app.api.v1.events.rollups import Rollups
+
+EVENT_TYPE = "event_type"
+
+# window -> (bucket width in seconds, buckets kept)
+WINDOWS = {
+    "hour": (300, 12),
+    "day": (3600, 24),
+    "week": (86400, 7),
+}
+
+class SpaceSaving:
+    """
+    Space-Saving summary. A lazy min-heap with one entry per tracked value
+    finds the eviction victim; entries made stale by increments are
+    refreshed when they surface.
+    """
+    __slots__ = ("capacity", "counts", "errors", "heap")
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.counts = {}
+        self.errors = {}
+        self.heap = []
+
+    def add(self, value: str, amount: float = 1):
+        counts = self.counts
+        if value in counts:
+            counts[value] += amount
+            return
+        if len(counts) < self.capacity:
+            counts[value] = amount
+            self.errors[value] = 0
+            heapq.heappush(self.heap, (amount, value))
+            return
+
+        heap = self.heap
+        while True:
+            count, victim = heapq.heappop(heap)
+            current = counts[victim]
+            if current == count:
+                break
+            heapq.heappush(heap, (current, victim))
+        del counts[victim]
+        del self.errors[victim]
+        counts[value] = count + amount
+        self.errors[value] = count
+        heapq.heappush(heap, (count + amount, value))
+
+    def top(self, limit: int) -> list:
+        return heapq.nlargest(limit, self.counts.items(), key=lambda item: item[1])
+
+    def dump(self) -> list:
+        return [[value, count, self.errors[value]] for value, count in self.counts.items()]
+
+    @classmethod
+    def load(cls, capacity: int, entries: list) -> "SpaceSaving":
+        summary = cls(capacity)
+        for value, count, error in entries:
+            summary.counts[value] = count
+            summary.errors[value] = error
+        summary.heap = [(count, value) for value, count in summary.counts.items()]
+        heapq.heapify(summary.heap)
+        return summary
+
+    @classmethod
+    def merge(cls, capacity: int, summaries) -> "SpaceSaving":
+        """
+        Sums the summaries. A full summary may have evicted a value it does
+        not hold after counting it up to its minimum, so that minimum is added
+        to the count and error of such values: counts stay upper bounds.
+        """
+        summaries = list(summaries)
+        counts, errors = {}, {}
+        for summary in summaries:
+            for value, count in summary.counts.items():
+                counts[value] = counts.get(value, 0) + count
+                errors[value] = errors.get(value, 0) + summary.errors[value]
+        for summary in summaries:
+            if len(summary.counts) < summary.capacity:
+                continue
+            floor = min(summary.counts.values())
+            for value in counts:
+                if value not in summary.counts:
+                    counts[value] += floor
+                    errors[value] += floor
+        kept = heapq.nlargest(capacity, counts.items(), key=lambda item: item[1])
+        return cls.load(capacity, [[value, count, errors[value]] for value, count in kept])
+
+class Tracker:
+    """
+    Bucketed summaries of one app and dimension, for every window.
+    """
+    __slots__ = ("buckets",)
+
+    def __init__(self):
+        # window -> {bucket start (epoch seconds): SpaceSaving}
+        self.buckets = {window: {} for window in WINDOWS}
+
+    def add(self, value: str, at: float, amount: float = 1):
+        now = time.time()
+        for window, (width, kept) in WINDOWS.items():
+            start = int(at // width * width)
+            if start <= now - width * kept:
+                continue
+            buckets = self.buckets[window]
+            summary = buckets.get(start)
+            if summary is None:
+                summary = buckets[start] = SpaceSaving(settings.HEAVY_HITTER_CAPACITY)
+                # Drop buckets that slid out of the window
+                oldest = now - width * kept
+                for expired in [s for s in buckets if s <= oldest]:
+                    del buckets[expired]
+            summary.add(value, amount)
+
+    def dump(self) -> dict:
+        return {
+            window: [[start, summary.dump()] for start, summary in buckets.items()]
+            for window, buckets in self.buckets.items()
+        }
+
+    @classmethod
+    def load(cls, data: dict) -> "Tracker":
+        tracker = cls()
+        for window, buckets in data.items():
+            if window in WINDOWS:
+                tracker.buckets[window] = {
+                    start: SpaceSaving.load(settings.HEAVY_HITTER_CAPACITY, entries) for start, entries in buckets
+                }
+        return tracker
+
+def dimensions_of(event) -> list:
+    """
+    The (dimension, value) pairs an event contributes to.
+    """
+    pairs = [(EVENT_TYPE, event.event_type)]
+    payload = event.payload
+    for field in settings.HEAVY_HITTER_FIELDS:
+        value = payload.get(field)
+        if isinstance(value, (str, int, float, bool)):
+            pairs.append((f"payload.{field}", str(value)[:200]))
+    return pairs
+
+@Rollups.register
+class HeavyHitters:
+    live_only = True
+    # app_id -> {dimension: Tracker}, least recently seen app first
+    apps: OrderedDict = OrderedDict()
+    dirty: set = set()
+    _snapshot_at: float = 0.0
+
+    @classmethod
+    def observe(cls, event, prev_type: Optional[str], weight: float = 1.0):
+        trackers = cls.apps.get(event.app_id)
+        if trackers is None:
+            trackers = cls.apps[event.app_id] = {}
+            if len(cls.apps) > settings.HEAVY_HITTER_MAX_APPS:
+                evicted, _ = cls.apps.popitem(last=False)
+                cls.dirty.discard(evicted)
+        else:
+            cls.apps.move_to_end(event.app_id)
+
+        at = event.timestamp.timestamp()
+        for dimension, value in dimensions_of(event):
+            tracker = trackers.get(dimension)
+            if tracker is None:
+                tracker = trackers[dimension] = Tracker()
+            tracker.add(value, at, weight)
+        cls.dirty.add(event.app_id)
+
+    @classmethod
+    async def flush(cls, final: bool = False):
+        """
+        Snapshots the trackers of apps that changed since the last snapshot,
+        at most every HEAVY_HITTER_SNAPSHOT_SECONDS unless `final`.
+        """
+        if not cls.dirty:
+            return
+        if not final and time.monotonic() - cls._snapshot_at < settings.HEAVY_HITTER_SNAPSHOT_SECONDS:
+            return
+        cls._snapshot_at = time.monotonic()
+        dirty, cls.dirty = cls.dirty, set()
+        now = datetime.now(timezone.utc)
+        operations = []
+        for app_id in dirty:
+            for dimension, tracker in cls.apps.get(app_id, {}).items():
+                key = {"worker_id": settings.WORKER_ID, "app_id": app_id, "dimension": dimension}
+                operations.append(ReplaceOne(key, {**key, "windows": tracker.dump(), "updated_at": now}, upsert=True))
+        try:
+            if operations:
+                await MongoDB.get_db().heavy_hitter_snapshots.bulk_write(operations, ordered=False)
+        except Exception:
+            cls.dirty |= dirty
+            raise
+
+    @classmethod
+    async def restore(cls):
+        """
+        Deletes snapshots older than the longest window and reloads this
+        worker's snapshots after a restart.
+        """
+        snapshots = MongoDB.get_db().heavy_hitter_snapshots
+        horizon = max(width * kept for width, kept in WINDOWS.values())
+        await snapshots.delete_many({"updated_at": {"$lt": datetime.now(timezone.utc) - timedelta(seconds=horizon)}})
+        cursor = snapshots.find({"worker_id": settings.WORKER_ID})
+        for doc in await cursor.to_list(None):
+            trackers = cls.apps.setdefault(doc["app_id"], {})
+            trackers[doc["dimension"]] = Tracker.load(doc["windows"])
+        while len(cls.apps) > settings.HEAVY_HITTER_MAX_APPS:
+            cls.apps.popitem(last=False)
+
+class HeavyHitterQueries:
+    # (app_id, dimension, window) -> (loaded at, merged SpaceSaving)
+    _cache: dict = {}
+
+    @classmethod
+    async def _window(cls, app_id: Optional[str], dimension: str, window: str) -> SpaceSaving:
+        key = (app_id, dimension, window)
+        cached = cls._cache.get(key)
+        if cached is not None and time.monotonic() - cached[0] < settings.HEAVY_HITTER_CACHE_SECONDS:
+            return cached[1]
+
+        query = {"dimension": dimension}
+        if app_id:
+            query["app_id"] = app_id
+        width, kept = WINDOWS[window]
+        oldest = time.time() - width * kept
+        cursor = MongoDB.get_db().heavy_hitter_snapshots.find(query, {f"windows.{window}": 1})
+
+        summaries = []
+        for doc in await cursor.to_list(None):
+            for start, entries in doc.get("windows", {}).get(window, []):
+                if start > oldest:
+                    summaries.append(SpaceSaving.load(settings.HEAVY_HITTER_CAPACITY, entries))
+        merged = SpaceSaving.merge(settings.HEAVY_HITTER_CAPACITY, summaries)
+
+        if len(cls._cache) >= 1024:
+            cls._cache.clear()
+        cls._cache[key] = (time.monotonic(), merged)
+        return merged
+
+    @classmethod
+    @timed(QUERY_LATENCY, "get_top_values")
+    async def get_top_values(cls, app_id: Optional[str], dimension: str = EVENT_TYPE, window: str = "day", limit: int = 10):
+        """
+        The most frequent values of a dimension in a sliding window.
+        `error` bounds how much each count may be overestimated.
+        """
+        if window not in WINDOWS:
+            raise HTTPException(status_code=400, detail=f"window must be one of {', '.join(WINDOWS)}")
+        summary = await cls._window(app_id, dimension, window)
+        top = summary.top(limit)
+        if not top:
+            raise HTTPException(status_code=404, detail="No event data found.")
+        return {
+            "dimension": dimension,
+            "window": window,
+            "top": [
+                {"value": value, "count": round(count), "error": round(summary.errors[value])}
+                for value, count in top
+            ],
+        }
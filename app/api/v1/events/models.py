@@ -9,4 +9,4 @@ class EventModel(BaseModel):
     event_type: str = Field(..., title="Event Type")
     action: Optional[str] = Field(None, title="Action Type")  # Button Click, Navigation, etc.
     payload: Dict = Field(..., title="Event Payload")
-    timestamp: datetime = Field(default_factory=datetime.astimezone, title="Event Timestamp")
+    timestamp: datetime = Field(default_factory=lambda: datetime.now().astimezone(), title="Event Timestamp")
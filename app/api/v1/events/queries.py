@@ -1,85 +1,99 @@
+from datetime import datetime, timedelta, timezone
 from fastapi import HTTPException
-from app.core.database import Neo4jDB
+from app.api.v1.events.query_limits import AGGREGATE, CUSTOM, LOOKUP, read
+from app.api.v1.events.sketches import ALL_TYPES, RELATIVE_ERROR, count_sessions
+from app.api.v1.events.heavy_hitters import EVENT_TYPE, WINDOWS, HeavyHitterQueries
+from app.core.metrics import QUERY_LATENCY, timed
+
+# The sessions a per-session query covers: every server session of an SDK
+# session id, or just the one named by a `<client id>#<n>` id
+SESSIONS_OF = """
+CALL {
+    MATCH (s:Session {client_session_id: $session_id}) RETURN s
+    UNION
+    MATCH (s:Session {session_id: $session_id}) RETURN s
+}
+WITH s
+"""
 
 class EventQueries:
     @staticmethod
+    @timed(QUERY_LATENCY, "get_event_flow")
     async def get_event_flow(session_id: str):
         """
-        Retrieve the full event sequence for a session in correct order.
+        Retrieve the full event sequence for a session in correct order,
+        across all its server sessions when given an SDK session id.
         """
-        query = """
-        MATCH (s:Session {session_id: $session_id})-[:HAS_EVENT]->(first_event:Event)
+        query = SESSIONS_OF + """
+        MATCH (s)-[:HAS_EVENT]->(first_event:Event)
         OPTIONAL MATCH path = (first_event)-[:NEXT*]->(next_events)
         WITH first_event, next_events
         UNWIND [first_event] + next_events AS event
         RETURN event ORDER BY event.timestamp
         """
 
-        async with Neo4jDB.driver.session() as session:
-            result = await session.run(query, session_id=session_id)
-            records = await result.data()
+        records = await read(LOOKUP, query, session_id=session_id)
 
-            if not records:
-                raise HTTPException(status_code=404, detail="No events found for this session.")
+        if not records:
+            raise HTTPException(status_code=404, detail="No events found for this session.")
 
-            # Extract and order the events properly
-            events = []
-            for record in records:
-                event = record["event"]
-                if event is None:
-                    continue  # Skip empty records
+        # Extract and order the events properly
+        events = []
+        for record in records:
+            event = record["event"]
+            if event is None:
+                continue  # Skip empty records
 
-                events.append({
-                    "event_id": event["event_id"],
-                    "event_type": event["event_type"],
-                    "timestamp": event["timestamp"],
-                    "payload": event["payload"],
-                    "next_event": None  # Will be assigned below
-                })
+            events.append({
+                "event_id": event["event_id"],
+                "event_type": event["event_type"],
+                "timestamp": event["timestamp"],
+                "payload": event["payload"],
+                "next_event": None  # Will be assigned below
+            })
 
-            # Assign `next_event` by linking each event in order
-            for i in range(len(events) - 1):
-                events[i]["next_event"] = events[i + 1]["event_id"]
+        # Assign `next_event` by linking each event in order
+        for i in range(len(events) - 1):
+            events[i]["next_event"] = events[i + 1]["event_id"]
 
-            return {"session_id": session_id, "events": events}
+        return {"session_id": session_id, "events": events}
     
     @staticmethod
+    @timed(QUERY_LATENCY, "get_latest_event")
     async def get_latest_event(session_id: str):
         """
         Retrieve the latest event in a session (real-time tracking).
         """
-        query = """
-        MATCH (s:Session {session_id: $session_id})-[:LAST_EVENT]->(latest:Event)
-        RETURN latest
+        query = SESSIONS_OF + """
+        MATCH (s)-[:LAST_EVENT]->(latest:Event)
+        RETURN latest ORDER BY latest.timestamp DESC LIMIT 1
         """
 
-        async with Neo4jDB.driver.session() as session:
-            result = await session.run(query, session_id=session_id)
-            record = await result.single()
-            if not record:
-                raise HTTPException(status_code=404, detail="No latest event found.")
-            
-            latest_event = record["latest"]
-            return {
-                "event_id": latest_event["event_id"],
-                "event_type": latest_event["event_type"],
-                "timestamp": latest_event["timestamp"],
-                "payload": latest_event["payload"]
-            }
+        records = await read(LOOKUP, query, session_id=session_id)
+        if not records:
+            raise HTTPException(status_code=404, detail="No latest event found.")
+
+        latest_event = records[0]["latest"]
+        return {
+            "event_id": latest_event["event_id"],
+            "event_type": latest_event["event_type"],
+            "timestamp": latest_event["timestamp"],
+            "payload": latest_event["payload"]
+        }
         
     @staticmethod
+    @timed(QUERY_LATENCY, "get_event_counts")
     async def get_event_counts(session_id: str):
         """
-        Count the occurrences of each event type in a session.
+        Count the occurrences of each event type in a session, weighting sampled events.
         """
-        query = """
-        MATCH (s:Session {session_id: $session_id})-[:HAS_EVENT]->(e:Event)
-        RETURN e.event_type AS event_type, COUNT(e) AS count
+        query = SESSIONS_OF + """
+        MATCH (s)-[:HAS_EVENT]->(e:Event)
+        RETURN e.event_type AS event_type, toInteger(round(sum(coalesce(e.weight, 1)))) AS count
         """
 
-        async with Neo4jDB.driver.session() as session:
-            result = await session.run(query, session_id=session_id)
-            counts = {record["event_type"]: record["count"] async for record in result}
+        records = await read(LOOKUP, query, session_id=session_id)
+        counts = {record["event_type"]: record["count"] for record in records}
 
         if not counts:
             raise HTTPException(status_code=404, detail="No events found for analytics.")
@@ -87,20 +101,20 @@ class EventQueries:
         return {"session_id": session_id, "event_counts": counts}
     
     @staticmethod
+    @timed(QUERY_LATENCY, "get_conversion_funnel")
     async def get_conversion_funnel(session_id: str, steps: list):
         """
         Analyzes conversion rates across a series of events in a session.
         Example: ["page_view", "add_to_cart", "checkout"]
         """
-        query = """
-        MATCH (s:Session {session_id: $session_id})-[:HAS_EVENT]->(e:Event)
+        query = SESSIONS_OF + """
+        MATCH (s)-[:HAS_EVENT]->(e:Event)
         WHERE e.event_type IN $steps
-        RETURN e.event_type AS step, COUNT(e) AS count
+        RETURN e.event_type AS step, toInteger(round(sum(coalesce(e.weight, 1)))) AS count
         """
 
-        async with Neo4jDB.driver.session() as session:
-            result = await session.run(query, session_id=session_id, steps=steps)
-            funnel_data = {record["step"]: record["count"] async for record in result}
+        records = await read(LOOKUP, query, session_id=session_id, steps=steps)
+        funnel_data = {record["step"]: record["count"] for record in records}
 
         if not funnel_data:
             raise HTTPException(status_code=404, detail="No funnel data found.")
@@ -111,39 +125,56 @@ class EventQueries:
         return {"session_id": session_id, "funnel": ordered_funnel}
     
     @staticmethod
-    async def get_retention_rate(days: int):
+    @timed(QUERY_LATENCY, "get_retention_rate")
+    async def get_retention_rate(days: int, exact: bool = False, app_id: str = None):
         """
         Calculates user retention rate over a time period.
+        Estimated from session sketches of whole days unless `exact` is set;
+        the estimate covers the last `days` days, today included.
         """
+        if not exact:
+            today = datetime.now(timezone.utc).date()
+            counts = await count_sessions([ALL_TYPES], app_id, today - timedelta(days=max(days - 1, 0)), today)
+            return {
+                "days": days,
+                "active_sessions": counts[ALL_TYPES],
+                "approximate": True,
+                "relative_error": RELATIVE_ERROR,
+            }
+
         query = """
         MATCH (s:Session)-[:HAS_EVENT]->(e:Event)
         WHERE datetime(e.timestamp) >= datetime() - duration({days: $days})
-        RETURN COUNT(DISTINCT s.session_id) AS active_sessions
+        """
+        if app_id:
+            query += " AND s.app_id = $app_id"
+        # A sampled session counts once, with the weight of its least sampled event
+        query += """
+        WITH s, min(coalesce(e.weight, 1)) AS weight
+        RETURN toInteger(round(sum(weight))) AS active_sessions
         """
 
-        async with Neo4jDB.driver.session() as session:
-            result = await session.run(query, days=days)
-            record = await result.single()
+        records = await read(AGGREGATE, query, days=days, app_id=app_id)
 
-        if not record:
+        if not records:
             raise HTTPException(status_code=404, detail="No retention data found.")
 
-        return {"days": days, "active_sessions": record["active_sessions"]}
+        return {"days": days, "active_sessions": records[0]["active_sessions"], "approximate": False, "relative_error": 0.0}
     
     @staticmethod
+    @timed(QUERY_LATENCY, "get_session_heatmap")
     async def get_session_heatmap():
         """
         Analyzes user activity distribution across different hours of the day.
         """
         query = """
         MATCH (e:Event)
-        RETURN datetime(e.timestamp).hour AS hour, COUNT(e) AS event_count
+        RETURN datetime(e.timestamp).hour AS hour, toInteger(round(sum(coalesce(e.weight, 1)))) AS event_count
         ORDER BY hour
         """
 
-        async with Neo4jDB.driver.session() as session:
-            result = await session.run(query)
-            heatmap = {str(record["hour"]): record["event_count"] async for record in result}
+        records = await read(AGGREGATE, query)
+        heatmap = {str(record["hour"]): record["event_count"] for record in records}
 
         if not heatmap:
             raise HTTPException(status_code=404, detail="No heatmap data found.")
@@ -151,18 +182,18 @@ class EventQueries:
         return {"heatmap": heatmap}
     
     @staticmethod
+    @timed(QUERY_LATENCY, "get_global_event_counts")
     async def get_global_event_counts():
         """
-        Counts the occurrences of each event type across all sessions.
+        Counts the occurrences of each event type across all sessions, weighting sampled events.
         """
         query = """
         MATCH (e:Event)
-        RETURN e.event_type AS event_type, COUNT(e) AS count
+        RETURN e.event_type AS event_type, toInteger(round(sum(coalesce(e.weight, 1)))) AS count
         """
 
-        async with Neo4jDB.driver.session() as session:
-            result = await session.run(query)
-            event_counts = {record["event_type"]: record["count"] async for record in result}
+        records = await read(AGGREGATE, query)
+        event_counts = {record["event_type"]: record["count"] for record in records}
 
         if not event_counts:
             raise HTTPException(status_code=404, detail="No global event data found.")
@@ -170,57 +201,97 @@ class EventQueries:
         return {"event_counts": event_counts}
     
     @staticmethod
-    async def get_top_events(limit: int = 5):
-        """
-        Retrieves the most frequently occurring events.
-        """
-        query = """
-        MATCH (e:Event)
-        RETURN e.event_type AS event_type, COUNT(e) AS count
+    @timed(QUERY_LATENCY, "get_top_events")
+    async def get_top_events(limit: int = 5, window: str = "day", exact: bool = False, app_id: str = None):
+        """
+        Retrieves the most frequently occurring events in a sliding window.
+        Served from the consumers' heavy-hitter summaries unless `exact` is set.
+        """
+        if window not in WINDOWS:
+            raise HTTPException(status_code=400, detail=f"window must be one of {', '.join(WINDOWS)}")
+
+        if not exact:
+            result = await HeavyHitterQueries.get_top_values(app_id, EVENT_TYPE, window, limit)
+            top_events = [
+                {"event_type": entry["value"], "count": entry["count"], "error": entry["error"]}
+                for entry in result["top"]
+            ]
+            return {"top_events": top_events, "window": window, "approximate": True}
+
+        width, kept = WINDOWS[window]
+        if app_id:
+            query = """
+            MATCH (s:Session {app_id: $app_id})-[:HAS_EVENT]->(:Event)-[:NEXT*0..]->(e:Event)
+            """
+        else:
+            query = """
+            MATCH (e:Event)
+            """
+        query += """
+        WHERE datetime(e.timestamp) >= datetime() - duration({seconds: $seconds})
+        RETURN e.event_type AS event_type, toInteger(round(sum(coalesce(e.weight, 1)))) AS count
         ORDER BY count DESC LIMIT $limit
         """
 
-        async with Neo4jDB.driver.session() as session:
-            result = await session.run(query, limit=limit)
-            top_events = [{"event_type": record["event_type"], "count": record["count"]} async for record in result]
+        records = await read(AGGREGATE, query, seconds=width * kept, app_id=app_id, limit=limit)
+        top_events = [{"event_type": record["event_type"], "count": record["count"], "error": 0} for record in records]
 
         if not top_events:
             raise HTTPException(status_code=404, detail="No event data found.")
 
-        return {"top_events": top_events}
+        return {"top_events": top_events, "window": window, "approximate": False}
     
     @staticmethod
-    async def get_global_funnel(steps: list, start_date: str = None, end_date: str = None):
+    @timed(QUERY_LATENCY, "get_global_funnel")
+    async def get_global_funnel(steps: list, start_date: str = None, end_date: str = None, exact: bool = False, app_id: str = None):
         """
         Analyzes conversion rates for a funnel across all sessions.
-        """
+        Estimated from session sketches of whole days unless `exact` is set.
+        """
+        if not exact:
+            counts = await count_sessions(
+                steps,
+                app_id,
+                datetime.fromisoformat(start_date).date() if start_date else None,
+                datetime.fromisoformat(end_date).date() if end_date else None,
+            )
+            if not any(counts.values()):
+                raise HTTPException(status_code=404, detail="No funnel data found.")
+            return {"funnel": counts, "approximate": True, "relative_error": RELATIVE_ERROR}
+
         query = """
         MATCH (s:Session)-[:HAS_EVENT]->(e:Event)
         WHERE e.event_type IN $steps
         """
 
+        if app_id:
+            query += " AND s.app_id = $app_id"
+
         if start_date and end_date:
             query += " AND datetime(e.timestamp) >= datetime($start_date) AND datetime(e.timestamp) <= datetime($end_date)"
 
+        # Sampling keeps or drops a session's events of a type together, so
+        # each session counts once per step, weighted by its least sampled event
         query += """
-        RETURN e.event_type AS step, COUNT(DISTINCT s.session_id) AS count
+        WITH s, e.event_type AS step, min(coalesce(e.weight, 1)) AS weight
+        RETURN step, toInteger(round(sum(weight))) AS count
         """
 
-        async with Neo4jDB.driver.session() as session:
-            params = {"steps": steps}
-            if start_date and end_date:
-                params.update({"start_date": start_date, "end_date": end_date})
+        params = {"steps": steps, "app_id": app_id}
+        if start_date and end_date:
+            params.update({"start_date": start_date, "end_date": end_date})
 
-            result = await session.run(query, **params)
-            funnel_data = {record["step"]: record["count"] async for record in result}
+        records = await read(AGGREGATE, query, **params)
+        funnel_data = {record["step"]: record["count"] for record in records}
 
         if not funnel_data:
             raise HTTPException(status_code=404, detail="No funnel data found.")
 
         ordered_funnel = {step: funnel_data.get(step, 0) for step in steps}
-        return {"funnel": ordered_funnel}
+        return {"funnel": ordered_funnel, "approximate": False, "relative_error": 0.0}
     
     @staticmethod
+    @timed(QUERY_LATENCY, "get_segmented_users")
     async def get_segmented_users(events: list, min_events: int = 1):
         """
         Finds users who triggered specific events at least `min_events` times.
@@ -233,9 +304,8 @@ class EventQueries:
         RETURN u.user_id AS user_id, event_count
         """
 
-        async with Neo4jDB.driver.session() as session:
-            result = await session.run(query, events=events, min_events=min_events)
-            segmented_users = [{"user_id": record["user_id"], "event_count": record["event_count"]} async for record in result]
+        records = await read(CUSTOM, query, events=events, min_events=min_events)
+        segmented_users = [{"user_id": record["user_id"], "event_count": record["event_count"]} for record in records]
 
         if not segmented_users:
             raise HTTPException(status_code=404, detail="No users found for this segment.")
@@ -243,6 +313,7 @@ class EventQueries:
         return {"users": segmented_users}
     
     @staticmethod
+    @timed(QUERY_LATENCY, "execute_custom_query")
     async def execute_custom_query(conditions: list):
         """
         Executes a custom query based on user-defined conditions.
@@ -290,9 +361,8 @@ class EventQueries:
 
         base_query += " RETURN u.user_id AS user_id, COUNT(e) AS event_count"
 
-        async with Neo4jDB.driver.session() as session:
-            result = await session.run(base_query, **params)
-            query_results = [{"user_id": record["user_id"], "event_count": record["event_count"]} async for record in result]
+        records = await read(CUSTOM, base_query, **params)
+        query_results = [{"user_id": record["user_id"], "event_count": record["event_count"]} for record in records]
 
         if not query_results:
             raise HTTPException(status_code=404, detail="No matching users found.")
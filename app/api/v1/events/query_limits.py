@@ -0,0 +1,116 @@
+"""
+Timeouts and concurrency limits for analytics reads.
+
+`EventQueries` run their Cypher through `read()`: a managed read transaction
+(`execute_read`, retried on transient errors) with the timeout of the
+query's class, so Neo4j aborts a runaway query server-side instead of
+letting it hold a connection. Query classes:
+
+    lookup      one session's events (flow, latest event, counts, funnel)
+    aggregate   scans across sessions (global counts, heatmap, exact top
+                events, retention and funnels)
+    custom      user segments and custom queries
+    export      pages of raw event exports (each page holds a slot, so
+                concurrent exports interleave instead of piling up)
+
+Each class has its own semaphore, so heavy queries queue behind each other
+instead of taking connections from cheap lookups and the embedded
+consumer's writes. A query waits at most `QUERY_QUEUE_TIMEOUT` for a slot
+and is then rejected with 503 and Retry-After; a query that times out gets
+504. Keep the sum of the class limits well below `NEO4J_MAX_POOL_SIZE` so
+writes always find a connection.
+
+Queries of clients that disconnect are cancelled by
+`app.core.cancellation.CancelOnDisconnectMiddleware`.
+"""
+import asyncio
+import math
+from collections import Counter
+from contextlib import asynccontextmanager
+from typing import List
+import neo4j
+from fastapi import HTTPException
+from neo4j.exceptions import ClientError
+from app.core.config import settings
+from app.core.database import Neo4jDB
+from app.core.metrics import QUERIES_SHED, QUERIES_TIMED_OUT, Gauge
+
+LOOKUP = "lookup"
+AGGREGATE = "aggregate"
+CUSTOM = "custom"
+EXPORT = "export"
+
+def class_limits(query_class: str) -> tuple:
+    """
+    `(concurrent queries, transaction timeout in seconds)` of a query class.
+    """
+    return {
+        LOOKUP: (settings.QUERY_LOOKUP_CONCURRENCY, settings.QUERY_LOOKUP_TIMEOUT),
+        AGGREGATE: (settings.QUERY_AGGREGATE_CONCURRENCY, settings.QUERY_AGGREGATE_TIMEOUT),
+        CUSTOM: (settings.QUERY_CUSTOM_CONCURRENCY, settings.QUERY_CUSTOM_TIMEOUT),
+        EXPORT: (settings.QUERY_EXPORT_CONCURRENCY, settings.QUERY_EXPORT_TIMEOUT),
+    }[query_class]
+
+class QueryLimits:
+    # query class -> asyncio.Semaphore
+    semaphores: dict = {}
+    running: Counter = Counter()
+    waiting: Counter = Counter()
+
+    @classmethod
+    @asynccontextmanager
+    async def slot(cls, query_class: str):
+        """
+        Holds one of the class's slots while the query runs, waiting up to QUERY_QUEUE_TIMEOUT for it.
+        """
+        semaphore = cls.semaphores.get(query_class)
+        if semaphore is None:
+            semaphore = cls.semaphores[query_class] = asyncio.Semaphore(class_limits(query_class)[0])
+
+        cls.waiting[query_class] += 1
+        try:
+            async with asyncio.timeout(settings.QUERY_QUEUE_TIMEOUT):
+                await semaphore.acquire()
+        except TimeoutError:
+            QUERIES_SHED.inc(query_class)
+            raise HTTPException(
+                status_code=503,
+                detail=f"Too many {query_class} queries running, retry later",
+                headers={"Retry-After": str(math.ceil(settings.QUERY_QUEUE_TIMEOUT))},
+            )
+        finally:
+            cls.waiting[query_class] -= 1
+
+        cls.running[query_class] += 1
+        try:
+            yield
+        finally:
+            cls.running[query_class] -= 1
+            semaphore.release()
+
+async def _fetch(tx: neo4j.AsyncManagedTransaction, query: str, params: dict) -> List[dict]:
+    result = await tx.run(query, params)
+    return await result.data()
+
+async def read(query_class: str, query: str, **params) -> List[dict]:
+    """
+    Runs a read query under its class's timeout and concurrency limit and
+    returns its records as dicts.
+    """
+    _, timeout = class_limits(query_class)
+    work = neo4j.unit_of_work(timeout=timeout, metadata={"query_class": query_class})(_fetch)
+    async with QueryLimits.slot(query_class):
+        try:
+            async with Neo4jDB.get_driver().session(default_access_mode=neo4j.READ_ACCESS) as session:
+                return await session.execute_read(work, query, params)
+        except ClientError as e:
+            if "TransactionTimedOut" not in (e.code or ""):
+                raise
+            QUERIES_TIMED_OUT.inc(query_class)
+            raise HTTPException(
+                status_code=504,
+                detail=f"Query exceeded its {timeout:g}s limit, narrow it down and retry",
+            )
+
+Gauge("artello_queries_running", "Analytics queries running in this worker", lambda: sum(QueryLimits.running.values()))
+Gauge("artello_queries_waiting", "Analytics queries waiting for a slot in this worker", lambda: sum(QueryLimits.waiting.values()))
@@ -0,0 +1,251 @@
+"""
+Live event rates per app and event type, kept in in-memory ring buffers.
+
+Consumers count stored events per app, event type and second and, on every
+rollup flush, publish the counts to the `EVENT_RATES_EXCHANGE` fanout
+exchange. Every API process subscribes with its own exclusive queue and adds
+them to its `RateStore`, so rate queries never touch Neo4j or Mongo. A
+subscription that fails (the broker is down at startup) is retried in the
+background every `TIMESERIES_SUBSCRIBE_RETRY_SECONDS`.
+
+Each series (one per app and event type, plus `"*"` for all types) has two
+rings of 32-bit counters:
+
+    second   TIMESERIES_SECONDS buckets of 1 second
+    minute   TIMESERIES_MINUTES buckets of 1 minute
+
+Queries can downsample a ring further with `step`. The store holds at most
+`TIMESERIES_MAX_SERIES` series (least recently updated dropped), about
+4 * (TIMESERIES_SECONDS + TIMESERIES_MINUTES) bytes each. History starts
+when the API process starts; events older than a ring's span, and counts
+published while no API process was subscribed, are not kept.
+"""
+import asyncio
+import json
+import time
+from array import array
+from collections import Counter, OrderedDict
+from datetime import datetime, timezone
+from typing import Optional
+import aio_pika
+from fastapi import HTTPException
+from app.core.config import settings
+from app.core.metrics import QUERY_LATENCY, Gauge, timed
+from app.core.logger import get_logger
+from app.api.v1.events.rollups import Rollups
+from app.api.v1.events.services import EventQueue
+
+logger = get_logger("rates")
+
+ALL_TYPES = "*"
+
+class Ring:
+    """
+    Fixed-size circular buffer of counts for consecutive buckets of `width`
+    seconds. `head` is the newest bucket index (epoch seconds // width).
+    """
+    __slots__ = ("width", "size", "counts", "head")
+
+    def __init__(self, width: int, size: int):
+        self.width = width
+        self.size = size
+        self.counts = array("I", bytes(4 * size))
+        self.head = 0
+
+    def add(self, at: float, amount: int):
+        index = int(at // self.width)
+        if index > self.head:
+            # Clear the buckets skipped since the last update
+            for skipped in range(max(self.head + 1, index - self.size + 1), index + 1):
+                self.counts[skipped % self.size] = 0
+            self.head = index
+        elif index <= self.head - self.size:
+            return
+        self.counts[index % self.size] += amount
+
+    def read(self, first: int, last: int) -> list:
+        """
+        Counts of buckets `first` to `last` inclusive; buckets outside the ring read as 0.
+        """
+        head, size, counts = self.head, self.size, self.counts
+        return [counts[index % size] if head - size < index <= head else 0 for index in range(first, last + 1)]
+
+class RateSeries:
+    __slots__ = ("rings",)
+
+    def __init__(self):
+        self.rings = {
+            "second": Ring(1, settings.TIMESERIES_SECONDS),
+            "minute": Ring(60, settings.TIMESERIES_MINUTES),
+        }
+
+    def add(self, at: float, amount: int):
+        for ring in self.rings.values():
+            ring.add(at, amount)
+
+class RateStore:
+    # (app_id, event_type) -> RateSeries, least recently updated first
+    series: OrderedDict = OrderedDict()
+    _queue = None
+    _consumer_tag: str = None
+    _subscriber: asyncio.Task = None
+
+    @classmethod
+    def add(cls, app_id: str, event_type: str, at: float, amount: int):
+        key = (app_id, event_type)
+        series = cls.series.get(key)
+        if series is None:
+            series = cls.series[key] = RateSeries()
+            if len(cls.series) > settings.TIMESERIES_MAX_SERIES:
+                cls.series.popitem(last=False)
+        else:
+            cls.series.move_to_end(key)
+        series.add(at, amount)
+
+    @classmethod
+    async def on_message(cls, message: aio_pika.abc.AbstractIncomingMessage):
+        try:
+            counts = json.loads(message.body)["counts"]
+            for app_id, event_type, second, amount in counts:
+                cls.add(app_id, event_type, second, amount)
+        except Exception as e:
+            logger.warning("Dropping malformed event rate message: %r", e)
+
+    @classmethod
+    async def subscribe(cls):
+        """
+        Starts receiving the consumers' rate counts on an exclusive queue.
+        """
+        if cls._queue is not None:
+            return
+        channel = await EventQueue.get_channel()
+        exchange = await channel.declare_exchange(settings.EVENT_RATES_EXCHANGE, aio_pika.ExchangeType.FANOUT)
+        queue = await channel.declare_queue(exclusive=True, arguments={"x-message-ttl": 60_000})
+        await queue.bind(exchange)
+        cls._consumer_tag = await queue.consume(cls.on_message, no_ack=True)
+        cls._queue = queue
+
+    @classmethod
+    def start_subscriber(cls):
+        """
+        Subscribes in the background, retrying until the broker accepts it.
+        """
+        if cls._subscriber is None or cls._subscriber.done():
+            cls._subscriber = asyncio.create_task(cls._subscribe_until_done())
+
+    @classmethod
+    async def _subscribe_until_done(cls):
+        failures = 0
+        while cls._queue is None:
+            try:
+                await cls.subscribe()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                if not failures:
+                    logger.warning("Live event rates unavailable, broker subscription failed: %r", e)
+                failures += 1
+                await asyncio.sleep(settings.TIMESERIES_SUBSCRIBE_RETRY_SECONDS)
+        if failures:
+            logger.info("Subscribed to live event rates after %d failed attempts", failures)
+
+    @classmethod
+    async def unsubscribe(cls):
+        if cls._subscriber is not None:
+            cls._subscriber.cancel()
+            try:
+                await cls._subscriber
+            except asyncio.CancelledError:
+                pass
+            cls._subscriber = None
+        if cls._queue is None:
+            return
+        try:
+            await cls._queue.cancel(cls._consumer_tag)
+        except Exception as e:
+            logger.warning("Could not cancel the event rate subscription: %r", e)
+        cls._queue = None
+        cls._consumer_tag = None
+
+@Rollups.register
+class EventRates:
+    live_only = True
+    # (app_id, event_type, epoch second) -> count
+    pending: Counter = Counter()
+    _exchange = None
+    _channel = None
+
+    @classmethod
+    def observe(cls, event, prev_type: Optional[str], weight: float = 1.0):
+        # Clamped to now so clients with fast clocks cannot push a ring's head ahead
+        second = int(min(event.timestamp.timestamp(), time.time()))
+        cls.pending[(event.app_id, event.event_type, second)] += weight
+        cls.pending[(event.app_id, ALL_TYPES, second)] += weight
+
+    @classmethod
+    async def flush(cls, final: bool = False):
+        if not cls.pending:
+            return
+        pending, cls.pending = cls.pending, Counter()
+        # Counts are only useful live, so a failed publish drops them rather than retrying
+        channel = await EventQueue.get_channel()
+        if cls._channel is not channel:
+            cls._exchange = await channel.declare_exchange(settings.EVENT_RATES_EXCHANGE, aio_pika.ExchangeType.FANOUT)
+            cls._channel = channel
+        body = json.dumps({"counts": [[*key, round(n)] for key, n in pending.items()]}).encode()
+        await cls._exchange.publish(aio_pika.Message(body=body, content_type="application/json"), routing_key="")
+
+class RateQueries:
+    RESOLUTIONS = {"second": 1, "minute": 60}
+
+    @staticmethod
+    @timed(QUERY_LATENCY, "get_event_rates")
+    async def get_event_rates(app_id: str, event_type: str = None, resolution: str = "minute",
+                              window: int = None, step: int = None):
+        """
+        Event counts per `step` seconds (default: the resolution) over the last
+        `window` seconds (default: an hour, at most the ring's span), for one
+        event type or all of them.
+        """
+        width = RateQueries.RESOLUTIONS.get(resolution)
+        if width is None:
+            raise HTTPException(status_code=400, detail=f"resolution must be one of {', '.join(RateQueries.RESOLUTIONS)}")
+        step = step or width
+        if step % width:
+            raise HTTPException(status_code=400, detail=f"step must be a multiple of {width} seconds")
+
+        series = RateStore.series.get((app_id, event_type or ALL_TYPES))
+        if series is None:
+            raise HTTPException(status_code=404, detail="No recent event data found.")
+
+        ring = series.rings[resolution]
+        span = ring.size * width
+        window = window or min(3600, span)
+        if window > span:
+            raise HTTPException(status_code=400, detail=f"window must be at most {span} seconds at {resolution} resolution")
+        buckets_per_step = step // width
+        steps = window // step
+        if steps < 1:
+            raise HTTPException(status_code=400, detail="window must cover at least one step")
+
+        # Aligned to step boundaries, ending with the current (partial) step
+        last_step = int(time.time()) // step
+        first = (last_step - steps + 1) * buckets_per_step
+        counts = ring.read(first, first + steps * buckets_per_step - 1)
+        points = [
+            {
+                "time": datetime.fromtimestamp((last_step - steps + 1 + i) * step, timezone.utc).isoformat(),
+                "count": sum(counts[i * buckets_per_step:(i + 1) * buckets_per_step]),
+            }
+            for i in range(steps)
+        ]
+        return {
+            "app_id": app_id,
+            "event_type": event_type or ALL_TYPES,
+            "resolution": resolution,
+            "step": step,
+            "total": sum(counts),
+            "points": points,
+        }
+
+Gauge("artello_rate_series", "Event rate series held by this process", lambda: len(RateStore.series))
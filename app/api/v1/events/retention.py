@@ -0,0 +1,251 @@
+"""
+Retention of raw events: compaction, archival and throttled deletion.
+
+An app keeps raw events for its `retention_days` (or `RETENTION_DEFAULT_DAYS`
+when unset; 0 keeps them forever). A session expires once its last event is
+older than that. For every expired session the job
+
+1. appends its events, in export format, to the app's archive file
+   `RETENTION_ARCHIVE_DIR/<app_id>/<run date>.ndjson.gz` (one gzip member
+   per batch, synced before anything is deleted),
+2. stores a summary on the `Session` node: `event_count`,
+   `first_timestamp`, `last_timestamp`, `event_types` (JSON counts) and
+   `archive`; counts sum the events' sampling weights, like exact queries,
+3. deletes its events tail first in batches of `RETENTION_DELETE_BATCH`,
+   so an interrupted run leaves an intact chain from the head,
+4. marks the session with `compacted_at`.
+
+Every write is followed by a pause so retention spends at most
+`RETENTION_DUTY_CYCLE` of its time writing. Daily transition and session
+sketch rollups are unaffected, and the sessionizer continues from a
+compacted session's `last_timestamp`. A session interrupted between steps 1
+and 4 is archived again on the next run. Events without an `app_id`
+(see `app.cli.export --tag-legacy-events`) are not found.
+"""
+import asyncio
+import gzip
+import json
+import os
+import time
+from collections import Counter, OrderedDict
+from datetime import datetime, timedelta, timezone
+from typing import List
+from app.core.config import settings
+from app.core.database import MongoDB, Neo4jDB
+from app.core.logger import get_logger
+from app.api.v1.events.export import to_line
+
+logger = get_logger("retention")
+
+# Sessions remembered by a scan; one still in use keeps recurring in its pages
+MAX_SEEN_SESSIONS = 100_000
+
+# Pages through an app's events older than the cutoff, oldest first
+EXPIRED_EVENTS_QUERY = """
+MATCH (e:Event)
+WHERE e.app_id = $app_id AND e.timestamp < $cutoff
+  AND (e.timestamp > $after_timestamp OR (e.timestamp = $after_timestamp AND e.event_id > $after_event_id))
+RETURN e.session_id AS session_id, e.timestamp AS timestamp, e.event_id AS event_id
+ORDER BY e.timestamp, e.event_id
+LIMIT $limit
+"""
+
+SESSION_CHAINS_QUERY = """
+UNWIND $session_ids AS session_id
+MATCH (s:Session {session_id: session_id})-[:HAS_EVENT]->(head:Event)
+MATCH path = (head)-[:NEXT*0..]->(tail:Event)
+WHERE NOT (tail)-[:NEXT]->()
+RETURN s.session_id AS session_id,
+       [e IN nodes(path) | e {.event_id, .event_type, .timestamp, .payload, .weight}] AS events
+"""
+
+# Keeps the first summary written if a previous run was interrupted
+SUMMARIZE_SESSIONS_QUERY = """
+UNWIND $summaries AS summary
+MATCH (s:Session {session_id: summary.session_id})
+WHERE s.event_count IS NULL
+SET s.event_count = summary.event_count,
+    s.first_timestamp = summary.first_timestamp,
+    s.last_timestamp = summary.last_timestamp,
+    s.event_types = summary.event_types,
+    s.archive = summary.archive
+"""
+
+DELETE_EVENTS_QUERY = """
+UNWIND $event_ids AS event_id
+MATCH (e:Event {app_id: $app_id, event_id: event_id})
+DETACH DELETE e
+"""
+
+MARK_COMPACTED_QUERY = """
+UNWIND $session_ids AS session_id
+MATCH (s:Session {session_id: session_id})
+SET s.compacted_at = $compacted_at
+"""
+
+async def throttled_write(query: str, **params):
+    """
+    Runs one write, then pauses long enough to keep writes within the duty cycle.
+    """
+    started = time.monotonic()
+    async with Neo4jDB.get_driver().session() as neo4j_session:
+        await (await neo4j_session.run(query, **params)).consume()
+    elapsed = time.monotonic() - started
+    duty = min(max(settings.RETENTION_DUTY_CYCLE, 0.01), 1.0)
+    await asyncio.sleep(elapsed * (1 - duty) / duty)
+
+def archive_path(app_id: str, now: datetime) -> str:
+    return os.path.join(settings.RETENTION_ARCHIVE_DIR, app_id, f"{now.date().isoformat()}.ndjson.gz")
+
+def write_archive(path: str, app_id: str, sessions: List[tuple]):
+    """
+    Appends the sessions' events as one gzip member and syncs it to disk.
+    """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    text = "".join(
+        to_line({**event, "session_id": session_id}, app_id)
+        for session_id, events in sessions
+        for event in events
+    )
+    with open(path, "ab") as f:
+        f.write(gzip.compress(text.encode()))
+        f.flush()
+        os.fsync(f.fileno())
+
+def summarize(session_id: str, events: List[dict], archive: str) -> dict:
+    event_types = Counter()
+    for event in events:
+        event_types[event["event_type"]] += event.get("weight") or 1
+    return {
+        "session_id": session_id,
+        "event_count": round(sum(event_types.values())),
+        "first_timestamp": events[0]["timestamp"],
+        "last_timestamp": events[-1]["timestamp"],
+        "event_types": json.dumps({event_type: round(count) for event_type, count in event_types.items()}),
+        "archive": archive,
+    }
+
+class Retention:
+    @staticmethod
+    async def policies(app_id: str = None) -> List[tuple]:
+        """
+        `(app_id, retention_days)` of every app whose raw events expire.
+        """
+        query = {"app_id": app_id} if app_id else {}
+        apps = await MongoDB.get_db().apps.find(query, {"app_id": 1, "retention_days": 1}).to_list(None)
+        policies = []
+        for app in apps:
+            days = app.get("retention_days")
+            if days is None:
+                days = settings.RETENTION_DEFAULT_DAYS
+            if days > 0:
+                policies.append((app["app_id"], days))
+        return policies
+
+    @staticmethod
+    async def expired_session_batches(app_id: str, cutoff: str):
+        """
+        Yields batches of ids of sessions with events older than the cutoff,
+        following the app's old events oldest first. Ids are yielded once
+        unless more than MAX_SEEN_SESSIONS others came in between; compacted
+        sessions do not recur, since their events are gone.
+        """
+        after_timestamp, after_event_id = "", ""
+        seen = OrderedDict()
+        while True:
+            async with Neo4jDB.get_driver().session() as neo4j_session:
+                result = await neo4j_session.run(
+                    EXPIRED_EVENTS_QUERY, app_id=app_id, cutoff=cutoff, limit=settings.RETENTION_SCAN_BATCH,
+                    after_timestamp=after_timestamp, after_event_id=after_event_id,
+                )
+                records = await result.data()
+            if not records:
+                return
+            after_timestamp, after_event_id = records[-1]["timestamp"], records[-1]["event_id"]
+
+            batch = []
+            for record in records:
+                session_id = record["session_id"]
+                if session_id and session_id not in seen:
+                    seen[session_id] = None
+                    batch.append(session_id)
+                    if len(seen) > MAX_SEEN_SESSIONS:
+                        seen.popitem(last=False)
+            if batch:
+                yield batch
+            if len(records) < settings.RETENTION_SCAN_BATCH:
+                return
+
+    @staticmethod
+    async def load_expired(session_ids: List[str], cutoff: str) -> List[tuple]:
+        """
+        `(session_id, events in chain order)` of the sessions whose last event is older than the cutoff.
+        """
+        async with Neo4jDB.get_driver().session() as neo4j_session:
+            result = await neo4j_session.run(SESSION_CHAINS_QUERY, session_ids=session_ids)
+            records = await result.data()
+        return [
+            (record["session_id"], record["events"])
+            for record in records
+            if record["events"] and record["events"][-1]["timestamp"] < cutoff
+        ]
+
+    @staticmethod
+    async def compact(app_id: str, sessions: List[tuple], now: datetime):
+        """
+        Archives, summarizes and deletes the events of expired sessions.
+        """
+        path = archive_path(app_id, now)
+        await asyncio.to_thread(write_archive, path, app_id, sessions)
+
+        await throttled_write(
+            SUMMARIZE_SESSIONS_QUERY,
+            summaries=[summarize(session_id, events, path) for session_id, events in sessions],
+        )
+
+        # Tail first, so the chain from the head stays intact if the run stops
+        event_ids = [event["event_id"] for _, events in sessions for event in reversed(events)]
+        for i in range(0, len(event_ids), settings.RETENTION_DELETE_BATCH):
+            await throttled_write(
+                DELETE_EVENTS_QUERY, app_id=app_id, event_ids=event_ids[i:i + settings.RETENTION_DELETE_BATCH]
+            )
+
+        await throttled_write(
+            MARK_COMPACTED_QUERY,
+            session_ids=[session_id for session_id, _ in sessions],
+            compacted_at=now.isoformat(),
+        )
+
+    @staticmethod
+    async def apply(app_id: str, retention_days: int, dry_run: bool = False) -> dict:
+        """
+        Compacts one app's expired sessions, or only counts them in a dry run.
+        """
+        now = datetime.now(timezone.utc)
+        cutoff = (now - timedelta(days=retention_days)).isoformat()
+        report = {"app_id": app_id, "cutoff": cutoff, "sessions": 0, "events": 0, "archive": None}
+
+        async for session_ids in Retention.expired_session_batches(app_id, cutoff):
+            sessions = await Retention.load_expired(session_ids, cutoff)
+            if not sessions:
+                continue
+            if not dry_run:
+                await Retention.compact(app_id, sessions, now)
+                report["archive"] = archive_path(app_id, now)
+            report["sessions"] += len(sessions)
+            report["events"] += sum(len(events) for _, events in sessions)
+            logger.info(
+                "%s %d sessions (%d events) of app %s", "Would compact" if dry_run else "Compacted",
+                report["sessions"], report["events"], app_id, extra={"app_id": app_id},
+            )
+        return report
+
+    @staticmethod
+    async def run(app_id: str = None, dry_run: bool = False) -> List[dict]:
+        """
+        Applies every app's retention policy in turn.
+        """
+        reports = []
+        for policy_app_id, retention_days in await Retention.policies(app_id):
+            reports.append(await Retention.apply(policy_app_id, retention_days, dry_run))
+        return reports
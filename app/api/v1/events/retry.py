@@ -0,0 +1,101 @@
+"""
+Delayed-retry and dead-letter handling for events the consumer fails to store.
+
+Transient failures (Neo4j/Mongo timeouts, lost connections) are parked in
+`<queue>.retry.<delay>s` queues whose message TTL dead-letters them back to
+the main queue, with exponentially growing delays. Anything else, or a
+message that exhausted its retries, goes to `<queue>.dead` together with
+the error, where `python -m app.cli.replay_dead_letters` can replay it.
+"""
+import asyncio
+from datetime import datetime, timezone
+import aio_pika
+from neo4j.exceptions import ServiceUnavailable, SessionExpired, TransientError
+from pymongo.errors import AutoReconnect, NetworkTimeout
+from app.core.config import settings
+from app.core.metrics import EVENTS_PARKED
+from app.core.logger import get_logger
+
+logger = get_logger("retry")
+
+TRANSIENT_ERRORS = (
+    TransientError,
+    ServiceUnavailable,
+    SessionExpired,
+    AutoReconnect,
+    NetworkTimeout,
+    asyncio.TimeoutError,
+    ConnectionError,
+)
+
+RETRY_HEADER = "x-retry-count"
+
+def retry_queue_name(delay: int) -> str:
+    return f"{settings.EVENT_QUEUE}.retry.{delay}s"
+
+def dead_letter_queue_name() -> str:
+    return f"{settings.EVENT_QUEUE}.dead"
+
+async def declare_retry_topology(channel: aio_pika.abc.AbstractChannel):
+    """
+    Declares the retry queues and the dead-letter queue.
+    """
+    for delay in settings.EVENT_RETRY_DELAYS:
+        await channel.declare_queue(
+            retry_queue_name(delay),
+            durable=True,
+            arguments={
+                "x-message-ttl": delay * 1000,
+                "x-dead-letter-exchange": "",
+                "x-dead-letter-routing-key": settings.EVENT_QUEUE,
+            },
+        )
+    await channel.declare_queue(dead_letter_queue_name(), durable=True)
+
+def is_transient(error: Exception) -> bool:
+    return isinstance(error, TRANSIENT_ERRORS)
+
+def copy_message(message: aio_pika.abc.AbstractIncomingMessage, headers: dict, body: bytes = None, message_id: str = None) -> aio_pika.Message:
+    return aio_pika.Message(
+        body=message.body if body is None else body,
+        headers=headers,
+        content_type=message.content_type,
+        app_id=message.app_id,
+        message_id=message.message_id if body is None else message_id,
+        timestamp=message.timestamp,
+        delivery_mode=aio_pika.DeliveryMode.PERSISTENT,
+    )
+
+async def park_failed_message(
+    channel: aio_pika.abc.AbstractChannel,
+    message: aio_pika.abc.AbstractIncomingMessage,
+    error: Exception,
+    body: bytes = None,
+    message_id: str = None,
+):
+    """
+    Routes a failed message to the next retry queue, or to the dead-letter queue.
+    `body` parks part of a message instead, e.g. one event of a binary batch,
+    under its own `message_id`.
+    """
+    headers = dict(message.headers or {})
+    attempts = int(headers.get(RETRY_HEADER, 0))
+    delays = settings.EVENT_RETRY_DELAYS
+
+    if is_transient(error) and attempts < len(delays):
+        headers[RETRY_HEADER] = attempts + 1
+        routing_key = retry_queue_name(delays[attempts])
+    else:
+        headers.update({
+            "x-error": str(error)[:1024],
+            "x-error-type": type(error).__name__,
+            "x-failed-at": datetime.now(timezone.utc).isoformat(),
+        })
+        routing_key = dead_letter_queue_name()
+
+    await channel.default_exchange.publish(copy_message(message, headers, body, message_id), routing_key=routing_key)
+    EVENTS_PARKED.inc(routing_key)
+    logger.warning(
+        "Parked message in %s: %s: %s", routing_key, type(error).__name__, error,
+        extra={"app_id": message.app_id, "event_id": message.message_id if body is None else message_id},
+    )
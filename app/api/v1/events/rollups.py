@@ -0,0 +1,99 @@
+"""
+Aggregates maintained by the consumer as it stores events.
+
+Each aggregate keeps pending updates in memory, sees every stored event
+through `observe(event, prev_type, weight)` (`prev_type` is the type of the
+event it was linked after, None for the first event of a session; `weight`
+is how many events a sampled event stands for) and writes its pending
+updates to Mongo in `flush(final)`; `final` is set on shutdown.
+Aggregates with in-memory state may define `restore()`, run at startup,
+and aggregates about recent activity set `live_only` to be skipped when
+historical events are imported.
+Flushes are additive, so several workers can maintain the same aggregate;
+readers merge what they find.
+"""
+import asyncio
+from datetime import date, datetime, timedelta, timezone
+from typing import Optional
+from app.core.config import settings
+from app.core.logger import get_logger
+
+logger = get_logger("rollups")
+
+class Rollups:
+    aggregates: list = []
+
+    @classmethod
+    def register(cls, aggregate):
+        """
+        Class decorator adding an aggregate to the consumer's write path.
+        """
+        cls.aggregates.append(aggregate)
+        return aggregate
+
+    @classmethod
+    def observe(cls, event, prev_type: Optional[str], historical: bool = False, weight: float = 1.0):
+        for aggregate in cls.aggregates:
+            if historical and getattr(aggregate, "live_only", False):
+                continue
+            aggregate.observe(event, prev_type, weight)
+
+    @classmethod
+    async def flush(cls, final: bool = False):
+        for aggregate in cls.aggregates:
+            try:
+                await aggregate.flush(final)
+            except Exception as e:
+                logger.warning("Flushing %s failed, will retry: %r", aggregate.__name__, e)
+
+    @classmethod
+    async def restore(cls):
+        for aggregate in cls.aggregates:
+            if hasattr(aggregate, "restore"):
+                try:
+                    await aggregate.restore()
+                except Exception as e:
+                    logger.warning("Restoring %s failed, starting empty: %r", aggregate.__name__, e)
+
+    @classmethod
+    async def run_flusher(cls):
+        while True:
+            await asyncio.sleep(settings.ROLLUP_FLUSH_SECONDS)
+            await cls.flush()
+
+def escape_key(name: str) -> str:
+    """
+    Makes an event type usable as a Mongo field name.
+    """
+    return name.replace("%", "%25").replace(".", "%2E").replace("$", "%24")
+
+def storable_key(name: str) -> bool:
+    """
+    Whether an event type can become a Mongo field name once escaped.
+    """
+    if not name or "\x00" in name:
+        return False
+    try:
+        name.encode()
+    except UnicodeEncodeError:
+        return False
+    return True
+
+def unescape_key(name: str) -> str:
+    return name.replace("%24", "$").replace("%2E", ".").replace("%25", "%")
+
+def day_of(timestamp: datetime) -> str:
+    """
+    The UTC day bucket of an event; naive timestamps are taken as UTC.
+    """
+    if timestamp.tzinfo is not None:
+        timestamp = timestamp.astimezone(timezone.utc)
+    return timestamp.date().isoformat()
+
+def day_range(start_date: Optional[date], end_date: Optional[date]) -> tuple:
+    """
+    Resolves an inclusive day range, defaulting to the last ROLLUP_DEFAULT_DAYS days.
+    """
+    end_date = end_date or datetime.now(timezone.utc).date()
+    start_date = start_date or end_date - timedelta(days=settings.ROLLUP_DEFAULT_DAYS - 1)
+    return start_date.isoformat(), end_date.isoformat()
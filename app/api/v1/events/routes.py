@@ -1,14 +1,35 @@
+import time
 from fastapi import APIRouter, Depends, Request
-from app.api.v1.sdk.auth import verify_sdk_key
 from app.api.v1.events.models import EventModel
 from app.api.v1.events.services import EventQueue
+from app.api.v1.events.envelope import check_envelope
+from app.api.v1.events.admission import IngestAdmission, ingest_admission
+from app.api.v1.events.quotas import ingest_quota
+from app.api.v1.events.spool import EventSpool
+from app.core.config import settings
 
 event_router = APIRouter()
 
-@event_router.post("/ingest", tags=["Events"])
-async def ingest_event(event: EventModel, app_id: str = Depends(verify_sdk_key)):
+@event_router.post(
+    "/ingest",
+    tags=["Events"],
+    dependencies=[Depends(ingest_admission)],
+    openapi_extra={
+        "requestBody": {
+            "required": True,
+            "content": {"application/json": {"schema": EventModel.model_json_schema()}},
+        }
+    },
+)
+async def ingest_event(request: Request, app_id: str = Depends(ingest_quota)):
     """
-    Receives an event from the SDK and pushes it to RabbitMQ.
+    Receives an event from the SDK and forwards the raw body to RabbitMQ.
+    The body is only envelope-checked here; the consumer validates its fields.
     """
-    event.app_id = app_id  # Associate event with the authenticated app
-    return await EventQueue.push_event(event)
\ No newline at end of file
+    received_at = time.time()
+    body = await request.body()
+    event_id = check_envelope(body)
+    async with IngestAdmission.admit():
+        if settings.SPOOL_ENABLED:
+            return await EventSpool.publish_or_spool(body, app_id, event_id, received_at)
+        return await EventQueue.push_raw_event(body, app_id, event_id, received_at)
@@ -0,0 +1,135 @@
+"""
+Server-side sampling of high-volume event types.
+
+An app's `sampling_rules` (set with `PUT /apps/{app_id}/sampling`) give, per
+event type, the share of sessions whose events of that type are stored;
+`"*"` covers types without a rule of their own:
+
+    [{"event_type": "mousemove", "rate": 0.01},
+     {"event_type": "scroll", "rate": 1.0, "max_events_per_second": 200}]
+
+A rule with `max_events_per_second` is adaptive: the consumer keeps an EWMA
+of each matching type's arrival rate and lowers the rate so stored events
+stay near the target, never above `rate` nor below `SAMPLING_MIN_RATE`.
+The target is split evenly across the processes consuming events: the
+`API_WORKERS` uvicorn workers when the consumer is embedded in the API, the
+`app.worker` processes otherwise.
+
+Decisions hash the client session id, so a session keeps all or none of its
+events of a type and the flows of kept sessions stay intact. Stored events
+carry `weight = 1 / rate` (no weight means 1). Exact queries sum weights
+instead of counting, distinct-session counts weigh each session once
+(Horvitz-Thompson) and rollups observe events with their weight, so counts
+stay unbiased estimates while writes drop by the sampling rate.
+
+Rules are cached per consumer for `SAMPLING_RULES_TTL_SECONDS`.
+"""
+import hashlib
+import time
+from typing import Optional
+from app.core.config import settings
+from app.core.database import MongoDB
+from app.core.metrics import EVENTS_SAMPLED_OUT
+
+ALL_TYPES = "*"
+MAX_ADAPTIVE_SERIES = 10_000
+
+def session_fraction(session_id: str) -> float:
+    """
+    Maps a session id uniformly onto [0, 1). Personalized so it is
+    independent of the session sketches' hash of the same id.
+    """
+    digest = hashlib.blake2b(session_id.encode(), digest_size=8, person=b"sampling").digest()
+    return int.from_bytes(digest, "big") / 2.0 ** 64
+
+def consumer_processes() -> int:
+    """
+    The number of processes consuming events alongside this one.
+    """
+    processes = settings.API_WORKERS if settings.EMBEDDED_CONSUMER else settings.WORKER_PROCESSES
+    return max(processes, 1)
+
+class ArrivalRate:
+    """
+    EWMA of events per second, updated once per `SAMPLING_WINDOW_SECONDS`.
+    """
+    __slots__ = ("events_per_second", "count", "window_start")
+
+    def __init__(self, now: float):
+        self.events_per_second = 0.0
+        self.count = 0
+        self.window_start = now
+
+    def observe(self, now: float) -> float:
+        self.count += 1
+        elapsed = now - self.window_start
+        if elapsed >= settings.SAMPLING_WINDOW_SECONDS:
+            measured = self.count / elapsed
+            if self.events_per_second:
+                alpha = settings.SAMPLING_EWMA_ALPHA
+                measured = alpha * measured + (1 - alpha) * self.events_per_second
+            self.events_per_second = measured
+            self.count = 0
+            self.window_start = now
+        # Until the first window closes, the partial window's rate; weights keep
+        # estimates unbiased whatever rate this yields
+        return self.events_per_second or self.count / max(elapsed, 0.001)
+
+class Sampler:
+    # app_id -> (loaded at, {event_type: rule})
+    rules: dict = {}
+    # (app_id, event_type) -> ArrivalRate of events under an adaptive rule
+    arrivals: dict = {}
+
+    @classmethod
+    async def rules_for(cls, app_id: str) -> dict:
+        now = time.monotonic()
+        cached = cls.rules.get(app_id)
+        if cached is not None and now - cached[0] < settings.SAMPLING_RULES_TTL_SECONDS:
+            return cached[1]
+        app = await MongoDB.get_db().apps.find_one({"app_id": app_id})
+        rules = {rule["event_type"]: rule for rule in (app or {}).get("sampling_rules") or []}
+        cls.rules[app_id] = (now, rules)
+        return rules
+
+    @classmethod
+    def rate(cls, app_id: str, event_type: str, rule: dict) -> float:
+        """
+        The share of sessions to keep for the rule, lowered while an adaptive
+        rule's type arrives faster than its target.
+        """
+        rate = rule.get("rate") or 1.0
+        target = rule.get("max_events_per_second")
+        if not target:
+            return rate
+
+        now = time.monotonic()
+        key = (app_id, event_type)
+        arrival = cls.arrivals.get(key)
+        if arrival is None:
+            if len(cls.arrivals) >= MAX_ADAPTIVE_SERIES:
+                cls.arrivals.clear()
+            arrival = cls.arrivals[key] = ArrivalRate(now)
+        events_per_second = arrival.observe(now)
+
+        target /= consumer_processes()
+        if events_per_second > target:
+            rate = min(rate, target / events_per_second)
+        return max(rate, settings.SAMPLING_MIN_RATE)
+
+    @classmethod
+    async def weight(cls, app_id: str, event_type: str, client_session_id: str) -> Optional[float]:
+        """
+        The weight to store an event with, or None when it is sampled out.
+        """
+        rules = await cls.rules_for(app_id)
+        rule = rules.get(event_type) or rules.get(ALL_TYPES)
+        if rule is None:
+            return 1.0
+        rate = cls.rate(app_id, event_type, rule)
+        if rate >= 1:
+            return 1.0
+        if session_fraction(client_session_id) >= rate:
+            EVENTS_SAMPLED_OUT.inc()
+            return None
+        return 1 / rate
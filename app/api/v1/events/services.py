@@ -1,24 +1,96 @@
-import json
+import asyncio
+import time
 import aio_pika
+from typing import List
 from app.core.config import settings
-from app.api.v1.events.models import EventModel
-from fastapi.encoders import jsonable_encoder
+from app.api.v1.events import codec
+from app.core.metrics import INGEST_PUBLISH_LATENCY, timed
+
+# Epoch seconds when the API accepted the event; the consumer uses it as the
+# timestamp of events sent without one, however late they are delivered
+RECEIVED_AT_HEADER = "x-received-at"
 
 class EventQueue:
-    @staticmethod
-    async def push_event(event: EventModel):
-        """
-        Push event into RabbitMQ queue for async processing.
-        """
-        connection = await aio_pika.connect_robust(settings.RABBITMQ_URL)
-        async with connection:
-            channel = await connection.channel()
-            queue = await channel.declare_queue("event_queue", durable=True)
-
-            event_data = json.dumps(jsonable_encoder(event.model_dump()))
-            await channel.default_exchange.publish(
-                aio_pika.Message(body=event_data.encode(), delivery_mode=aio_pika.DeliveryMode.PERSISTENT),
-                routing_key=queue.name,
-            )
-        
-        return {"message": "Event queued successfully", "event_id": event.event_id}
+    connection: aio_pika.abc.AbstractRobustConnection = None
+    channel: aio_pika.abc.AbstractChannel = None
+    _lock: asyncio.Lock = None
+
+    @classmethod
+    async def get_channel(cls):
+        """
+        Return a shared publishing channel, opening the connection on first use.
+        """
+        if cls.channel is not None and not cls.channel.is_closed:
+            return cls.channel
+
+        if cls._lock is None:
+            cls._lock = asyncio.Lock()
+
+        async with cls._lock:
+            if cls.channel is None or cls.channel.is_closed:
+                if cls.connection is None or cls.connection.is_closed:
+                    cls.connection = await aio_pika.connect_robust(settings.RABBITMQ_URL)
+                cls.channel = await cls.connection.channel()
+                await cls.channel.declare_queue(settings.EVENT_QUEUE, durable=True)
+
+        return cls.channel
+
+    @classmethod
+    async def close(cls):
+        """
+        Close the shared publishing connection.
+        """
+        if cls.connection is not None and not cls.connection.is_closed:
+            await cls.connection.close()
+        cls.connection = None
+        cls.channel = None
+
+    @classmethod
+    @timed(INGEST_PUBLISH_LATENCY)
+    async def push_raw_event(cls, body: bytes, app_id: str, event_id: str, received_at: float = None):
+        """
+        Publish the SDK request body untouched, tagged with the authenticated app_id
+        and the time the API received it.
+        """
+        now = time.time()
+        if settings.QUEUE_MESSAGE_FORMAT == "binary":
+            await cls.push_raw_events([codec.RawEvent(body, app_id, event_id, received_at or now)])
+            return {"message": "Event queued successfully", "event_id": event_id}
+
+        channel = await cls.get_channel()
+        await channel.default_exchange.publish(
+            aio_pika.Message(
+                body=body,
+                headers={"x-published-at": now, RECEIVED_AT_HEADER: received_at or now},
+                content_type=codec.CONTENT_TYPE_JSON,
+                app_id=app_id,
+                message_id=event_id,
+                delivery_mode=aio_pika.DeliveryMode.PERSISTENT,
+            ),
+            routing_key=settings.EVENT_QUEUE,
+        )
+
+        return {"message": "Event queued successfully", "event_id": event_id}
+
+    @classmethod
+    async def push_raw_events(cls, events: List[codec.RawEvent]):
+        """
+        Publish raw events in bulk: one binary message for the whole batch,
+        compressed when large, or one JSON message per event.
+        """
+        if settings.QUEUE_MESSAGE_FORMAT != "binary":
+            await asyncio.gather(*(cls.push_raw_event(*event) for event in events))
+            return
+
+        body = codec.encode(events, compress_min_bytes=settings.QUEUE_COMPRESS_MIN_BYTES)
+        channel = await cls.get_channel()
+        await channel.default_exchange.publish(
+            aio_pika.Message(
+                body=body,
+                content_type=codec.CONTENT_TYPE_BINARY,
+                headers={"x-envelope-version": codec.VERSION, "x-published-at": time.time()},
+                message_id=events[0].event_id if len(events) == 1 else None,
+                delivery_mode=aio_pika.DeliveryMode.PERSISTENT,
+            ),
+            routing_key=settings.EVENT_QUEUE,
+        )
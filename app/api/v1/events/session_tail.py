@@ -0,0 +1,124 @@
+"""
+Consumer-side cache of the last stored event of each session.
+
+With a cached tail, a new event is appended with a direct indexed MATCH on
+the previous event_id instead of walking `LAST_EVENT`, and the
+`LAST_EVENT` pointer is moved later in one batched write. A guard on the
+append (`NOT (prev)-[:NEXT]->()`) detects tails that another worker has
+already extended; those, like cache misses, fall back to the graph.
+"""
+import asyncio
+from collections import OrderedDict
+from app.core.config import settings
+from app.core.database import Neo4jDB
+from app.core.metrics import NEO4J_WRITE_LATENCY
+from app.core.logger import get_logger
+
+logger = get_logger("session_tail")
+
+FLUSH_LAST_EVENT_QUERY = """
+UNWIND $rows AS row
+MATCH (s:Session {session_id: row.session_id})
+MATCH (e:Event {app_id: s.app_id, event_id: row.event_id})
+OPTIONAL MATCH (s)-[old:LAST_EVENT]->()
+DELETE old
+MERGE (s)-[:LAST_EVENT]->(e)
+"""
+
+# Finds cached tails that are no longer the end of their chain
+RECONCILE_QUERY = """
+UNWIND $rows AS row
+MATCH (s:Session {session_id: row.session_id})
+MATCH (e:Event {app_id: s.app_id, event_id: row.event_id})-[:NEXT]->()
+RETURN row.session_id AS session_id
+"""
+
+class SessionTailCache:
+    tails: OrderedDict = OrderedDict()
+    dirty: dict = {}
+    stale: int = 0
+    _reconcile_cursor: int = 0
+
+    @classmethod
+    def get(cls, session_id: str):
+        event_id = cls.tails.get(session_id)
+        if event_id is not None:
+            cls.tails.move_to_end(session_id)
+        return event_id
+
+    @classmethod
+    def put(cls, session_id: str, event_id: str, dirty: bool = False):
+        """
+        Records the new tail; `dirty` tails still need their LAST_EVENT pointer moved.
+        """
+        cls.tails[session_id] = event_id
+        cls.tails.move_to_end(session_id)
+        if len(cls.tails) > settings.SESSION_TAIL_CACHE_SIZE:
+            cls.tails.popitem(last=False)
+        if dirty:
+            cls.dirty[session_id] = event_id
+        else:
+            cls.dirty.pop(session_id, None)
+
+    @classmethod
+    def discard(cls, session_id: str):
+        cls.tails.pop(session_id, None)
+        cls.stale += 1
+
+    @classmethod
+    async def flush(cls):
+        """
+        Moves the LAST_EVENT pointer of every dirty session in one write.
+        """
+        if not cls.dirty:
+            return
+        rows = [{"session_id": s, "event_id": e} for s, e in cls.dirty.items()]
+        cls.dirty = {}
+        try:
+            with NEO4J_WRITE_LATENCY.time("last_event_flush"):
+                async with Neo4jDB.get_driver().session() as neo4j_session:
+                    await (await neo4j_session.run(FLUSH_LAST_EVENT_QUERY, rows=rows)).consume()
+        except Exception:
+            # Keep newer tails recorded while the write was in flight
+            for row in rows:
+                cls.dirty.setdefault(row["session_id"], row["event_id"])
+            raise
+
+    @classmethod
+    async def reconcile(cls):
+        """
+        Checks a slice of cached tails against the graph and drops stale ones.
+        """
+        items = list(cls.tails.items())
+        if not items:
+            return
+        start = cls._reconcile_cursor % len(items)
+        chunk = items[start:start + settings.SESSION_TAIL_RECONCILE_BATCH]
+        cls._reconcile_cursor = start + len(chunk)
+
+        rows = [{"session_id": s, "event_id": e} for s, e in chunk]
+        async with Neo4jDB.get_driver().session() as neo4j_session:
+            result = await neo4j_session.run(RECONCILE_QUERY, rows=rows)
+            stale = [record["session_id"] async for record in result]
+
+        for session_id in stale:
+            cls.discard(session_id)
+
+    @classmethod
+    async def run_maintenance(cls):
+        """
+        Periodically flushes LAST_EVENT pointers and reconciles cached tails.
+        """
+        last_reconcile = asyncio.get_running_loop().time()
+        while True:
+            await asyncio.sleep(settings.SESSION_TAIL_FLUSH_SECONDS)
+            try:
+                await cls.flush()
+                now = asyncio.get_running_loop().time()
+                if now - last_reconcile >= settings.SESSION_TAIL_RECONCILE_SECONDS:
+                    last_reconcile = now
+                    await cls.reconcile()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning("Session tail maintenance failed: %r", e)
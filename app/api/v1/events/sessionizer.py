@@ -0,0 +1,98 @@
+"""
+Server-side sessionization of SDK session ids.
+
+The SDK's `session_id` lives as long as the browser tab, so the consumer
+splits it into server sessions whenever the gap between two events exceeds
+`SESSION_INACTIVITY_SECONDS`. The first server session keeps the client's
+id, later ones are `<client id>#<n>`, and every `Session` node records its
+`client_session_id` and `segment`.
+
+The per-session analytics routes and GraphQL fields (flow, latest event,
+counts, conversion funnel) take either kind of id: an SDK session id covers
+all of its server sessions, as it did before sessions were split, while a
+`<client id>#<n>` id selects that one server session.
+
+Per-client state (current segment, newest timestamp) is kept in a bounded
+LRU table. On a miss the state is rebuilt from the graph, so an evicted or
+restarted worker continues the client's latest segment instead of
+restarting at 0.
+"""
+from collections import OrderedDict
+from datetime import datetime
+from typing import NamedTuple
+from app.core.config import settings
+from app.core.database import Neo4jDB
+
+# Latest segment of a client session, legacy sessions included (no
+# client_session_id, stored under the client's id), and the time of its tail
+# (kept on the session once retention has compacted its events)
+LATEST_SEGMENT_QUERY = """
+CALL {
+    MATCH (s:Session {client_session_id: $client_session_id}) RETURN s
+    UNION
+    MATCH (s:Session {session_id: $client_session_id}) RETURN s
+}
+WITH s WHERE s.app_id = $app_id OR s.app_id IS NULL
+WITH s ORDER BY coalesce(s.segment, 0) DESC LIMIT 1
+OPTIONAL MATCH (s)-[:LAST_EVENT]->(pointer:Event)
+OPTIONAL MATCH (pointer)-[:NEXT*0..]->(last_event:Event)
+WHERE NOT (last_event)-[:NEXT]->()
+RETURN coalesce(s.segment, 0) AS segment, coalesce(last_event.timestamp, s.last_timestamp) AS last_timestamp
+"""
+
+class ServerSession(NamedTuple):
+    session_id: str
+    client_session_id: str
+    segment: int
+
+def server_session_id(client_session_id: str, segment: int) -> str:
+    return client_session_id if segment == 0 else f"{client_session_id}#{segment}"
+
+class Sessionizer:
+    # (app_id, client session id) -> [segment, newest event time as epoch seconds]
+    clients: OrderedDict = OrderedDict()
+    lookups: int = 0
+    splits: int = 0
+
+    @classmethod
+    async def assign(cls, app_id: str, client_session_id: str, timestamp: datetime) -> ServerSession:
+        """
+        Returns the server session an event belongs to, opening a new segment
+        after an inactivity gap. Late events stay in the current segment.
+        """
+        key = (app_id, client_session_id)
+        at = timestamp.timestamp()
+        state = cls.clients.get(key)
+        if state is None:
+            state = await cls._load(app_id, client_session_id)
+        else:
+            cls.clients.move_to_end(key)
+
+        if state is None:
+            state = [0, at]
+        elif at - (state[1] or at) > settings.SESSION_INACTIVITY_SECONDS:
+            state = [state[0] + 1, at]
+            cls.splits += 1
+        else:
+            state[1] = max(state[1] or at, at)
+
+        cls.clients[key] = state
+        if len(cls.clients) > settings.SESSIONIZER_TABLE_SIZE:
+            cls.clients.popitem(last=False)
+        return ServerSession(server_session_id(client_session_id, state[0]), client_session_id, state[0])
+
+    @classmethod
+    async def _load(cls, app_id: str, client_session_id: str):
+        """
+        Rebuilds a client's state from its newest stored segment, if any.
+        """
+        cls.lookups += 1
+        async with Neo4jDB.get_driver().session() as neo4j_session:
+            result = await neo4j_session.run(
+                LATEST_SEGMENT_QUERY, app_id=app_id, client_session_id=client_session_id
+            )
+            record = await result.single()
+        if record is None:
+            return None
+        last_timestamp = record["last_timestamp"]
+        return [record["segment"], datetime.fromisoformat(last_timestamp).timestamp() if last_timestamp else None]
@@ -0,0 +1,173 @@
+"""
+HyperLogLog sketches of distinct sessions per app, day and event type.
+
+The consumer adds every stored event's session to the sketch of its event
+type and to the app's `"*"` sketch (all types). Sketches are stored as one
+Mongo document per app, day and type:
+
+    {"app_id": ..., "day": "2025-01-31", "event_type": "click", "registers": <zlib bytes>, "version": n}
+
+Flushes read, merge and write back with a version check, so concurrent
+workers never lose each other's updates. Merging is a register-wise max,
+so the union of any set of sketches (a date range, several apps) has the
+same error as a single one: with p=12 (4096 registers) the standard error
+is 1.04/sqrt(4096) ~= 1.6%, i.e. about 95% of estimates are within 3.3%.
+Sessions seen on several days are counted once.
+
+Sampled event types (see `sampling`) also add their events' weights to
+`weight_sum` and `observed`, and their estimates are scaled by the mean
+weight, which is exact for fixed rates and approximate while adaptive
+rates move. The `"*"` sketches are not scaled: nearly every session has
+some unsampled event.
+"""
+import hashlib
+import math
+import zlib
+from datetime import date
+from typing import Optional
+from bson import Binary
+from app.core.database import MongoDB
+from app.api.v1.events.rollups import Rollups, day_of
+
+ALL_TYPES = "*"
+PRECISION = 12
+REGISTERS = 1 << PRECISION
+RELATIVE_ERROR = round(1.04 / math.sqrt(REGISTERS), 4)
+MAX_FLUSH_ATTEMPTS = 5
+
+class HyperLogLog:
+    __slots__ = ("registers",)
+
+    def __init__(self, registers: bytes = None):
+        self.registers = bytearray(registers) if registers else bytearray(REGISTERS)
+
+    def add(self, value: str):
+        # Stable across processes, unlike hash(), so stored sketches merge
+        h = int.from_bytes(hashlib.blake2b(value.encode(), digest_size=8).digest(), "big")
+        index = h >> (64 - PRECISION)
+        rest = h & ((1 << (64 - PRECISION)) - 1)
+        rank = (64 - PRECISION) - rest.bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def merge(self, other: "HyperLogLog"):
+        self.registers = bytearray(map(max, self.registers, other.registers))
+        return self
+
+    def count(self) -> int:
+        registers = self.registers
+        estimate = (0.7213 / (1 + 1.079 / REGISTERS)) * REGISTERS ** 2 / sum(2.0 ** -r for r in registers)
+        zeros = registers.count(0)
+        if estimate <= 2.5 * REGISTERS and zeros:
+            # Linear counting is more accurate for small cardinalities
+            estimate = REGISTERS * math.log(REGISTERS / zeros)
+        return round(estimate)
+
+    def dump(self) -> Binary:
+        return Binary(zlib.compress(bytes(self.registers)))
+
+    @classmethod
+    def load(cls, data: bytes) -> "HyperLogLog":
+        return cls(zlib.decompress(data))
+
+@Rollups.register
+class SessionSketches:
+    # (app_id, day, event_type) -> HyperLogLog of session ids
+    pending: dict = {}
+    # (app_id, day, event_type) -> [weight sum, events] of sampled events
+    weights: dict = {}
+
+    @classmethod
+    def observe(cls, event, prev_type: Optional[str], weight: float = 1.0):
+        day = day_of(event.timestamp)
+        for event_type in (event.event_type, ALL_TYPES):
+            key = (event.app_id, day, event_type)
+            sketch = cls.pending.get(key)
+            if sketch is None:
+                sketch = cls.pending[key] = HyperLogLog()
+            sketch.add(event.session_id)
+
+        key = (event.app_id, day, event.event_type)
+        totals = cls.weights.get(key)
+        if totals is not None:
+            totals[0] += weight
+            totals[1] += 1
+        elif weight != 1:
+            # Unsampled events before the first sampled one of the day are not
+            # counted, which only matters when a type's rule changes mid-day
+            cls.weights[key] = [weight, 1]
+
+    @classmethod
+    async def flush(cls, final: bool = False):
+        pending, cls.pending = cls.pending, {}
+        weights, cls.weights = cls.weights, {}
+        collection = MongoDB.get_db().session_sketches
+        try:
+            while pending:
+                key, sketch = next(iter(pending.items()))
+                await cls._merge_into(collection, key, sketch, weights.pop(key, None))
+                del pending[key]
+        except Exception:
+            # Merging is idempotent, so re-flushing an applied sketch is harmless
+            for key, sketch in pending.items():
+                current = cls.pending.get(key)
+                cls.pending[key] = current.merge(sketch) if current else sketch
+            for key, (weight_sum, observed) in weights.items():
+                totals = cls.weights.setdefault(key, [0.0, 0])
+                totals[0] += weight_sum
+                totals[1] += observed
+            raise
+
+    @staticmethod
+    async def _merge_into(collection, key: tuple, sketch: HyperLogLog, weights: Optional[list]):
+        app_id, day, event_type = key
+        query = {"app_id": app_id, "day": day, "event_type": event_type}
+        for _ in range(MAX_FLUSH_ATTEMPTS):
+            doc = await collection.find_one(query)
+            if doc is None:
+                doc = {**query, "registers": sketch.dump(), "version": 1}
+                if weights:
+                    doc.update(weight_sum=weights[0], observed=weights[1])
+                await collection.insert_one(doc)
+                return
+            merged = HyperLogLog.load(doc["registers"]).merge(sketch)
+            update = {"$set": {"registers": merged.dump(), "version": doc["version"] + 1}}
+            if weights:
+                update["$inc"] = {"weight_sum": weights[0], "observed": weights[1]}
+            result = await collection.update_one({**query, "version": doc["version"]}, update)
+            if result.matched_count:
+                return
+        raise RuntimeError(f"Sketch {key} kept changing during {MAX_FLUSH_ATTEMPTS} flush attempts")
+
+async def count_sessions(event_types: list, app_id: str = None, start_date: date = None, end_date: date = None) -> dict:
+    """
+    Estimated distinct sessions per event type over an optional app and
+    inclusive day range, scaled up for sampled types.
+    """
+    query = {"event_type": {"$in": event_types}}
+    if app_id:
+        query["app_id"] = app_id
+    days = {}
+    if start_date:
+        days["$gte"] = start_date.isoformat()
+    if end_date:
+        days["$lte"] = end_date.isoformat()
+    if days:
+        query["day"] = days
+
+    merged = {event_type: HyperLogLog() for event_type in event_types}
+    weights = {event_type: [0.0, 0] for event_type in event_types}
+    cursor = MongoDB.get_db().session_sketches.find(
+        query, {"event_type": 1, "registers": 1, "weight_sum": 1, "observed": 1}
+    )
+    for doc in await cursor.to_list(None):
+        merged[doc["event_type"]].merge(HyperLogLog.load(doc["registers"]))
+        if doc.get("observed") and doc["event_type"] != ALL_TYPES:
+            weights[doc["event_type"]][0] += doc["weight_sum"]
+            weights[doc["event_type"]][1] += doc["observed"]
+
+    counts = {}
+    for event_type, sketch in merged.items():
+        weight_sum, observed = weights[event_type]
+        counts[event_type] = round(sketch.count() * weight_sum / observed) if observed else sketch.count()
+    return counts
@@ -0,0 +1,385 @@
+"""
+Local write-ahead spool for ingest when RabbitMQ is unavailable or slow.
+
+Accepted events are appended to memory-mapped, size-rotated segment files
+in a directory owned by the API process:
+
+    <SPOOL_DIR>/<pid>/.lock        flock held while the process runs
+    <SPOOL_DIR>/<pid>/<seq>.open   the active segment, preallocated and mmap'ed
+    <SPOOL_DIR>/<pid>/<seq>.seg    sealed segments waiting to be drained
+    <SPOOL_DIR>/<pid>/<seq>.ack    byte offset already replayed from a sealed segment
+
+Uvicorn workers share `SPOOL_DIR`, so a process only touches directories
+whose lock it can take: its own, and those of stopped processes, whose
+segments it seals and adopts into its own directory. Segments directly in
+`SPOOL_DIR`, from before spools were per process, are adopted the same way
+under `<SPOOL_DIR>/.lock`; this assumes workers of that older version have
+stopped, as they do when uvicorn restarts. `SPOOL_MAX_BYTES` bounds each
+process's spool, so `SPOOL_DIR` needs room for API_WORKERS times as much.
+
+While a process has spooled events, it spools new ones too, so none of them
+overtakes an older event of its session. The drainer replays segments until
+the spool is empty, including events spooled while it ran, and only then
+does ingest publish directly again.
+
+Each record is `body length u32 | crc32 u32 | received_at f64 |
+app_id length u8 | event_id length u8 | app_id | event_id | body`, where
+`received_at` is the epoch time the API accepted the event. A zero length
+marks the end of the written part of a preallocated segment.
+"""
+import asyncio
+import fcntl
+import mmap
+import os
+import struct
+import zlib
+from fastapi import HTTPException
+from app.core.config import settings
+from app.api.v1.events.codec import RawEvent
+from app.api.v1.events.services import EventQueue
+from app.core.metrics import INGEST_SPOOLED, Gauge
+from app.core.logger import get_logger
+
+logger = get_logger("spool")
+
+RECORD_HEADER = struct.Struct(">IIdBB")
+RECEIVED_AT = struct.Struct(">d")
+
+def _checksum(received_at: float, app: bytes, event: bytes, body: bytes) -> int:
+    return zlib.crc32(body, zlib.crc32(event, zlib.crc32(app, zlib.crc32(RECEIVED_AT.pack(received_at)))))
+
+def _encode_record(body: bytes, app_id: str, event_id: str, received_at: float) -> bytes:
+    app = app_id.encode()[:255]
+    event = event_id.encode()[:255]
+    crc = _checksum(received_at, app, event, body)
+    return RECORD_HEADER.pack(len(body), crc, received_at, len(app), len(event)) + app + event + body
+
+def read_records(buffer, start: int = 0):
+    """
+    Yields `(end_offset, body, app_id, event_id, received_at)` for every
+    intact record. Stops at the first zero-length or corrupt record.
+    """
+    pos = start
+    size = len(buffer)
+    while pos + RECORD_HEADER.size <= size:
+        body_len, crc, received_at, app_len, event_len = RECORD_HEADER.unpack_from(buffer, pos)
+        if body_len == 0:
+            return
+        head = pos + RECORD_HEADER.size
+        end = head + app_len + event_len + body_len
+        if end > size:
+            return
+        app = bytes(buffer[head:head + app_len])
+        event = bytes(buffer[head + app_len:head + app_len + event_len])
+        body = bytes(buffer[head + app_len + event_len:end])
+        if _checksum(received_at, app, event, body) != crc:
+            return
+        yield end, body, app.decode(), event.decode(), received_at
+        pos = end
+
+class SpoolSegment:
+    """
+    The active, memory-mapped segment that records are appended to.
+    """
+    def __init__(self, path: str, size: int):
+        self.path = path
+        self.size = size
+        self.offset = 0
+        self._file = open(path, "w+b")
+        self._file.truncate(size)
+        self._map = mmap.mmap(self._file.fileno(), size)
+
+    def append(self, record: bytes) -> bool:
+        # Keep room for a zero terminator so readers can always find the end
+        if self.offset + len(record) + RECORD_HEADER.size > self.size:
+            return False
+        self._map[self.offset:self.offset + len(record)] = record
+        self.offset += len(record)
+        return True
+
+    def flush(self):
+        self._map.flush()
+
+    def seal(self) -> str:
+        """
+        Flushes, trims the preallocated tail and renames the segment for draining.
+        """
+        self._map.flush()
+        self._map.close()
+        self._file.truncate(self.offset)
+        self._file.close()
+        sealed = self.path[:-len(".open")] + ".seg"
+        os.replace(self.path, sealed)
+        return sealed
+
+def try_lock(directory: str):
+    """
+    The directory's lock file, locked exclusively, or None when another process holds it.
+    """
+    try:
+        lock = open(os.path.join(directory, ".lock"), "a+")
+    except FileNotFoundError:
+        # Removed by a process that adopted it meanwhile
+        return None
+    try:
+        fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        lock.close()
+        return None
+    return lock
+
+class EventSpool:
+    directory: str = None
+    _lock = None
+    active: SpoolSegment = None
+    sealed: list = []
+    sealed_bytes: int = 0
+    next_seq: int = 0
+    spooled: int = 0
+    replayed: int = 0
+    duplicates: int = 0
+    _drainer: asyncio.Task = None
+
+    @classmethod
+    def open(cls):
+        """
+        Locks this process's spool directory and adopts segments left by stopped processes.
+        """
+        root = settings.SPOOL_DIR
+        directory = os.path.join(root, str(os.getpid()))
+        os.makedirs(directory, exist_ok=True)
+        lock = try_lock(directory)
+        if lock is None:
+            raise RuntimeError(f"Spool directory {directory} is locked by another process")
+        cls.directory, cls._lock = directory, lock
+
+        # Left by an earlier process with the same pid
+        for name in sorted(os.listdir(directory)):
+            if name.endswith(".open"):
+                cls._recover(os.path.join(directory, name))
+        cls.sealed = sorted(
+            os.path.join(directory, name) for name in os.listdir(directory) if name.endswith(".seg")
+        )
+        if cls.sealed:
+            cls.next_seq = int(os.path.basename(cls.sealed[-1]).split(".")[0]) + 1
+
+        for name in sorted(os.listdir(root)):
+            path = os.path.join(root, name)
+            if path != directory and os.path.isdir(path):
+                cls._adopt(path)
+        cls._adopt(root)
+        cls.sealed_bytes = sum(os.path.getsize(path) for path in cls.sealed)
+
+    @classmethod
+    def _adopt(cls, path: str):
+        """
+        Moves the segments of a directory no live process holds into this process's directory.
+        """
+        lock = try_lock(path)
+        if lock is None:
+            return
+        try:
+            for name in sorted(os.listdir(path)):
+                if name.endswith(".open"):
+                    cls._recover(os.path.join(path, name))
+            for name in sorted(os.listdir(path)):
+                if not name.endswith(".seg"):
+                    continue
+                seq = name[:-len(".seg")]
+                target = os.path.join(cls.directory, f"{cls.next_seq:012d}")
+                cls.next_seq += 1
+                ack_path = os.path.join(path, f"{seq}.ack")
+                if os.path.exists(ack_path):
+                    os.replace(ack_path, f"{target}.ack")
+                os.replace(os.path.join(path, name), f"{target}.seg")
+                cls.sealed.append(f"{target}.seg")
+                logger.info("Adopted spool segment %s as %s", os.path.join(path, name), f"{target}.seg")
+            if path != settings.SPOOL_DIR:
+                os.remove(os.path.join(path, ".lock"))
+                try:
+                    os.rmdir(path)
+                except OSError:
+                    pass
+        finally:
+            lock.close()
+
+    @classmethod
+    def _recover(cls, path: str):
+        """
+        Seals a segment that was still open when the process stopped.
+        """
+        with open(path, "r+b") as f:
+            data = f.read()
+            end = 0
+            for end, *_ in read_records(data):
+                pass
+            f.truncate(end)
+        if end:
+            os.replace(path, path[:-len(".open")] + ".seg")
+        else:
+            os.remove(path)
+
+    @classmethod
+    def pending(cls) -> bool:
+        """
+        True while spooled events are waiting to be replayed.
+        """
+        return bool(cls.sealed) or (cls.active is not None and cls.active.offset > 0)
+
+    @classmethod
+    def append(cls, body: bytes, app_id: str, event_id: str, received_at: float) -> bool:
+        """
+        Appends an event to the active segment. Returns False when the disk budget is exhausted.
+        """
+        if cls.directory is None:
+            cls.open()
+
+        record = _encode_record(body, app_id, event_id, received_at)
+        active_bytes = cls.active.offset if cls.active else 0
+        if cls.sealed_bytes + active_bytes + len(record) > settings.SPOOL_MAX_BYTES:
+            return False
+
+        if cls.active is None or not cls.active.append(record):
+            if cls.active is not None:
+                cls._seal_active()
+            size = max(settings.SPOOL_SEGMENT_BYTES, len(record) + RECORD_HEADER.size)
+            cls.active = SpoolSegment(os.path.join(cls.directory, f"{cls.next_seq:012d}.open"), size)
+            cls.next_seq += 1
+            cls.active.append(record)
+
+        cls.spooled += 1
+        INGEST_SPOOLED.inc()
+        return True
+
+    @classmethod
+    def _seal_active(cls):
+        sealed = cls.active.seal()
+        cls.sealed.append(sealed)
+        cls.sealed_bytes += cls.active.offset
+        cls.active = None
+
+    @classmethod
+    async def publish_or_spool(cls, body: bytes, app_id: str, event_id: str, received_at: float):
+        """
+        Publishes an event, falling back to the spool when the broker fails or is slow.
+        While older events are spooled, new ones are spooled too to keep session order.
+        """
+        if not cls.pending():
+            try:
+                return await asyncio.wait_for(
+                    EventQueue.push_raw_event(body, app_id, event_id, received_at),
+                    timeout=settings.SPOOL_PUBLISH_TIMEOUT,
+                )
+            except Exception as e:
+                logger.warning("Publishing event failed, spooling it: %r", e, extra={"app_id": app_id, "event_id": event_id})
+
+        if not cls.append(body, app_id, event_id, received_at):
+            raise HTTPException(
+                status_code=503,
+                detail="Event pipeline unavailable, retry later",
+                headers={"Retry-After": str(settings.INGEST_RETRY_AFTER_BACKLOG)},
+            )
+
+        return {"message": "Event accepted for delayed processing", "event_id": event_id}
+
+    @classmethod
+    def start_drainer(cls):
+        """
+        Starts the background task that replays spooled events into the queue.
+        """
+        if cls.directory is None:
+            cls.open()
+        if cls._drainer is None or cls._drainer.done():
+            cls._drainer = asyncio.create_task(cls._drain_forever())
+
+    @classmethod
+    async def stop_drainer(cls):
+        """
+        Stops the drainer and makes the active segment durable.
+        """
+        if cls._drainer is not None:
+            cls._drainer.cancel()
+            try:
+                await cls._drainer
+            except asyncio.CancelledError:
+                pass
+            cls._drainer = None
+        if cls.active is not None:
+            cls.active.flush()
+
+    @classmethod
+    async def _drain_forever(cls):
+        while True:
+            await asyncio.sleep(settings.SPOOL_DRAIN_INTERVAL)
+            if cls.active is not None:
+                cls.active.flush()
+            if not cls.pending():
+                continue
+            try:
+                await cls.drain()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning("Spool drain interrupted, will retry: %r", e)
+
+    @classmethod
+    async def drain(cls):
+        """
+        Replays spooled events in order, in bulk, until none are left. Events
+        spooled while a segment is replayed go to a new one, which is sealed
+        and replayed next; the spool is empty once a pass ends with nothing
+        new, and the next event is published directly, after all spooled ones.
+
+        Repeated event_ids (SDK retries during an outage) are skipped within a
+        drain only; repeats across drains are left to the consumer's dedup.
+        """
+        seen = set()
+        while cls.pending():
+            if cls.active is not None and cls.active.offset > 0:
+                cls._seal_active()
+            await cls._drain_sealed(seen)
+
+    @classmethod
+    async def _drain_sealed(cls, seen: set):
+        while cls.sealed:
+            path = cls.sealed[0]
+            ack_path = path[:-len(".seg")] + ".ack"
+            start = 0
+            if os.path.exists(ack_path):
+                with open(ack_path) as f:
+                    start = int(f.read() or 0)
+
+            with open(path, "rb") as f:
+                data = f.read()
+
+            batch = []
+            for end, body, app_id, event_id, received_at in read_records(data, start):
+                if event_id in seen:
+                    cls.duplicates += 1
+                    continue
+                seen.add(event_id)
+                batch.append(RawEvent(body, app_id, event_id, received_at))
+                if len(batch) >= settings.SPOOL_DRAIN_BATCH:
+                    await cls._publish_batch(batch, ack_path, end)
+                    batch = []
+            await cls._publish_batch(batch, ack_path, len(data))
+
+            os.remove(path)
+            if os.path.exists(ack_path):
+                os.remove(ack_path)
+            cls.sealed.pop(0)
+            cls.sealed_bytes -= len(data)
+
+    @classmethod
+    async def _publish_batch(cls, batch: list, ack_path: str, offset: int):
+        if batch:
+            await EventQueue.push_raw_events(batch)
+            cls.replayed += len(batch)
+        with open(ack_path, "w") as f:
+            f.write(str(offset))
+
+Gauge(
+    "artello_spool_bytes",
+    "Bytes of spooled events waiting to be replayed",
+    lambda: EventSpool.sealed_bytes + (EventSpool.active.offset if EventSpool.active else 0),
+)
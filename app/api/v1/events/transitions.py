@@ -0,0 +1,214 @@
+"""
+Event-type transition matrix per app and day.
+
+The consumer counts `previous event_type -> event_type` pairs as it links
+events into session chains (`(start)` marks the first event of a session)
+and adds them to one Mongo document per app, day and previous type, so an
+app with many event types never approaches Mongo's 16 MB document limit:
+
+    {"app_id": ..., "day": "2025-01-31", "from": "<from>", "to": {"<to>": n}}
+
+A unique index on `(app_id, day, from)` serves both the flush upserts and
+the queries, which merge the documents of a day range into a small
+in-memory matrix. Event types Mongo cannot store (empty, containing NUL,
+or not encodable as UTF-8) are not counted.
+Multi-step paths and Sankey flows are first-order Markov estimates built
+from that matrix, not counts of exact session paths.
+"""
+import heapq
+from collections import Counter, defaultdict
+from datetime import date
+from typing import Optional
+from fastapi import HTTPException
+from pymongo import ASCENDING, UpdateOne
+from pymongo.errors import BulkWriteError
+from app.core.database import MongoDB
+from app.core.metrics import QUERY_LATENCY, timed
+from app.core.logger import get_logger
+from app.api.v1.events.rollups import Rollups, day_of, day_range, escape_key, storable_key, unescape_key
+
+logger = get_logger("transitions")
+
+START = "(start)"
+# Two workers upserting the same new document; the loser's increment applies next flush
+DUPLICATE_KEY = 11000
+
+@Rollups.register
+class TransitionMatrix:
+    # (app_id, day) -> Counter of (from_type, to_type)
+    pending: dict = {}
+
+    @classmethod
+    def observe(cls, event, prev_type: Optional[str], weight: float = 1.0):
+        prev_type = prev_type or START
+        if not storable_key(event.event_type) or not storable_key(prev_type):
+            return
+        key = (event.app_id, day_of(event.timestamp))
+        counts = cls.pending.get(key)
+        if counts is None:
+            counts = cls.pending[key] = Counter()
+        counts[(prev_type, event.event_type)] += weight
+
+    @classmethod
+    async def restore(cls):
+        await MongoDB.get_db().event_transitions.create_index(
+            [("app_id", ASCENDING), ("day", ASCENDING), ("from", ASCENDING)], unique=True,
+        )
+
+    @classmethod
+    async def flush(cls, final: bool = False):
+        if not cls.pending:
+            return
+        pending, cls.pending = cls.pending, {}
+        rows = defaultdict(Counter)
+        for (app_id, day), counts in pending.items():
+            for (a, b), n in counts.items():
+                rows[(app_id, day, a)][b] += n
+        rows = list(rows.items())
+        operations = [
+            UpdateOne(
+                {"app_id": app_id, "day": day, "from": a},
+                {"$inc": {f"to.{escape_key(b)}": n for b, n in row.items()}},
+                upsert=True,
+            )
+            for (app_id, day, a), row in rows
+        ]
+        try:
+            await MongoDB.get_db().event_transitions.bulk_write(operations, ordered=False)
+        except BulkWriteError as e:
+            # Only the listed operations failed; the others are applied and must not be repeated
+            for error in e.details.get("writeErrors", []):
+                (app_id, day, a), row = rows[error["index"]]
+                if error.get("code") == DUPLICATE_KEY:
+                    cls._requeue(app_id, day, a, row)
+                else:
+                    logger.warning("Dropping transitions from %r: %s", a, error.get("errmsg"), extra={"app_id": app_id})
+        except Exception:
+            # Nothing or part of the batch was applied; counted again on the next flush, which may overcount
+            for (app_id, day, a), row in rows:
+                cls._requeue(app_id, day, a, row)
+            raise
+
+    @classmethod
+    def _requeue(cls, app_id: str, day: str, a: str, row: Counter):
+        counts = cls.pending.setdefault((app_id, day), Counter())
+        for b, n in row.items():
+            counts[(a, b)] += n
+
+async def load_matrix(app_id: str, start_date: Optional[date], end_date: Optional[date]) -> dict:
+    """
+    Merges the stored transitions of a day range into `{from: Counter(to)}`.
+    """
+    first_day, last_day = day_range(start_date, end_date)
+    cursor = MongoDB.get_db().event_transitions.find(
+        {"app_id": app_id, "day": {"$gte": first_day, "$lte": last_day}},
+        {"from": 1, "to": 1},
+    )
+    matrix = defaultdict(Counter)
+    for doc in await cursor.to_list(None):
+        target = matrix[doc["from"]]
+        for b, n in doc.get("to", {}).items():
+            target[unescape_key(b)] += n
+    if not matrix:
+        raise HTTPException(status_code=404, detail="No transition data found.")
+    return matrix
+
+class TransitionQueries:
+    @staticmethod
+    @timed(QUERY_LATENCY, "get_next_events")
+    async def get_next_events(app_id: str, event_type: str, start_date: date = None, end_date: date = None, limit: int = 10):
+        """
+        What users do right after `event_type`, with each next type's share.
+        """
+        matrix = await load_matrix(app_id, start_date, end_date)
+        row = matrix.get(event_type, Counter())
+        total = sum(row.values())
+        return {
+            "event_type": event_type,
+            "total": round(total),
+            "next": [
+                {"event_type": b, "count": round(n), "share": round(n / total, 4)}
+                for b, n in row.most_common(limit)
+            ],
+        }
+
+    @staticmethod
+    @timed(QUERY_LATENCY, "get_top_paths")
+    async def get_top_paths(app_id: str, length: int = 3, limit: int = 10, start_event: str = None,
+                            start_date: date = None, end_date: date = None):
+        """
+        The `limit` most frequent paths of `length` event types, found by beam
+        search. A path's count is its first transition's count times the
+        conditional probabilities of the following steps.
+        """
+        matrix = await load_matrix(app_id, start_date, end_date)
+        totals = {a: sum(row.values()) for a, row in matrix.items()}
+        beam_width = max(limit * 4, 50)
+
+        if start_event:
+            beams = [((start_event, b), float(n)) for b, n in matrix.get(start_event, Counter()).items()]
+        else:
+            beams = [((a, b), float(n)) for a, row in matrix.items() if a != START for b, n in row.items()]
+        beams = heapq.nlargest(beam_width, beams, key=lambda beam: beam[1])
+
+        for _ in range(length - 2):
+            extended = []
+            for path, score in beams:
+                last = path[-1]
+                row = matrix.get(last)
+                if not row:
+                    continue
+                for b, n in row.items():
+                    extended.append((path + (b,), score * n / totals[last]))
+            beams = heapq.nlargest(beam_width, extended, key=lambda beam: beam[1])
+
+        return {
+            "length": length,
+            "paths": [
+                {"path": list(path), "count": round(score, 2)}
+                for path, score in heapq.nlargest(limit, beams, key=lambda beam: beam[1])
+            ],
+        }
+
+    @staticmethod
+    @timed(QUERY_LATENCY, "get_sankey")
+    async def get_sankey(app_id: str, steps: int = 4, width: int = 8, start_event: str = None,
+                         start_date: date = None, end_date: date = None):
+        """
+        Sankey nodes and links for `steps` steps from session starts (or from
+        `start_event`), keeping the `width` largest event types per step.
+        """
+        matrix = await load_matrix(app_id, start_date, end_date)
+        totals = {a: sum(row.values()) for a, row in matrix.items()}
+
+        if start_event:
+            flow = {start_event: float(sum(row.get(start_event, 0) for row in matrix.values()))}
+        else:
+            flow = {b: float(n) for b, n in matrix.get(START, Counter()).most_common(width)}
+
+        nodes = [{"id": f"0:{a}", "step": 0, "event_type": a, "value": round(v, 2)} for a, v in flow.items()]
+        links = []
+        for step in range(1, steps):
+            step_links = defaultdict(float)
+            for a, value in flow.items():
+                row = matrix.get(a)
+                if not row:
+                    continue
+                for b, n in row.items():
+                    step_links[(a, b)] += value * n / totals[a]
+
+            inflow = defaultdict(float)
+            for (a, b), value in step_links.items():
+                inflow[b] += value
+            kept = dict(heapq.nlargest(width, inflow.items(), key=lambda item: item[1]))
+            if not kept:
+                break
+
+            nodes.extend({"id": f"{step}:{b}", "step": step, "event_type": b, "value": round(v, 2)} for b, v in kept.items())
+            links.extend(
+                {"source": f"{step - 1}:{a}", "target": f"{step}:{b}", "value": round(value, 2)}
+                for (a, b), value in step_links.items() if b in kept
+            )
+            flow = kept
+
+        return {"nodes": nodes, "links": links}
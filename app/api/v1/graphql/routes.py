@@ -1,4 +1,5 @@
 import strawberry
+from fastapi import Depends
 from strawberry.fastapi import GraphQLRouter
 from app.api.v1.auth.dependencies import verify_api_key
 from app.api.v1.graphql.schemas import Query
@@ -7,7 +8,7 @@ from app.api.v1.graphql.schemas import Query
 schema = strawberry.Schema(query=Query)
 
 # Secure GraphQL API with API Key Authentication
-async def get_context(api_key: str = verify_api_key):
-    return {"app": api_key}
+async def get_context(app: dict = Depends(verify_api_key)):
+    return {"app": app}
 
 graphql_router = GraphQLRouter(schema, context_getter=get_context)
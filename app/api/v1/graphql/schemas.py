@@ -1,5 +1,5 @@
 import strawberry
-from datetime import datetime
+from datetime import date, datetime
 from typing import Optional, List
 from strawberry.scalars import JSON
 
@@ -38,6 +38,8 @@ class ConversionFunnel:
 class RetentionRate:
     days: int
     active_sessions: int
+    approximate: bool = False
+    relative_error: float = 0.0
 
 @strawberry.type
 class HeatmapData:
@@ -50,15 +52,41 @@ class GlobalAnalytics:
 @strawberry.type
 class TopEvents:
     top_events: JSON
+    window: str = "day"
+    approximate: bool = False
 
 @strawberry.type
 class GlobalFunnel:
     funnel: JSON
+    approximate: bool = False
+    relative_error: float = 0.0
 
 @strawberry.type
 class SegmentedUsers:
     users: JSON
 
+@strawberry.type
+class TopValues:
+    dimension: str
+    window: str
+    top: JSON
+
+@strawberry.type
+class NextEvents:
+    event_type: str
+    total: int
+    next: JSON
+
+@strawberry.type
+class TopPaths:
+    length: int
+    paths: JSON
+
+@strawberry.type
+class SankeyData:
+    nodes: JSON
+    links: JSON
+
 @strawberry.input
 class EventFilter:
     """
@@ -149,12 +177,18 @@ class Query:
         return ConversionFunnel(**result)
 
     @strawberry.field
-    async def retention_rate(self, days: int) -> RetentionRate:
+    async def retention_rate(
+        self, info: strawberry.Info, days: int, exact: bool = False, app_id: Optional[str] = None
+    ) -> RetentionRate:
         """
         Fetches user retention over a specified number of days.
+        Approximate (HyperLogLog) unless `exact` is set.
         """
         from app.api.v1.events.queries import EventQueries
-        result = await EventQueries.get_retention_rate(days)
+        if app_id:
+            from app.api.v1.apps.services import AppService
+            await AppService.get_app(app_id, info.context["app"]["user_id"])
+        result = await EventQueries.get_retention_rate(days, exact, app_id)
         return RetentionRate(**result)
 
     @strawberry.field
@@ -176,21 +210,48 @@ class Query:
         return GlobalAnalytics(**result)
 
     @strawberry.field
-    async def top_events(self, limit: int = 5) -> TopEvents:
+    async def top_events(
+        self, info: strawberry.Info, limit: int = 5, window: str = "day",
+        exact: bool = False, app_id: Optional[str] = None,
+    ) -> TopEvents:
         """
-        Fetches the most frequent event types.
+        Fetches the most frequent event types over the last hour, day or week.
+        Approximate (Space-Saving) unless `exact` is set.
         """
         from app.api.v1.events.queries import EventQueries
-        result = await EventQueries.get_top_events(limit)
+        if app_id:
+            from app.api.v1.apps.services import AppService
+            await AppService.get_app(app_id, info.context["app"]["user_id"])
+        result = await EventQueries.get_top_events(min(limit, 100), window, exact, app_id)
         return TopEvents(**result)
 
     @strawberry.field
-    async def global_funnel(self, steps: List[str], start_date: str = None, end_date: str = None) -> GlobalFunnel:
+    async def top_values(
+        self, info: strawberry.Info, app_id: str, dimension: str = "event_type", window: str = "day", limit: int = 10,
+    ) -> TopValues:
+        """
+        Fetches the most frequent values of `event_type` or `payload.<field>`.
+        """
+        from app.api.v1.apps.services import AppService
+        from app.api.v1.events.heavy_hitters import HeavyHitterQueries
+        await AppService.get_app(app_id, info.context["app"]["user_id"])
+        result = await HeavyHitterQueries.get_top_values(app_id, dimension, window, min(limit, 100))
+        return TopValues(**result)
+
+    @strawberry.field
+    async def global_funnel(
+        self, info: strawberry.Info, steps: List[str], start_date: str = None, end_date: str = None,
+        exact: bool = False, app_id: Optional[str] = None,
+    ) -> GlobalFunnel:
         """
         Fetches funnel data across all sessions.
+        Approximate (HyperLogLog) unless `exact` is set.
         """
         from app.api.v1.events.queries import EventQueries
-        result = await EventQueries.get_global_funnel(steps, start_date, end_date)
+        if app_id:
+            from app.api.v1.apps.services import AppService
+            await AppService.get_app(app_id, info.context["app"]["user_id"])
+        result = await EventQueries.get_global_funnel(steps, start_date, end_date, exact, app_id)
         return GlobalFunnel(**result)
 
     @strawberry.field
@@ -210,3 +271,49 @@ class Query:
         from app.api.v1.events.queries import EventQueries
         result = await EventQueries.execute_custom_query(conditions)
         return QueryResults(results=result)
+
+    @strawberry.field
+    async def next_events(
+        self, info: strawberry.Info, app_id: str, event_type: str, limit: int = 10,
+        start_date: Optional[date] = None, end_date: Optional[date] = None,
+    ) -> NextEvents:
+        """
+        Fetches what users do right after an event type.
+        """
+        from app.api.v1.apps.services import AppService
+        from app.api.v1.events.transitions import TransitionQueries
+        await AppService.get_app(app_id, info.context["app"]["user_id"])
+        result = await TransitionQueries.get_next_events(app_id, event_type, start_date, end_date, min(limit, 100))
+        return NextEvents(**result)
+
+    @strawberry.field
+    async def top_paths(
+        self, info: strawberry.Info, app_id: str, length: int = 3, limit: int = 10, start_event: Optional[str] = None,
+        start_date: Optional[date] = None, end_date: Optional[date] = None,
+    ) -> TopPaths:
+        """
+        Fetches the most frequent event paths of a given length.
+        """
+        from app.api.v1.apps.services import AppService
+        from app.api.v1.events.transitions import TransitionQueries
+        await AppService.get_app(app_id, info.context["app"]["user_id"])
+        result = await TransitionQueries.get_top_paths(
+            app_id, max(2, min(length, 10)), min(limit, 100), start_event, start_date, end_date
+        )
+        return TopPaths(**result)
+
+    @strawberry.field
+    async def sankey(
+        self, info: strawberry.Info, app_id: str, steps: int = 4, width: int = 8, start_event: Optional[str] = None,
+        start_date: Optional[date] = None, end_date: Optional[date] = None,
+    ) -> SankeyData:
+        """
+        Fetches Sankey nodes and links of event flows.
+        """
+        from app.api.v1.apps.services import AppService
+        from app.api.v1.events.transitions import TransitionQueries
+        await AppService.get_app(app_id, info.context["app"]["user_id"])
+        result = await TransitionQueries.get_sankey(
+            app_id, max(2, min(steps, 10)), max(1, min(width, 50)), start_event, start_date, end_date
+        )
+        return SankeyData(**result)
@@ -1,9 +1,11 @@
 from fastapi import Security, HTTPException, Request
 from fastapi.security import APIKeyHeader
 from app.core.database import MongoDB
+from app.core.metrics import AUTH_LATENCY, timed
 
 app_key_header = APIKeyHeader(name="X-APP-KEY", auto_error=False)
 
+@timed(AUTH_LATENCY, "verify_sdk_key")
 async def verify_sdk_key(request: Request, app_key: str = Security(app_key_header)):
     """
     Verifies the SDK key and validates the domain of the request.
@@ -24,4 +26,6 @@ async def verify_sdk_key(request: Request, app_key: str = Security(app_key_heade
     if not registered_domain or registered_domain not in origin:
         raise HTTPException(status_code=403, detail="Domain not authorized for this app key")
 
+    request.state.tenant = app["app_id"]
+    request.state.app = app
     return app["app_id"]
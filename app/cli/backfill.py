@@ -0,0 +1,383 @@
+"""
+Imports historical events straight into Neo4j, bypassing the event queue.
+
+    python -m app.cli.backfill history.ndjson.gz --app-id <app id>
+    python -m app.cli.backfill export-*.ndjson --workers 8 --checkpoint onboarding.ckpt
+
+Inputs are NDJSON files, optionally gzipped, of SDK events; `--app-id` fills
+in lines without an `app_id`. The sampling `weight` of exported events is
+kept, so counts of re-imported sampled data stay unbiased. The import runs
+in two passes:
+
+    partition   stream the inputs, validate each line and append it to one
+                of `--shards` gzipped shard files chosen by a hash of its
+                app and session, so a session never spans shards
+    load        `--workers` shards at a time: group a shard's events by
+                session, order them by timestamp, split sessions on
+                inactivity like the consumer does and write them in UNWIND
+                batches of about `--batch-size` events
+
+The checkpoint file records the partition and every loaded shard; rerunning
+the same command resumes after the last loaded shard. Sessions that already
+exist in the graph are skipped whole and events whose id is already stored
+are dropped, so a shard interrupted half-way is safe to load again. The
+transition matrix and session sketches are updated as in the consumer; live
+rates and heavy hitters are not.
+"""
+import argparse
+import asyncio
+import gzip
+import hashlib
+import json
+import os
+import shutil
+import time
+from collections import defaultdict
+from datetime import timezone
+from typing import List, Optional
+from pydantic import Field, ValidationError
+from pymongo import UpdateOne
+from app.core.config import settings
+from app.core.database import MongoDB, Neo4jDB
+from app.core.logger import setup_logging
+from app.core.startup import close_clients
+from app.api.v1.events.consumer import ensure_graph_schema
+from app.api.v1.events.models import EventModel
+from app.api.v1.events.rollups import Rollups
+from app.api.v1.events.sessionizer import ServerSession, server_session_id
+
+# Creates new sessions with their event chains in one statement. Existing
+# sessions are skipped; already stored events are left out of the chain.
+BACKFILL_QUERY = """
+UNWIND $sessions AS row
+OPTIONAL MATCH (existing:Session {session_id: row.session_id})
+WITH row WHERE existing IS NULL
+CREATE (s:Session {
+    session_id: row.session_id,
+    app_id: row.app_id,
+    client_session_id: row.client_session_id,
+    segment: row.segment
+})
+WITH s, row
+CALL {
+    WITH row
+    UNWIND row.events AS event
+    OPTIONAL MATCH (stored:Event {app_id: row.app_id, event_id: event.event_id})
+    WITH row, event WHERE stored IS NULL
+    CREATE (e:Event {
+        event_id: event.event_id,
+        app_id: row.app_id,
+        session_id: row.session_id,
+        event_type: event.event_type,
+        timestamp: event.timestamp,
+        payload: event.payload,
+        weight: event.weight
+    })
+    RETURN collect(e) AS chain
+}
+FOREACH (i IN range(0, size(chain) - 2) |
+    FOREACH (a IN [chain[i]] | FOREACH (b IN [chain[i + 1]] | CREATE (a)-[:NEXT]->(b)))
+)
+FOREACH (first IN chain[0..1] | CREATE (s)-[:HAS_EVENT]->(first))
+FOREACH (last IN chain[-1..] | CREATE (s)-[:LAST_EVENT]->(last))
+RETURN row.session_id AS session_id, [e IN chain | e.event_id] AS event_ids
+"""
+
+class BackfillEvent(EventModel):
+    """
+    An imported event. Unlike ingested ones, it may carry the sampling weight it was exported with.
+    """
+    weight: Optional[float] = Field(None, gt=0, title="Sampling Weight")
+
+class Checkpoint:
+    """
+    Import progress, saved atomically as JSON after every shard.
+    """
+    def __init__(self, path: str, inputs: List[str], shards: int):
+        self.path = path
+        self.state = {
+            "inputs": inputs,
+            "shards": shards,
+            "partitioned": False,
+            "done": [],
+            "stats": defaultdict(int),
+        }
+
+    @classmethod
+    def open(cls, path: str, inputs: List[str], shards: int, restart: bool = False) -> "Checkpoint":
+        checkpoint = cls(path, inputs, shards)
+        if restart or not os.path.exists(path):
+            return checkpoint
+        with open(path) as f:
+            state = json.load(f)
+        if state["inputs"] != inputs or state["shards"] != shards:
+            raise SystemExit(f"{path} belongs to a different import; pass --restart or another --checkpoint")
+        state["stats"] = defaultdict(int, state["stats"])
+        checkpoint.state = state
+        return checkpoint
+
+    @property
+    def stats(self) -> dict:
+        return self.state["stats"]
+
+    def is_done(self, shard: int) -> bool:
+        return shard in self.state["done"]
+
+    def mark_partitioned(self):
+        self.state["partitioned"] = True
+        self.save()
+
+    def mark_done(self, shard: int):
+        self.state["done"].append(shard)
+        self.save()
+
+    def save(self):
+        temp = f"{self.path}.tmp"
+        with open(temp, "w") as f:
+            json.dump(self.state, f)
+        os.replace(temp, self.path)
+
+def open_input(path: str):
+    """
+    Opens an NDJSON input as text, transparently un-gzipping it.
+    """
+    with open(path, "rb") as f:
+        gzipped = f.read(2) == b"\x1f\x8b"
+    return gzip.open(path, "rt", encoding="utf-8") if gzipped else open(path, encoding="utf-8")
+
+def shard_of(app_id: str, session_id: str, shards: int) -> int:
+    digest = hashlib.blake2b(f"{app_id}\0{session_id}".encode(), digest_size=8).digest()
+    return int.from_bytes(digest, "big") % shards
+
+def shard_path(work_dir: str, shard: int) -> str:
+    return os.path.join(work_dir, f"shard-{shard:05d}.ndjson.gz")
+
+def partition(inputs: List[str], app_id: str, work_dir: str, shards: int, stats: dict):
+    """
+    Streams every input once into the shard files. Invalid lines are counted and skipped.
+    """
+    shutil.rmtree(work_dir, ignore_errors=True)
+    os.makedirs(work_dir)
+    outputs = [gzip.open(shard_path(work_dir, i), "wt", encoding="utf-8", compresslevel=1) for i in range(shards)]
+    try:
+        for path in inputs:
+            with open_input(path) as f:
+                for number, line in enumerate(f, 1):
+                    if not line.strip():
+                        continue
+                    try:
+                        data = json.loads(line)
+                        if not isinstance(data, dict):
+                            raise ValueError("not a JSON object")
+                        if app_id and not data.get("app_id"):
+                            data["app_id"] = app_id
+                        if "timestamp" not in data:
+                            raise ValueError("missing timestamp")
+                        event = BackfillEvent.model_validate(data)
+                    except (ValueError, ValidationError) as e:
+                        stats["invalid"] += 1
+                        if stats["invalid"] <= 10:
+                            print(f"{path}:{number}: skipped, {str(e).splitlines()[0]}")
+                        continue
+                    outputs[shard_of(event.app_id, event.session_id, shards)].write(event.model_dump_json() + "\n")
+                    stats["read"] += 1
+            print(f"Partitioned {path}")
+    finally:
+        for output in outputs:
+            output.close()
+
+def sort_key(event: BackfillEvent):
+    timestamp = event.timestamp
+    if timestamp.tzinfo is None:
+        timestamp = timestamp.replace(tzinfo=timezone.utc)
+    return timestamp, event.event_id
+
+def sessionize(events: List[BackfillEvent]) -> List[tuple]:
+    """
+    Splits one client session's events, in timestamp order, into server
+    sessions on inactivity gaps, like `Sessionizer` does for live events.
+    """
+    sessions = []
+    segment, last_at, current = 0, None, []
+    for event in events:
+        at = sort_key(event)[0].timestamp()
+        if last_at is not None and at - last_at > settings.SESSION_INACTIVITY_SECONDS:
+            sessions.append((segment, current))
+            segment, current = segment + 1, []
+        current.append(event)
+        last_at = at
+    sessions.append((segment, current))
+
+    client_session_id = events[0].session_id
+    return [
+        (ServerSession(server_session_id(client_session_id, segment), client_session_id, segment), chunk)
+        for segment, chunk in sessions
+    ]
+
+def read_shard(path: str) -> List[tuple]:
+    """
+    The server sessions of a shard, each with its events in order.
+    """
+    clients = defaultdict(list)
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        for line in f:
+            event = BackfillEvent.model_validate_json(line)
+            clients[(event.app_id, event.session_id)].append(event)
+
+    sessions = []
+    for events in clients.values():
+        events.sort(key=sort_key)
+        # Drop repeated deliveries of the same event within the export
+        seen = set()
+        events = [e for e in events if not (e.event_id in seen or seen.add(e.event_id))]
+        sessions.extend(sessionize(events))
+    return sessions
+
+def batches(sessions: List[tuple], batch_size: int):
+    """
+    Groups whole sessions into batches of about `batch_size` events.
+    """
+    batch, size = [], 0
+    for session in sessions:
+        batch.append(session)
+        size += len(session[1])
+        if size >= batch_size:
+            yield batch
+            batch, size = [], 0
+    if batch:
+        yield batch
+
+async def write_batch(batch: List[tuple], stats: dict):
+    """
+    Writes a batch of sessions, then records the new ones in Mongo and feeds
+    the stored events to the rollups in chain order.
+    """
+    rows = [
+        {
+            "session_id": session.session_id,
+            "app_id": events[0].app_id,
+            "client_session_id": session.client_session_id,
+            "segment": session.segment,
+            "events": [
+                {
+                    "event_id": event.event_id,
+                    "event_type": event.event_type,
+                    "timestamp": event.timestamp.isoformat(),
+                    "payload": json.dumps(event.payload, default=str),
+                    "weight": event.weight if event.weight != 1 else None,
+                }
+                for event in events
+            ],
+        }
+        for session, events in batch
+    ]
+    async with Neo4jDB.get_driver().session() as neo4j_session:
+        result = await neo4j_session.run(BACKFILL_QUERY, sessions=rows)
+        records = await result.data()
+
+    created = {record["session_id"]: set(record["event_ids"]) for record in records}
+    operations = []
+    for session, events in batch:
+        stored = created.get(session.session_id)
+        if stored is None:
+            stats["sessions_skipped"] += 1
+            continue
+        stats["sessions"] += 1
+        operations.append(UpdateOne(
+            {"session_id": session.session_id},
+            {"$setOnInsert": {
+                "session_id": session.session_id,
+                "app_id": events[0].app_id,
+                "client_session_id": session.client_session_id,
+                "segment": session.segment,
+            }},
+            upsert=True,
+        ))
+        prev_type = None
+        for event in events:
+            if event.event_id not in stored:
+                stats["events_skipped"] += 1
+                continue
+            event.session_id = session.session_id
+            Rollups.observe(event, prev_type, historical=True, weight=event.weight or 1.0)
+            prev_type = event.event_type
+            stats["stored"] += 1
+    if operations:
+        await MongoDB.get_db().sessions.bulk_write(operations, ordered=False)
+
+async def load_shard(path: str, batch_size: int, stats: dict):
+    sessions = await asyncio.to_thread(read_shard, path)
+    for batch in batches(sessions, batch_size):
+        await write_batch(batch, stats)
+
+async def backfill(inputs: List[str], app_id: str = None, checkpoint_path: str = "backfill.checkpoint",
+                   work_dir: str = None, shards: int = 256, workers: int = 4, batch_size: int = 5000,
+                   restart: bool = False):
+    inputs = [os.path.abspath(path) for path in inputs]
+    work_dir = work_dir or f"{checkpoint_path}.shards"
+    checkpoint = Checkpoint.open(checkpoint_path, inputs, shards, restart)
+    stats = checkpoint.stats
+    started = time.monotonic()
+
+    if not checkpoint.state["partitioned"]:
+        await asyncio.to_thread(partition, inputs, app_id, work_dir, shards, stats)
+        checkpoint.mark_partitioned()
+        print(f"Partitioned {stats['read']} events into {shards} shards, skipped {stats['invalid']} invalid lines")
+
+    await ensure_graph_schema()
+    pending = asyncio.Queue()
+    for shard in range(shards):
+        if not checkpoint.is_done(shard):
+            pending.put_nowait(shard)
+    total = pending.qsize()
+
+    async def worker():
+        while not pending.empty():
+            shard = pending.get_nowait()
+            await load_shard(shard_path(work_dir, shard), batch_size, stats)
+            # Persist the shard's rollups before it counts as done
+            await Rollups.flush()
+            checkpoint.mark_done(shard)
+            done = len(checkpoint.state["done"])
+            rate = stats["stored"] / max(time.monotonic() - started, 1e-9)
+            print(f"Shard {shard} loaded ({done}/{shards}), {stats['stored']} events stored, {rate:.0f}/s")
+
+    try:
+        await asyncio.gather(*(worker() for _ in range(min(workers, total))))
+    finally:
+        await Rollups.flush(final=True)
+
+    shutil.rmtree(work_dir, ignore_errors=True)
+    print(
+        f"Stored {stats['stored']} events in {stats['sessions']} sessions; skipped "
+        f"{stats['sessions_skipped']} existing sessions, {stats['events_skipped']} stored events "
+        f"and {stats['invalid']} invalid lines."
+    )
+    return dict(stats)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("inputs", nargs="+", help="NDJSON files of events, optionally gzipped")
+    parser.add_argument("--app-id", help="App id for lines without one")
+    parser.add_argument("--checkpoint", default="backfill.checkpoint", help="Progress file used to resume")
+    parser.add_argument("--work-dir", help="Directory for shard files (default: <checkpoint>.shards)")
+    parser.add_argument("--shards", type=int, default=256, help="Number of session shards")
+    parser.add_argument("--workers", type=int, default=4, help="Shards loaded concurrently")
+    parser.add_argument("--batch-size", type=int, default=5000, help="Events per UNWIND statement")
+    parser.add_argument("--restart", action="store_true", help="Ignore an existing checkpoint and start over")
+    args = parser.parse_args()
+    setup_logging()
+
+    async def run():
+        try:
+            await backfill(
+                args.inputs, args.app_id, args.checkpoint, args.work_dir,
+                args.shards, args.workers, args.batch_size, args.restart,
+            )
+        finally:
+            await close_clients()
+
+    asyncio.run(run())
+
+if __name__ == "__main__":
+    main()
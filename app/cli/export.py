@@ -0,0 +1,95 @@
+"""
+Exports an app's events to a gzip-compressed NDJSON file.
+
+    python -m app.cli.export --app-id <app id> -o events.ndjson.gz
+    python -m app.cli.export --app-id <app id> --start 2025-01-01 --end 2025-02-01 -o january.ndjson.gz
+    python -m app.cli.export --tag-legacy-events
+
+Each page is appended as its own gzip member (any gzip reader concatenates
+them), then `<output>.cursor` records the cursor and the file size. Running
+the same command again after an interruption truncates the file to the last
+complete page and resumes from its cursor; the sidecar is removed once the
+export finishes.
+"""
+import argparse
+import asyncio
+import gzip
+import json
+import os
+from datetime import datetime
+from app.core.config import settings
+from app.core.logger import setup_logging
+from app.core.startup import close_clients
+from app.api.v1.events.export import export_pages, tag_legacy_events
+
+def read_progress(path: str) -> dict:
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+def write_progress(path: str, progress: dict):
+    temp = f"{path}.tmp"
+    with open(temp, "w") as f:
+        json.dump(progress, f)
+    os.replace(temp, path)
+
+async def export(app_id: str, output: str, start: datetime = None, end: datetime = None, restart: bool = False):
+    """
+    Writes the app's events in [start, end) to `output`, resuming an interrupted export.
+    """
+    progress_path = f"{output}.cursor"
+    progress = None if restart else read_progress(progress_path)
+    if progress is not None:
+        if progress["app_id"] != app_id or progress["start"] != str(start) or progress["end"] != str(end):
+            raise SystemExit(f"{progress_path} belongs to a different export; pass --restart to overwrite {output}")
+        print(f"Resuming after {progress['events']} events")
+    elif os.path.exists(output) and not restart:
+        raise SystemExit(f"{output} already exists; pass --restart to overwrite it")
+    else:
+        progress = {"app_id": app_id, "start": str(start), "end": str(end), "cursor": None, "bytes": 0, "events": 0}
+
+    with open(output, "r+b" if progress["bytes"] else "wb") as f:
+        # Drops a page that was being written when the export stopped
+        f.truncate(progress["bytes"])
+        f.seek(progress["bytes"])
+        async for text, cursor in export_pages(app_id, start, end, progress["cursor"]):
+            f.write(gzip.compress(text.encode(), settings.EXPORT_COMPRESS_LEVEL))
+            f.flush()
+            os.fsync(f.fileno())
+            progress.update(cursor=cursor, bytes=f.tell(), events=progress["events"] + text.count("\n"))
+            write_progress(progress_path, progress)
+            print(f"{progress['events']} events exported")
+
+    if os.path.exists(progress_path):
+        os.remove(progress_path)
+    print(f"Exported {progress['events']} events to {output}")
+    return progress["events"]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--app-id", help="App whose events to export")
+    parser.add_argument("-o", "--output", help="Output file (gzip-compressed NDJSON)")
+    parser.add_argument("--start", type=datetime.fromisoformat, help="Inclusive start time (ISO 8601)")
+    parser.add_argument("--end", type=datetime.fromisoformat, help="Exclusive end time (ISO 8601)")
+    parser.add_argument("--restart", action="store_true", help="Ignore saved progress and overwrite the output")
+    parser.add_argument("--tag-legacy-events", action="store_true",
+                        help="Add app and session ids to events stored before exports existed, then exit")
+    args = parser.parse_args()
+    setup_logging()
+    if not args.tag_legacy_events and not (args.app_id and args.output):
+        parser.error("--app-id and --output are required")
+
+    async def run():
+        try:
+            if args.tag_legacy_events:
+                print(f"Set {await tag_legacy_events()} event properties")
+            else:
+                await export(args.app_id, args.output, args.start, args.end, args.restart)
+        finally:
+            await close_clients()
+
+    asyncio.run(run())
+
+if __name__ == "__main__":
+    main()
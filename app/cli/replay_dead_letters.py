@@ -0,0 +1,64 @@
+"""
+Replays dead-lettered events back into the event queue.
+
+    python -m app.cli.replay_dead_letters --limit 1000
+    python -m app.cli.replay_dead_letters --error-type ValidationError --dry-run
+"""
+import argparse
+import asyncio
+import aio_pika
+from app.core.config import settings
+from app.core.logger import setup_logging
+from app.api.v1.events.retry import RETRY_HEADER, copy_message, dead_letter_queue_name, declare_retry_topology
+
+ERROR_HEADERS = ("x-error", "x-error-type", "x-failed-at", RETRY_HEADER)
+
+async def replay(limit: int, error_type: str = None, dry_run: bool = False):
+    """
+    Moves up to `limit` dead letters back to the event queue with a fresh retry budget.
+    Messages filtered out by `error_type`, and all messages in a dry run, stay parked.
+    """
+    connection = await aio_pika.connect_robust(settings.RABBITMQ_URL)
+    async with connection:
+        channel = await connection.channel()
+        await declare_retry_topology(channel)
+        queue = await channel.declare_queue(dead_letter_queue_name(), durable=True)
+
+        replayed = skipped = 0
+        held = []
+        while replayed + skipped < limit:
+            message = await queue.get(no_ack=False, fail=False)
+            if message is None:
+                break
+
+            headers = dict(message.headers or {})
+            print(f"{message.message_id} [{headers.get('x-error-type')}] {headers.get('x-error')}")
+            if dry_run or (error_type and headers.get("x-error-type") != error_type):
+                held.append(message)
+                skipped += 1
+                continue
+
+            for key in ERROR_HEADERS:
+                headers.pop(key, None)
+            await channel.default_exchange.publish(copy_message(message, headers), routing_key=settings.EVENT_QUEUE)
+            await message.ack()
+            replayed += 1
+
+        # Held messages return to the dead-letter queue when nacked with requeue
+        for message in held:
+            await message.nack(requeue=True)
+
+    print(f"Replayed {replayed} dead letters, left {skipped} parked.")
+    return replayed
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--limit", type=int, default=1000, help="Maximum number of dead letters to inspect")
+    parser.add_argument("--error-type", help="Only replay messages that failed with this exception type")
+    parser.add_argument("--dry-run", action="store_true", help="List dead letters without replaying them")
+    args = parser.parse_args()
+    setup_logging()
+    asyncio.run(replay(args.limit, args.error_type, args.dry_run))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,39 @@
+"""
+Applies per-app retention: archives and compacts sessions older than the policy.
+
+    python -m app.cli.retention --dry-run
+    python -m app.cli.retention --app-id <app id>
+
+Meant to run daily from cron; see app.api.v1.events.retention for what a run does.
+"""
+import argparse
+import asyncio
+from app.core.logger import setup_logging
+from app.core.startup import close_clients
+from app.api.v1.events.retention import Retention
+
+async def retain(app_id: str = None, dry_run: bool = False):
+    try:
+        reports = await Retention.run(app_id, dry_run)
+    finally:
+        await close_clients()
+
+    verb = "Would compact" if dry_run else "Compacted"
+    for report in reports:
+        archive = f", archived to {report['archive']}" if report["archive"] else ""
+        print(f"{report['app_id']}: {verb} {report['sessions']} sessions ({report['events']} events) "
+              f"older than {report['cutoff']}{archive}")
+    if not reports:
+        print("No app has a retention policy.")
+    return reports
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--app-id", help="Only apply this app's policy")
+    parser.add_argument("--dry-run", action="store_true", help="Count expired sessions without changing anything")
+    args = parser.parse_args()
+    setup_logging()
+    asyncio.run(retain(args.app_id, args.dry_run))
+
+if __name__ == "__main__":
+    main()
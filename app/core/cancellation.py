@@ -0,0 +1,70 @@
+"""
+Cancels requests whose client has gone away.
+
+Uvicorn does not cancel a request when its client disconnects, so a slow
+analytics query would keep running (and holding a Neo4j connection) for a
+response nobody reads. For requests under `CANCEL_ON_DISCONNECT_PREFIXES`,
+`CancelOnDisconnectMiddleware` reads the request body up front, runs the
+app in its own task with the buffered body, and watches the connection;
+on `http.disconnect` the task is cancelled, which closes the query's
+session and rolls its transaction back.
+"""
+import asyncio
+from app.core.config import settings
+from app.core.logger import get_logger
+from app.core.metrics import REQUESTS_CANCELLED
+
+logger = get_logger("cancellation")
+
+async def _wait_for_disconnect(receive):
+    while (await receive())["type"] != "http.disconnect":
+        pass
+
+class CancelOnDisconnectMiddleware:
+    """
+    ASGI middleware that cancels the handling of requests whose client disconnected.
+    Add it outside `ProfilingMiddleware`, so profiles follow the request task.
+    """
+    def __init__(self, app):
+        self.app = app
+        self.prefixes = tuple(p for p in settings.CANCEL_ON_DISCONNECT_PREFIXES if p)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not scope["path"].startswith(self.prefixes):
+            return await self.app(scope, receive, send)
+
+        messages = []
+        while True:
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                return
+            messages.append(message)
+            if not message.get("more_body"):
+                break
+
+        async def replay():
+            if messages:
+                return messages.pop(0)
+            # The app task is cancelled when the client disconnects
+            await asyncio.Event().wait()
+
+        handling = asyncio.create_task(self.app(scope, replay, send))
+        disconnected = asyncio.create_task(_wait_for_disconnect(receive))
+        try:
+            await asyncio.wait({handling, disconnected}, return_when=asyncio.FIRST_COMPLETED)
+        except asyncio.CancelledError:
+            handling.cancel()
+            raise
+        finally:
+            disconnected.cancel()
+
+        if not handling.done():
+            handling.cancel()
+            try:
+                await handling
+            except asyncio.CancelledError:
+                pass
+            REQUESTS_CANCELLED.inc()
+            logger.info("Cancelled %s %s after the client disconnected", scope["method"], scope["path"])
+            return
+        return handling.result()
@@ -1,4 +1,5 @@
 import os
+import socket
 from dotenv import load_dotenv
 
 # Load environment variables from .env file
@@ -11,11 +12,136 @@ class Settings():
     NEO4J_USER: str = os.getenv("NEO4J_USER")
     NEO4J_PASSWORD: str = os.getenv("NEO4J_PASSWORD")
 
+    # Shared by analytics reads and the embedded consumer's writes
+    NEO4J_MAX_POOL_SIZE: int = int(os.getenv("NEO4J_MAX_POOL_SIZE", 100))
+
+    STARTUP_CHECK_TIMEOUT: float = float(os.getenv("STARTUP_CHECK_TIMEOUT", 5))
+
     # Clerk Authentication
     CLERK_SECRET_KEY: str = os.getenv("CLERK_SECRET_KEY")
 
     # Messaging Queue
     RABBITMQ_URL: str = os.getenv("RABBITMQ_URL")
+    EVENT_QUEUE: str = os.getenv("EVENT_QUEUE", "event_queue")
+    QUEUE_MESSAGE_FORMAT: str = os.getenv("QUEUE_MESSAGE_FORMAT", "json")  # json | binary
+    QUEUE_COMPRESS_MIN_BYTES: int = int(os.getenv("QUEUE_COMPRESS_MIN_BYTES", 1024))
+    EVENT_RATES_EXCHANGE: str = os.getenv("EVENT_RATES_EXCHANGE", "event_rates")
+
+    # Consumer
+    EMBEDDED_CONSUMER: bool = os.getenv("EMBEDDED_CONSUMER", "true").lower() == "true"
+    WORKER_PROCESSES: int = int(os.getenv("WORKER_PROCESSES", 1))
+    # app.worker serves /metrics on this port plus the process index (0 disables)
+    WORKER_METRICS_PORT: int = int(os.getenv("WORKER_METRICS_PORT", 9400))
+    # Bearer token required to scrape /metrics; when empty, keep the endpoints internal
+    METRICS_TOKEN: str = os.getenv("METRICS_TOKEN", "")
+    CONSUMER_PREFETCH: int = int(os.getenv("CONSUMER_PREFETCH", 256))
+    CONSUMER_BATCH_SIZE: int = int(os.getenv("CONSUMER_BATCH_SIZE", 64))
+    CONSUMER_SHUTDOWN_TIMEOUT: float = float(os.getenv("CONSUMER_SHUTDOWN_TIMEOUT", 30))
+    EVENT_RETRY_DELAYS: list = [int(d) for d in os.getenv("EVENT_RETRY_DELAYS", "1, 5, 30, 120, 600").split(',')]
+    DEDUP_LRU_SIZE: int = int(os.getenv("DEDUP_LRU_SIZE", 10_000))
+    DEDUP_BLOOM_CAPACITY: int = int(os.getenv("DEDUP_BLOOM_CAPACITY", 100_000))
+    DEDUP_MAX_APPS: int = int(os.getenv("DEDUP_MAX_APPS", 256))
+    SESSION_TAIL_CACHE_SIZE: int = int(os.getenv("SESSION_TAIL_CACHE_SIZE", 100_000))
+    SESSION_TAIL_FLUSH_SECONDS: float = float(os.getenv("SESSION_TAIL_FLUSH_SECONDS", 1))
+    SESSION_TAIL_RECONCILE_SECONDS: float = float(os.getenv("SESSION_TAIL_RECONCILE_SECONDS", 60))
+    SESSION_TAIL_RECONCILE_BATCH: int = int(os.getenv("SESSION_TAIL_RECONCILE_BATCH", 1000))
+    SESSION_INACTIVITY_SECONDS: float = float(os.getenv("SESSION_INACTIVITY_SECONDS", 30 * 60))
+    SESSIONIZER_TABLE_SIZE: int = int(os.getenv("SESSIONIZER_TABLE_SIZE", 100_000))
+    ROLLUP_FLUSH_SECONDS: float = float(os.getenv("ROLLUP_FLUSH_SECONDS", 5))
+    ROLLUP_DEFAULT_DAYS: int = int(os.getenv("ROLLUP_DEFAULT_DAYS", 30))
+    # Unique per consumer process. Defaults to <hostname>-<pid>; a configured id is kept
+    # across restarts (app.worker appends the process index), so never share one between
+    # processes, e.g. embedded consumers of several uvicorn workers
+    WORKER_ID: str = os.getenv("WORKER_ID") or f"{socket.gethostname()}-{os.getpid()}"
+    HEAVY_HITTER_FIELDS: list = [f.strip() for f in os.getenv("HEAVY_HITTER_FIELDS", "page").split(',') if f.strip()]
+    HEAVY_HITTER_CAPACITY: int = int(os.getenv("HEAVY_HITTER_CAPACITY", 100))
+    HEAVY_HITTER_MAX_APPS: int = int(os.getenv("HEAVY_HITTER_MAX_APPS", 256))
+    HEAVY_HITTER_SNAPSHOT_SECONDS: float = float(os.getenv("HEAVY_HITTER_SNAPSHOT_SECONDS", 60))
+    HEAVY_HITTER_CACHE_SECONDS: float = float(os.getenv("HEAVY_HITTER_CACHE_SECONDS", 5))
+    # Server-side sampling; rules live on the app record
+    SAMPLING_RULES_TTL_SECONDS: float = float(os.getenv("SAMPLING_RULES_TTL_SECONDS", 30))
+    SAMPLING_MIN_RATE: float = float(os.getenv("SAMPLING_MIN_RATE", 0.001))
+    SAMPLING_WINDOW_SECONDS: float = float(os.getenv("SAMPLING_WINDOW_SECONDS", 1))
+    SAMPLING_EWMA_ALPHA: float = float(os.getenv("SAMPLING_EWMA_ALPHA", 0.3))
+    TIMESERIES_SECONDS: int = int(os.getenv("TIMESERIES_SECONDS", 600))
+    TIMESERIES_MINUTES: int = int(os.getenv("TIMESERIES_MINUTES", 6 * 60))
+    TIMESERIES_MAX_SERIES: int = int(os.getenv("TIMESERIES_MAX_SERIES", 5000))
+    TIMESERIES_SUBSCRIBE_RETRY_SECONDS: float = float(os.getenv("TIMESERIES_SUBSCRIBE_RETRY_SECONDS", 10))
+
+    # Ingest
+    MAX_EVENT_BYTES: int = int(os.getenv("MAX_EVENT_BYTES", 64 * 1024))
+    INGEST_MAX_IN_FLIGHT: int = int(os.getenv("INGEST_MAX_IN_FLIGHT", 512))
+    INGEST_QUEUE_HIGH_WATERMARK: int = int(os.getenv("INGEST_QUEUE_HIGH_WATERMARK", 500_000))
+    INGEST_QUEUE_POLL_SECONDS: float = float(os.getenv("INGEST_QUEUE_POLL_SECONDS", 2))
+    INGEST_RETRY_AFTER_BUSY: int = int(os.getenv("INGEST_RETRY_AFTER_BUSY", 1))
+    INGEST_RETRY_AFTER_BACKLOG: int = int(os.getenv("INGEST_RETRY_AFTER_BACKLOG", 30))
+    # Per-app events per second unless the app record sets its own (0 = unlimited)
+    INGEST_RATE_LIMIT: float = float(os.getenv("INGEST_RATE_LIMIT", 1000))
+    INGEST_BURST: float = float(os.getenv("INGEST_BURST", 0))  # 0 = twice the rate
+    # Uvicorn workers started by run.sh, sharing each app's quota
+    API_WORKERS: int = int(os.getenv("API_WORKERS", 1))
+
+    # Ingest spool (used while the broker is unavailable)
+    SPOOL_ENABLED: bool = os.getenv("SPOOL_ENABLED", "true").lower() == "true"
+    SPOOL_DIR: str = os.getenv("SPOOL_DIR", "spool")
+    SPOOL_SEGMENT_BYTES: int = int(os.getenv("SPOOL_SEGMENT_BYTES", 16 * 1024 * 1024))
+    SPOOL_MAX_BYTES: int = int(os.getenv("SPOOL_MAX_BYTES", 1024 * 1024 * 1024))  # per API worker
+    SPOOL_PUBLISH_TIMEOUT: float = float(os.getenv("SPOOL_PUBLISH_TIMEOUT", 2))
+    SPOOL_DRAIN_INTERVAL: float = float(os.getenv("SPOOL_DRAIN_INTERVAL", 5))
+    SPOOL_DRAIN_BATCH: int = int(os.getenv("SPOOL_DRAIN_BATCH", 500))
+
+    # Export
+    EXPORT_PAGE_SIZE: int = int(os.getenv("EXPORT_PAGE_SIZE", 5000))
+    EXPORT_COMPRESS_LEVEL: int = int(os.getenv("EXPORT_COMPRESS_LEVEL", 6))
+
+    # Retention (RETENTION_DEFAULT_DAYS=0 keeps raw events of apps without a policy forever)
+    RETENTION_DEFAULT_DAYS: int = int(os.getenv("RETENTION_DEFAULT_DAYS", 0))
+    RETENTION_ARCHIVE_DIR: str = os.getenv("RETENTION_ARCHIVE_DIR", "archive")
+    RETENTION_SCAN_BATCH: int = int(os.getenv("RETENTION_SCAN_BATCH", 5000))
+    RETENTION_DELETE_BATCH: int = int(os.getenv("RETENTION_DELETE_BATCH", 500))
+    # Share of wall time spent in retention writes; the rest is spent pausing
+    RETENTION_DUTY_CYCLE: float = float(os.getenv("RETENTION_DUTY_CYCLE", 0.25))
+
+    # Analytics queries: concurrent queries and transaction timeout (seconds) per class
+    QUERY_LOOKUP_CONCURRENCY: int = int(os.getenv("QUERY_LOOKUP_CONCURRENCY", 32))
+    QUERY_LOOKUP_TIMEOUT: float = float(os.getenv("QUERY_LOOKUP_TIMEOUT", 5))
+    QUERY_AGGREGATE_CONCURRENCY: int = int(os.getenv("QUERY_AGGREGATE_CONCURRENCY", 8))
+    QUERY_AGGREGATE_TIMEOUT: float = float(os.getenv("QUERY_AGGREGATE_TIMEOUT", 30))
+    QUERY_CUSTOM_CONCURRENCY: int = int(os.getenv("QUERY_CUSTOM_CONCURRENCY", 2))
+    QUERY_CUSTOM_TIMEOUT: float = float(os.getenv("QUERY_CUSTOM_TIMEOUT", 60))
+    QUERY_EXPORT_CONCURRENCY: int = int(os.getenv("QUERY_EXPORT_CONCURRENCY", 2))
+    QUERY_EXPORT_TIMEOUT: float = float(os.getenv("QUERY_EXPORT_TIMEOUT", 60))  # per page
+    QUERY_QUEUE_TIMEOUT: float = float(os.getenv("QUERY_QUEUE_TIMEOUT", 5))
+    CANCEL_ON_DISCONNECT_PREFIXES: list = os.getenv("CANCEL_ON_DISCONNECT_PREFIXES", "/api/v1/analytics, /graphql").replace(" ", "").split(',')
+
+    # Logging
+    LOG_LEVEL: str = os.getenv("LOG_LEVEL", "INFO").upper()
+    LOG_FORMAT: str = os.getenv("LOG_FORMAT", "text")  # text | json
+    LOG_QUEUE_SIZE: int = int(os.getenv("LOG_QUEUE_SIZE", 10_000))
+    # Records per second per logger below ERROR, e.g. "Artello.consumer=50, Artello.spool=5"
+    LOG_RATE_LIMITS: dict = {
+        name.strip(): float(rate)
+        for name, rate in (item.split("=") for item in os.getenv("LOG_RATE_LIMITS", "Artello=200, Artello.consumer=50").split(',') if item.strip())
+    }
+    # Levels of chatty client libraries, which log every request or frame at INFO/DEBUG
+    LOG_LIBRARY_LEVELS: dict = {
+        name.strip(): level.strip().upper()
+        for name, level in (item.split("=") for item in os.getenv("LOG_LIBRARY_LEVELS", "httpx=WARNING, aio_pika=WARNING, aiormq=WARNING, neo4j=WARNING").split(',') if item.strip())
+    }
+
+    # Profiling (off unless sampled or requested with X-Profile)
+    PROFILE_SAMPLE_RATE: float = float(os.getenv("PROFILE_SAMPLE_RATE", 0))
+    PROFILE_PATH_PREFIXES: list = os.getenv("PROFILE_PATH_PREFIXES", "/api/v1/analytics, /graphql").replace(" ", "").split(',')
+    PROFILE_ADMIN_TOKEN: str = os.getenv("PROFILE_ADMIN_TOKEN")
+    PROFILE_INTERVAL_MS: float = float(os.getenv("PROFILE_INTERVAL_MS", 5))
+    PROFILE_DIR: str = os.getenv("PROFILE_DIR", "profiles")
+    PROFILE_MAX_FILES: int = int(os.getenv("PROFILE_MAX_FILES", 200))
+
+    # Error reporting (empty disables Sentry)
+    SENTRY_DSN: str = os.getenv(
+        "SENTRY_DSN",
+        "https://2bf2e31cc41200064f4ceb52ead97f64@o4509057246822400.ingest.de.sentry.io/4509057250754640",
+    )
 
     # Security
     SECRET_KEY: str = os.getenv("SECRET_KEY")
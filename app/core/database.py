@@ -8,13 +8,22 @@ class MongoDB:
 
     @classmethod
     def connect(cls):
-        """Initialize MongoDB connection"""
-        cls.client = AsyncIOMotorClient(settings.MONGO_URI)
+        """Initialize MongoDB connection once; motor connects on first use"""
+        if cls.client is None:
+            cls.client = AsyncIOMotorClient(settings.MONGO_URI)
+        return cls.client
 
     @classmethod
     def get_db(cls):
         """Return MongoDB Database instance"""
-        return cls.client.get_database()
+        return cls.connect().get_database()
+
+    @classmethod
+    def close(cls):
+        """Close MongoDB connection"""
+        if cls.client is not None:
+            cls.client.close()
+            cls.client = None
 
 # Neo4j Connection
 class Neo4jDB:
@@ -22,18 +31,23 @@ class Neo4jDB:
 
     @classmethod
     def connect(cls):
-        """Initialize Neo4j connection"""
-        cls.driver = AsyncGraphDatabase.driver(
-            settings.NEO4J_URI,
-            auth=(settings.NEO4J_USER, settings.NEO4J_PASSWORD)
-        )
+        """Initialize Neo4j connection once; the driver connects on first use"""
+        if cls.driver is None:
+            cls.driver = AsyncGraphDatabase.driver(
+                settings.NEO4J_URI,
+                auth=(settings.NEO4J_USER, settings.NEO4J_PASSWORD),
+                max_connection_pool_size=settings.NEO4J_MAX_POOL_SIZE,
+            )
+        return cls.driver
 
     @classmethod
-    def close(cls):
-        """Close Neo4j connection"""
-        if cls.driver:
-            cls.driver.close()
+    def get_driver(cls):
+        """Return the Neo4j driver, creating it on first use"""
+        return cls.driver or cls.connect()
 
-# Initialize Databases
-MongoDB.connect()
-Neo4jDB.connect()
+    @classmethod
+    async def close(cls):
+        """Close Neo4j connection"""
+        if cls.driver is not None:
+            await cls.driver.close()
+            cls.driver = None
@@ -1,8 +1,149 @@
 # app/core/logger.py
+"""
+Non-blocking, structured logging.
+
+Log calls only build a `LogRecord` and put it on a bounded in-memory queue;
+a `QueueListener` thread does the formatting and the stream I/O. Structured
+fields are passed with `extra` and rendered after the message:
+
+    logger.warning("Failed to store event", extra={"app_id": a, "session_id": s, "event_id": e})
+
+Records below ERROR are rate limited per logger (`LOG_RATE_LIMITS`, records
+per second), and the next record that gets through reports how many were
+suppressed. When the queue is full, records are dropped rather than
+blocking the event loop; both are counted in `artello_log_records_dropped_total`.
+"""
+import atexit
+import json
 import logging
+import queue
+import time
+from logging.handlers import QueueHandler, QueueListener
+from app.core.config import settings
+from app.core.metrics import LOG_RECORDS_DROPPED
+
+STRUCTURED_FIELDS = ("app_id", "session_id", "event_id", "suppressed")
+
+class StructuredFormatter(logging.Formatter):
+    """
+    Renders records as text with trailing `key=value` fields, or as JSON lines.
+    """
+    def __init__(self, as_json: bool = False):
+        super().__init__("%(asctime)s [%(levelname)s] %(name)s - %(message)s")
+        self.as_json = as_json
+
+    def format(self, record):
+        fields = {k: getattr(record, k) for k in STRUCTURED_FIELDS if getattr(record, k, None) is not None}
+        if not self.as_json:
+            text = super().format(record)
+            if fields:
+                text += " " + " ".join(f"{k}={v}" for k, v in fields.items())
+            return text
+
+        entry = {
+            "ts": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            **fields,
+        }
+        if record.exc_info:
+            entry["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+class RateLimitFilter(logging.Filter):
+    """
+    Token bucket per logger name for records below ERROR.
+    """
+    def __init__(self, limits: dict):
+        super().__init__()
+        self.limits = limits
+        self.buckets = {}
+
+    def _limit_for(self, name: str):
+        # The most specific configured ancestor applies
+        while name:
+            if name in self.limits:
+                return self.limits[name]
+            name = name.rpartition(".")[0]
+        return None
+
+    def filter(self, record):
+        if record.levelno >= logging.ERROR:
+            return True
+        bucket = self.buckets.get(record.name)
+        if bucket is None:
+            rate = self._limit_for(record.name)
+            if rate is None:
+                return True
+            bucket = self.buckets[record.name] = [rate, rate, time.monotonic(), 0]
+
+        rate, tokens, last, suppressed = bucket
+        now = time.monotonic()
+        tokens = min(rate, tokens + (now - last) * rate)
+        if tokens < 1:
+            bucket[1:] = [tokens, now, suppressed + 1]
+            LOG_RECORDS_DROPPED.inc("rate_limited")
+            return False
+        bucket[1:] = [tokens - 1, now, 0]
+        if suppressed:
+            record.suppressed = suppressed
+        return True
+
+class BackgroundQueueHandler(QueueHandler):
+    """
+    Enqueues records without formatting them, dropping them when the queue is full.
+    """
+    def prepare(self, record):
+        # The listener thread formats; the record never leaves this process
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            LOG_RECORDS_DROPPED.inc("queue_full")
+
+_listener: QueueListener = None
+
+def setup_logging():
+    """
+    Routes root logging through the background listener. Safe to call repeatedly.
+    """
+    global _listener
+    if _listener is not None:
+        return
+
+    stream = logging.StreamHandler()
+    stream.setFormatter(StructuredFormatter(as_json=settings.LOG_FORMAT == "json"))
+    records = queue.Queue(settings.LOG_QUEUE_SIZE)
+    handler = BackgroundQueueHandler(records)
+    handler.addFilter(RateLimitFilter(settings.LOG_RATE_LIMITS))
+
+    root = logging.getLogger()
+    for existing in root.handlers[:]:
+        root.removeHandler(existing)
+    root.addHandler(handler)
+    root.setLevel(settings.LOG_LEVEL)
+    for name, level in settings.LOG_LIBRARY_LEVELS.items():
+        logging.getLogger(name).setLevel(level)
+
+    _listener = QueueListener(records, stream, respect_handler_level=True)
+    _listener.start()
+    atexit.register(stop_logging)
+
+def stop_logging():
+    """
+    Writes out queued records and stops the listener thread.
+    """
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+def get_logger(name: str) -> logging.Logger:
+    return logger.getChild(name)
 
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s [%(levelname)s] %(name)s - %(message)s"
-)
-logger = logging.getLogger("Artello")
\ No newline at end of file
+# Entry points (app.main, app.worker, the CLIs) call setup_logging(); importing
+# this module has no side effects
+logger = logging.getLogger("Artello")
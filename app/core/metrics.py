@@ -0,0 +1,210 @@
+"""
+Minimal Prometheus-style metrics, kept per worker process.
+
+Metrics are plain Python counters updated from the event loop thread, so
+recording needs no locks: a counter increment is a dict update and a
+histogram observation is a bisect plus two additions. Each process exposes
+its own values on `/metrics` (standalone workers through `serve()`);
+aggregate across workers in Prometheus.
+
+Label values must come from small, fixed sets (paths, queues, query
+classes); per-app breakdowns belong in the analytics API, not in series.
+Scrapes need `Authorization: Bearer <METRICS_TOKEN>` when the token is set.
+Without it, `/metrics` and the worker ports are open and must only be
+reachable from the internal network.
+"""
+import asyncio
+import bisect
+import functools
+import hmac
+import inspect
+import time
+from app.core.config import settings
+
+REGISTRY = []
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+LAG_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300, 900)
+SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256, 512)
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _label_text(names, values) -> str:
+    if not names:
+        return ""
+    pairs = ",".join(f'{n}="{_escape(v)}"' for n, v in zip(names, values))
+    return "{" + pairs + "}"
+
+def authorized(authorization: str = None) -> bool:
+    """
+    Whether a scrape's Authorization header grants access to the metrics.
+    """
+    if not settings.METRICS_TOKEN:
+        return True
+    return hmac.compare_digest((authorization or "").encode(), f"Bearer {settings.METRICS_TOKEN}".encode())
+
+class Counter:
+    __slots__ = ("name", "help", "labelnames", "values")
+
+    def __init__(self, name: str, help: str, labelnames: tuple = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self.values = {}
+        REGISTRY.append(self)
+
+    def inc(self, *labels, amount: float = 1):
+        self.values[labels] = self.values.get(labels, 0) + amount
+
+    def render(self):
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} counter"
+        for labels, value in self.values.items():
+            yield f"{self.name}{_label_text(self.labelnames, labels)} {value}"
+
+class Gauge:
+    """
+    A gauge whose value is read from a callback at scrape time.
+    """
+    __slots__ = ("name", "help", "read")
+
+    def __init__(self, name: str, help: str, read):
+        self.name = name
+        self.help = help
+        self.read = read
+        REGISTRY.append(self)
+
+    def render(self):
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} gauge"
+        yield f"{self.name} {self.read()}"
+
+class _Timer:
+    __slots__ = ("histogram", "labels", "started")
+
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.started, *self.labels)
+
+class Histogram:
+    __slots__ = ("name", "help", "labelnames", "buckets", "series")
+
+    def __init__(self, name: str, help: str, labelnames: tuple = (), buckets: tuple = LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self.buckets = buckets
+        # labels -> [per-bucket counts (+Inf last), sum]
+        self.series = {}
+        REGISTRY.append(self)
+
+    def observe(self, value: float, *labels):
+        series = self.series.get(labels)
+        if series is None:
+            series = self.series[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+        series[0][bisect.bisect_left(self.buckets, value)] += 1
+        series[1] += value
+
+    def time(self, *labels) -> _Timer:
+        return _Timer(self, labels)
+
+    def render(self):
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} histogram"
+        for labels, (counts, total) in self.series.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), counts):
+                cumulative += count
+                le = _label_text(self.labelnames + ("le",), labels + (bound,))
+                yield f"{self.name}_bucket{le} {cumulative}"
+            yield f"{self.name}_sum{_label_text(self.labelnames, labels)} {total}"
+            yield f"{self.name}_count{_label_text(self.labelnames, labels)} {cumulative}"
+
+def timed(metric: Histogram, *labels):
+    """
+    Decorator recording a function's latency. Works for sync and async
+    functions and keeps the signature intact for FastAPI dependencies.
+    """
+    def decorator(func):
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                started = time.perf_counter()
+                try:
+                    return await func(*args, **kwargs)
+                finally:
+                    metric.observe(time.perf_counter() - started, *labels)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                metric.observe(time.perf_counter() - started, *labels)
+        return wrapper
+    return decorator
+
+def render() -> str:
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+async def _answer_scrape(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+    try:
+        authorization = None
+        async with asyncio.timeout(5):
+            request_line = await reader.readline()
+            while (line := (await reader.readline()).strip()):
+                name, _, value = line.partition(b":")
+                if name.strip().lower() == b"authorization":
+                    authorization = value.strip().decode("latin-1")
+        if request_line.split(b" ")[1:2] != [b"/metrics"]:
+            status, body = "404 Not Found", b"Not found\n"
+        elif not authorized(authorization):
+            status, body = "401 Unauthorized", b"Unauthorized\n"
+        else:
+            status, body = "200 OK", render().encode()
+        writer.write(
+            f"HTTP/1.1 {status}\r\nContent-Type: text/plain; version=0.0.4\r\n"
+            f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode() + body
+        )
+        await writer.drain()
+    except (ConnectionError, TimeoutError):
+        pass
+    finally:
+        writer.close()
+
+async def serve(port: int, host: str = "0.0.0.0") -> asyncio.Server:
+    """
+    Serves `GET /metrics` over plain HTTP, for processes without the API.
+    """
+    return await asyncio.start_server(_answer_scrape, host, port)
+
+# Pipeline metrics
+AUTH_LATENCY = Histogram("artello_auth_seconds", "Authentication dependency latency", ("method",))
+INGEST_PUBLISH_LATENCY = Histogram("artello_ingest_publish_seconds", "Time to publish an event to RabbitMQ")
+INGEST_REJECTED = Counter("artello_ingest_rejected_total", "Ingest requests shed by admission control", ("reason",))
+INGEST_SPOOLED = Counter("artello_ingest_spooled_total", "Events written to the local spool")
+QUEUE_LAG = Histogram("artello_queue_lag_seconds", "Time between publish and consumption", buckets=LAG_BUCKETS)
+CONSUMER_BATCH = Histogram("artello_consumer_batch_size", "Messages handled per consumer batch", buckets=SIZE_BUCKETS)
+EVENTS_STORED = Counter("artello_events_stored_total", "Events written to Neo4j")
+EVENTS_SAMPLED_OUT = Counter("artello_events_sampled_out_total", "Events dropped by server-side sampling")
+EVENTS_DEDUPLICATED = Counter("artello_events_deduplicated_total", "Duplicate events dropped")
+EVENTS_PARKED = Counter("artello_events_parked_total", "Failed messages parked", ("queue",))
+NEO4J_WRITE_LATENCY = Histogram("artello_neo4j_write_seconds", "Neo4j write latency", ("path",))
+QUERY_LATENCY = Histogram("artello_query_seconds", "Analytics query latency", ("query",))
+QUERIES_SHED = Counter("artello_queries_shed_total", "Analytics queries rejected waiting for a slot", ("query_class",))
+QUERIES_TIMED_OUT = Counter("artello_queries_timed_out_total", "Analytics queries aborted by their timeout", ("query_class",))
+REQUESTS_CANCELLED = Counter("artello_requests_cancelled_total", "Requests cancelled after the client disconnected")
+LOG_RECORDS_DROPPED = Counter("artello_log_records_dropped_total", "Log records dropped before output", ("reason",))
@@ -0,0 +1,220 @@
+"""
+Opt-in sampling profiler for individual HTTP requests.
+
+`ProfilingMiddleware` profiles a random `PROFILE_SAMPLE_RATE` fraction of
+requests under `PROFILE_PATH_PREFIXES`, plus any request whose
+`X-Profile` header matches `PROFILE_ADMIN_TOKEN`. While a profiled request
+is in flight, a sampler thread records the request task's stack every
+`PROFILE_INTERVAL_MS`: the running frames when the task is on the event
+loop, or the suspended coroutine chain (under an `[await]` frame) while it
+waits on I/O, so profiles show wall time rather than CPU time only.
+
+Each profile is written to `PROFILE_DIR` as `<name>.folded`, in the
+folded-stack format read by flamegraph.pl and speedscope, next to a
+`<name>.json` with its route, tenant, status and duration. Only the newest
+`PROFILE_MAX_FILES` profiles are kept.
+"""
+import asyncio
+import hmac
+import json
+import os
+import random
+import re
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from app.core.config import settings
+from app.core.logger import get_logger
+
+logger = get_logger("profiling")
+
+PROFILE_HEADER = b"x-profile"
+PROFILE_ID_HEADER = b"x-profile-id"
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    module = frame.f_globals.get("__name__", os.path.basename(code.co_filename))
+    return f"{module}:{code.co_name}:{frame.f_lineno}"
+
+def _running_stack(frame, stop_at) -> list:
+    """
+    Walks a running frame outwards, stopping at the coroutine the task started with.
+    """
+    stack = []
+    while frame is not None:
+        stack.append(_frame_label(frame))
+        if frame.f_code is stop_at:
+            break
+        frame = frame.f_back
+    stack.reverse()
+    return stack
+
+def _suspended_stack(coro) -> list:
+    """
+    Follows a suspended coroutine's await chain from the outermost call inwards.
+    """
+    stack = []
+    while coro is not None:
+        frame = getattr(coro, "cr_frame", None) or getattr(coro, "gi_frame", None)
+        if frame is None:
+            break
+        stack.append(_frame_label(frame))
+        coro = getattr(coro, "cr_await", None) or getattr(coro, "gi_yieldfrom", None)
+    stack.append("[await]")
+    return stack
+
+class RequestProfile:
+    __slots__ = ("task", "loop", "thread_id", "root_code", "samples", "started")
+
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.loop = task.get_loop()
+        self.thread_id = threading.get_ident()
+        self.root_code = task.get_coro().cr_code
+        self.samples = Counter()
+        self.started = time.perf_counter()
+
+    def sample(self, frames: dict):
+        try:
+            if asyncio.current_task(self.loop) is self.task:
+                stack = _running_stack(frames.get(self.thread_id), self.root_code)
+            else:
+                stack = _suspended_stack(self.task.get_coro())
+        except (RuntimeError, AttributeError, ValueError):
+            # The task moved on while we were reading it; skip this sample
+            return
+        if stack:
+            self.samples[";".join(stack)] += 1
+
+class Sampler:
+    """
+    One background thread sampling every request profile that is in flight.
+    """
+    active: set = set()
+    _lock = threading.Lock()
+    _wakeup = threading.Event()
+    _thread: threading.Thread = None
+
+    @classmethod
+    def add(cls, profile: RequestProfile):
+        with cls._lock:
+            cls.active.add(profile)
+            if cls._thread is None or not cls._thread.is_alive():
+                cls._thread = threading.Thread(target=cls._run, name="request-profiler", daemon=True)
+                cls._thread.start()
+        cls._wakeup.set()
+
+    @classmethod
+    def remove(cls, profile: RequestProfile):
+        with cls._lock:
+            cls.active.discard(profile)
+
+    @classmethod
+    def _run(cls):
+        interval = settings.PROFILE_INTERVAL_MS / 1000
+        while True:
+            with cls._lock:
+                profiles = list(cls.active)
+                if not profiles:
+                    cls._wakeup.clear()
+            if not profiles:
+                cls._wakeup.wait()
+                continue
+            frames = sys._current_frames()
+            for profile in profiles:
+                profile.sample(frames)
+            del frames
+            time.sleep(interval)
+
+def _slug(text: str) -> str:
+    return re.sub(r"[^A-Za-z0-9_.-]+", "_", text).strip("_")[:60] or "root"
+
+def write_profile(profile_id: str, samples: Counter, meta: dict):
+    """
+    Writes the folded stacks and metadata of one profile, then rotates the directory.
+    """
+    directory = settings.PROFILE_DIR
+    os.makedirs(directory, exist_ok=True)
+    name = f"{time.strftime('%Y%m%dT%H%M%S')}-{_slug(meta['route'])}-{_slug(str(meta['tenant']))}-{profile_id}"
+    with open(os.path.join(directory, name + ".folded"), "w") as f:
+        for stack, count in samples.most_common():
+            f.write(f"{stack} {count}\n")
+    with open(os.path.join(directory, name + ".json"), "w") as f:
+        json.dump(meta, f, indent=2)
+
+    profiles = sorted(p for p in os.listdir(directory) if p.endswith(".folded"))
+    for old in profiles[:max(0, len(profiles) - settings.PROFILE_MAX_FILES)]:
+        for suffix in (".folded", ".json"):
+            try:
+                os.remove(os.path.join(directory, old[:-len(".folded")] + suffix))
+            except FileNotFoundError:
+                pass
+
+class ProfilingMiddleware:
+    """
+    ASGI middleware that profiles sampled or admin-requested HTTP requests.
+    """
+    def __init__(self, app):
+        self.app = app
+        self.prefixes = tuple(p for p in settings.PROFILE_PATH_PREFIXES if p)
+        self.admin_token = (settings.PROFILE_ADMIN_TOKEN or "").encode()
+
+    def _requested(self, scope) -> bool:
+        if not self.admin_token:
+            return False
+        for name, value in scope.get("headers", ()):
+            if name == PROFILE_HEADER:
+                return hmac.compare_digest(value, self.admin_token)
+        return False
+
+    def _sampled(self, scope) -> bool:
+        return (
+            settings.PROFILE_SAMPLE_RATE > 0
+            and scope["path"].startswith(self.prefixes)
+            and random.random() < settings.PROFILE_SAMPLE_RATE
+        )
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        requested = self._requested(scope)
+        if not (requested or self._sampled(scope)):
+            return await self.app(scope, receive, send)
+
+        profile_id = uuid.uuid4().hex[:12]
+        status = None
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                if requested:
+                    message["headers"] = [*message.get("headers", []), (PROFILE_ID_HEADER, profile_id.encode())]
+            await send(message)
+
+        profile = RequestProfile(asyncio.current_task())
+        Sampler.add(profile)
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            Sampler.remove(profile)
+            route = scope.get("route")
+            meta = {
+                "profile_id": profile_id,
+                "method": scope["method"],
+                "path": scope["path"],
+                "route": getattr(route, "path", scope["path"]),
+                "tenant": scope.get("state", {}).get("tenant", "anonymous"),
+                "status": status,
+                "duration_ms": round((time.perf_counter() - profile.started) * 1000, 3),
+                "interval_ms": settings.PROFILE_INTERVAL_MS,
+                "samples": sum(profile.samples.values()),
+                "trigger": "header" if requested else "sample",
+            }
+            try:
+                await asyncio.to_thread(write_profile, profile_id, profile.samples, meta)
+            except OSError as e:
+                logger.warning("Writing profile %s failed: %r", profile_id, e)
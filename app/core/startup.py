@@ -0,0 +1,126 @@
+"""
+Process startup and shutdown for the API and the workers.
+
+Clients are created lazily and once (see `MongoDB.connect`,
+`Neo4jDB.connect`, `EventQueue.get_channel`); startup only runs the
+readiness checks, concurrently and with a timeout, so a slow dependency
+neither blocks the others nor the process. Every phase is timed, starting
+from the import of this module, and `Startup.report()` exposes the
+breakdown on `/health`.
+"""
+import asyncio
+import time
+from contextlib import contextmanager
+from app.core.config import settings
+from app.core.database import MongoDB, Neo4jDB
+from app.core.logger import get_logger
+
+logger = get_logger("startup")
+
+async def check_mongo():
+    await MongoDB.connect().admin.command("ping")
+
+async def check_neo4j():
+    await Neo4jDB.get_driver().verify_connectivity()
+
+async def check_rabbitmq():
+    from app.api.v1.events.services import EventQueue
+    await EventQueue.get_channel()
+
+READINESS_CHECKS = {
+    "mongo": check_mongo,
+    "neo4j": check_neo4j,
+    "rabbitmq": check_rabbitmq,
+}
+
+class Startup:
+    started_at: float = time.perf_counter()
+    timings: dict = {}
+    checks: dict = {}
+
+    @classmethod
+    @contextmanager
+    def phase(cls, name: str):
+        """
+        Times a startup phase, e.g. an import group or the readiness checks.
+        """
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            cls.timings[name] = round((time.perf_counter() - started) * 1000, 3)
+
+    @classmethod
+    def mark(cls, name: str):
+        """
+        Records the time elapsed since this module was imported.
+        """
+        cls.timings[name] = round((time.perf_counter() - cls.started_at) * 1000, 3)
+
+    @classmethod
+    async def _check(cls, name: str, check):
+        started = time.perf_counter()
+        try:
+            await asyncio.wait_for(check(), settings.STARTUP_CHECK_TIMEOUT)
+            status = "ok"
+        except Exception as e:
+            status = f"error: {type(e).__name__}: {e}"
+            logger.warning("Readiness check %s failed: %r", name, e)
+        cls.checks[name] = {
+            "status": status,
+            "ms": round((time.perf_counter() - started) * 1000, 3),
+        }
+
+    @classmethod
+    async def check_readiness(cls, names=None):
+        """
+        Runs the readiness checks concurrently; failures are reported, not raised.
+        """
+        names = names or READINESS_CHECKS.keys()
+        with cls.phase("readiness"):
+            await asyncio.gather(*(cls._check(name, READINESS_CHECKS[name]) for name in names))
+        return cls.ready()
+
+    @classmethod
+    async def recheck_failed(cls):
+        """
+        Re-runs the checks that failed, outside the timed startup phases.
+        """
+        failed = [name for name, check in cls.checks.items() if check["status"] != "ok"]
+        await asyncio.gather(*(cls._check(name, READINESS_CHECKS[name]) for name in failed))
+        return cls.ready()
+
+    @classmethod
+    def ready(cls) -> bool:
+        return all(check["status"] == "ok" for check in cls.checks.values())
+
+    @classmethod
+    def report(cls) -> dict:
+        return {
+            "status": "ok" if cls.ready() else "degraded",
+            "checks": cls.checks,
+            "timings_ms": cls.timings,
+        }
+
+def init_sentry():
+    """
+    Initializes Sentry when a DSN is configured; must run before the app is built.
+    """
+    if not settings.SENTRY_DSN:
+        return
+    import sentry_sdk
+    sentry_sdk.init(
+        dsn=settings.SENTRY_DSN,
+        # Add data like request headers and IP for users,
+        # see https://docs.sentry.io/platforms/python/data-management/data-collected/ for more info
+        send_default_pii=True,
+    )
+
+async def close_clients():
+    """
+    Closes the shared broker connection and the database drivers.
+    """
+    from app.api.v1.events.services import EventQueue
+    await EventQueue.close()
+    await Neo4jDB.close()
+    MongoDB.close()
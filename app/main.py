@@ -1,43 +1,72 @@
-from fastapi import FastAPI
-from app.core.security import setup_cors
-from app.core.database import MongoDB, Neo4jDB
+from app.core.startup import Startup, init_sentry, close_clients
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, PlainTextResponse
 from contextlib import asynccontextmanager
 import asyncio
-from app.api.v1.events.consumer import process_event
-import sentry_sdk
+
+with Startup.phase("import.core"):
+    from app.core.security import setup_cors
+    from app.core.profiling import ProfilingMiddleware
+    from app.core.cancellation import CancelOnDisconnectMiddleware
+    from app.core.config import settings
+    from app.core import metrics
+    from app.core.logger import logger, setup_logging
+    setup_logging()
+
+with Startup.phase("import.pipeline"):
+    from app.api.v1.events.consumer import process_event
+    from app.api.v1.events.services import EventQueue
+    from app.api.v1.events.admission import IngestAdmission
+    from app.api.v1.events.spool import EventSpool
+    from app.api.v1.events.rates import RateStore
 
 # Import Routes
-from app.api.v1.auth.routes import auth_router
-from app.api.v1.apps.routes import app_router
-from app.api.v1.events.routes import event_router
-from app.api.v1.events.analytics import analytics_router
-from app.api.v1.graphql.routes import graphql_router
+with Startup.phase("import.routes"):
+    from app.api.v1.auth.routes import auth_router
+    from app.api.v1.apps.routes import app_router
+    from app.api.v1.events.routes import event_router
+    from app.api.v1.events.analytics import analytics_router
+    from app.api.v1.graphql.routes import graphql_router
 
 # Sentry Integration
-sentry_sdk.init(
-    dsn="https://2bf2e31cc41200064f4ceb52ead97f64@o4509057246822400.ingest.de.sentry.io/4509057250754640",
-    # Add data like request headers and IP for users,
-    # see https://docs.sentry.io/platforms/python/data-management/data-collected/ for more info
-    send_default_pii=True,
-)
+with Startup.phase("sentry"):
+    init_sentry()
 
 # Define lifespan context manager
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """Lifespan event handlers for startup and shutdown."""
     # Startup logic
-    MongoDB.connect()
-    Neo4jDB.connect()
-    asyncio.create_task(process_event())
+    Startup.mark("lifespan")
+    await Startup.check_readiness()
+    consumer_stop = asyncio.Event()
+    consumer = asyncio.create_task(process_event(stop=consumer_stop)) if settings.EMBEDDED_CONSUMER else None
+    IngestAdmission.start_monitor(EventQueue.get_channel)
+    RateStore.start_subscriber()
+    if settings.SPOOL_ENABLED:
+        EventSpool.start_drainer()
+    Startup.mark("ready")
+    logger.info("Startup finished: %s", Startup.report())
     yield
     # Shutdown logic
-    Neo4jDB.close()
+    if consumer:
+        consumer_stop.set()
+        try:
+            await asyncio.wait_for(consumer, settings.CONSUMER_SHUTDOWN_TIMEOUT)
+        except Exception as e:
+            logger.warning("Embedded consumer did not stop cleanly: %r", e)
+    await IngestAdmission.stop_monitor()
+    await RateStore.unsubscribe()
+    await EventSpool.stop_drainer()
+    await close_clients()
 
 # Initialize FastAPI App with lifespan
 app = FastAPI(title="Artello API", version="1.0.0", lifespan=lifespan)
 
 # Setup Security Middleware
 setup_cors(app)
+app.add_middleware(ProfilingMiddleware)
+app.add_middleware(CancelOnDisconnectMiddleware)
 
 # Register Routes
 app.include_router(auth_router, prefix="/api/v1/auth")
@@ -45,6 +74,26 @@ app.include_router(app_router, prefix="/api/v1/apps")
 app.include_router(event_router, prefix="/api/v1/events")
 app.include_router(analytics_router, prefix="/api/v1/analytics")
 app.include_router(graphql_router, prefix="/graphql")
+Startup.mark("import")
+
+@app.get("/health", include_in_schema=False)
+async def get_health():
+    """
+    Readiness check results and the startup timing breakdown. Failed checks
+    are re-run, and the response is 503 while any of them still fails.
+    """
+    ready = Startup.ready() or await Startup.recheck_failed()
+    return JSONResponse(Startup.report(), status_code=200 if ready else 503)
+
+@app.get("/metrics", include_in_schema=False)
+async def get_metrics(request: Request):
+    """
+    Prometheus scrape endpoint for this worker's pipeline metrics. Open
+    unless METRICS_TOKEN is set, so it must not be exposed publicly then.
+    """
+    if not metrics.authorized(request.headers.get("authorization")):
+        return PlainTextResponse("Unauthorized", status_code=401, headers={"WWW-Authenticate": "Bearer"})
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
 
 @app.get("/sentry-debug")
 async def trigger_error():
@@ -0,0 +1,116 @@
+"""
+Standalone event consumer, scaled independently of the API.
+
+    python -m app.worker --processes 4 --prefetch 256
+
+Run the API with EMBEDDED_CONSUMER=false when dedicated workers are deployed.
+Process `i` serves its Prometheus metrics (consumer batches, queue lag,
+Neo4j write latency, events stored) on port `--metrics-port` + i at `/metrics`.
+SIGTERM/SIGINT stop consuming, finish the batch in flight and return any
+prefetched messages to the queue before exiting.
+"""
+import argparse
+import asyncio
+import multiprocessing
+import os
+import signal
+import time
+from app.core.startup import Startup, close_clients
+from app.core.config import settings
+from app.core.logger import get_logger, setup_logging
+from app.core import metrics
+
+logger = get_logger("worker")
+
+def run_consumer(prefetch: int, metrics_port: int, index: int = None, processes: int = 1):
+    """
+    Entry point of one worker process. With a configured `WORKER_ID`,
+    supervised processes get the stable worker id `<WORKER_ID>-<index>`,
+    which survives restarts.
+    """
+    setup_logging()
+    # Per-process shares (sampling targets) are split across the workers, not the API
+    settings.EMBEDDED_CONSUMER = False
+    settings.WORKER_PROCESSES = processes
+    if index is not None and os.getenv("WORKER_ID"):
+        settings.WORKER_ID = f"{settings.WORKER_ID}-{index}"
+    asyncio.run(consume(prefetch, metrics_port + (index or 0) if metrics_port else 0))
+
+async def consume(prefetch: int, metrics_port: int = 0):
+    with Startup.phase("import.pipeline"):
+        from app.api.v1.events.consumer import process_event
+    await Startup.check_readiness(["mongo", "neo4j"])
+    server = None
+    if metrics_port:
+        try:
+            server = await metrics.serve(metrics_port)
+        except OSError as e:
+            logger.warning("Metrics unavailable, cannot listen on port %s: %r", metrics_port, e)
+    Startup.mark("ready")
+    logger.info("Worker startup finished: %s", Startup.report())
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(signum, stop.set)
+
+    try:
+        await process_event(prefetch, stop)
+    finally:
+        if server:
+            server.close()
+        await close_clients()
+
+def supervise(processes: int, prefetch: int, metrics_port: int):
+    """
+    Runs `processes` worker processes and restarts any that die unexpectedly.
+    """
+    context = multiprocessing.get_context("spawn")
+    stopping = False
+
+    def start(index: int):
+        process = context.Process(target=run_consumer, args=(prefetch, metrics_port, index, processes), name=f"artello-worker-{index}")
+        process.start()
+        return process
+
+    workers = [start(i) for i in range(processes)]
+
+    def shutdown(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for process in workers:
+            if process.is_alive():
+                process.terminate()
+
+    signal.signal(signal.SIGTERM, shutdown)
+    signal.signal(signal.SIGINT, shutdown)
+
+    while not stopping:
+        for index, process in enumerate(workers):
+            if not process.is_alive() and not stopping:
+                logger.warning("Worker %s exited with %s, restarting", process.name, process.exitcode)
+                workers[index] = start(index)
+        time.sleep(1)
+
+    deadline = time.monotonic() + settings.CONSUMER_SHUTDOWN_TIMEOUT
+    for process in workers:
+        process.join(timeout=max(0, deadline - time.monotonic()))
+        if process.is_alive():
+            logger.warning("Worker %s did not drain in time, killing it", process.name)
+            process.kill()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--processes", type=int, default=settings.WORKER_PROCESSES, help="Number of consumer processes")
+    parser.add_argument("--prefetch", type=int, default=settings.CONSUMER_PREFETCH, help="Unacked messages per consumer")
+    parser.add_argument("--metrics-port", type=int, default=settings.WORKER_METRICS_PORT, help="Metrics port of the first process (0 disables)")
+    args = parser.parse_args()
+    setup_logging()
+
+    if args.processes <= 1:
+        run_consumer(args.prefetch, args.metrics_port)
+    else:
+        supervise(args.processes, args.prefetch, args.metrics_port)
+
+if __name__ == "__main__":
+    main()
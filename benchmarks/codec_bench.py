@@ -0,0 +1,100 @@
+"""
+Compares the JSON queue message format with the binary envelope.
+
+    python -m benchmarks.codec_bench --events 20000 --batch 100
+
+Reports bytes per event and encode/decode time per event for single-event
+JSON messages, single-event binary messages and zlib-compressed binary batches.
+"""
+import argparse
+import json
+import random
+import string
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+
+from app.api.v1.events import codec
+from app.api.v1.events.models import EventModel
+
+EVENT_TYPES = ["page_view", "click", "scroll", "mousemove", "add_to_cart", "checkout"]
+
+def synthetic_events(count: int, seed: int = 7):
+    """
+    Builds realistic-looking SDK events with small, repetitive payloads.
+    """
+    rng = random.Random(seed)
+    start = datetime(2025, 1, 1, tzinfo=timezone.utc)
+    app_id = uuid.UUID(int=rng.getrandbits(128)).hex
+    sessions = [uuid.UUID(int=rng.getrandbits(128)).hex for _ in range(max(1, count // 20))]
+    events = []
+    for i in range(count):
+        events.append(EventModel(
+            event_id=str(uuid.UUID(int=rng.getrandbits(128))),
+            session_id=rng.choice(sessions),
+            app_id=app_id,
+            event_type=rng.choice(EVENT_TYPES),
+            action=rng.choice([None, "Button Click", "Navigation"]),
+            payload={
+                "page": "/" + "".join(rng.choices(string.ascii_lowercase, k=rng.randint(3, 12))),
+                "x": rng.randint(0, 1920),
+                "y": rng.randint(0, 1080),
+                "viewport": {"w": 1920, "h": 1080},
+            },
+            timestamp=start + timedelta(milliseconds=i * 250),
+        ))
+    return events
+
+def measure(label: str, encode, decode, units, n_events: int):
+    started = time.perf_counter()
+    encoded = [encode(unit) for unit in units]
+    encode_s = time.perf_counter() - started
+
+    started = time.perf_counter()
+    for body in encoded:
+        decode(body)
+    decode_s = time.perf_counter() - started
+
+    total = sum(len(body) for body in encoded)
+    return {
+        "format": label,
+        "bytes_per_event": round(total / n_events, 1),
+        "encode_us_per_event": round(encode_s / n_events * 1e6, 2),
+        "decode_us_per_event": round(decode_s / n_events * 1e6, 2),
+    }
+
+def run(n_events: int, batch: int):
+    events = synthetic_events(n_events)
+    batches = [events[i:i + batch] for i in range(0, n_events, batch)]
+
+    def json_decode(body):
+        return EventModel.model_validate(json.loads(body))
+
+    def binary_decode(body):
+        return [EventModel.model_validate(event) for event in codec.decode(body)]
+
+    # What the ingest path publishes in binary mode: SDK bodies, decoded once in the consumer
+    def raw(event):
+        return codec.RawEvent(event.model_dump_json().encode(), event.app_id, event.event_id, time.time())
+
+    return [
+        measure("json", lambda e: e.model_dump_json().encode(), json_decode, events, n_events),
+        measure("binary", lambda e: codec.encode([e]), binary_decode, events, n_events),
+        measure(f"binary_batch_{batch}", lambda b: codec.encode(b), binary_decode, batches, n_events),
+        measure(f"binary_zlib_batch_{batch}", lambda b: codec.encode(b, compress=True), binary_decode, batches, n_events),
+        measure(f"raw_zlib_batch_{batch}", lambda b: codec.encode([raw(e) for e in b], compress=True), binary_decode, batches, n_events),
+    ]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--events", type=int, default=20000)
+    parser.add_argument("--batch", type=int, default=100)
+    args = parser.parse_args()
+
+    results = run(args.events, args.batch)
+    print(f"{'format':<24}{'bytes/event':>14}{'encode us':>12}{'decode us':>12}")
+    for row in results:
+        print(f"{row['format']:<24}{row['bytes_per_event']:>14}{row['encode_us_per_event']:>12}{row['decode_us_per_event']:>12}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,333 @@
+"""
+In-memory stand-ins for Mongo, Neo4j and RabbitMQ used by the benchmarks.
+
+Every stand-in awaits a configurable injected latency per round trip so
+results reflect the number of round trips a code path makes, not just its
+CPU cost. `install()` wires them into the app's class-level clients.
+"""
+import asyncio
+import re
+from collections import Counter, defaultdict
+from pymongo import ReplaceOne
+
+class Latency:
+    """
+    Injected per-round-trip latency in seconds; 0 still yields to the loop.
+    """
+    def __init__(self, mongo: float = 0.0, neo4j: float = 0.0, broker: float = 0.0):
+        self.mongo = mongo
+        self.neo4j = neo4j
+        self.broker = broker
+
+# Mongo
+
+class FakeCursor:
+    def __init__(self, docs, latency: Latency):
+        self.docs = docs
+        self.latency = latency
+
+    async def to_list(self, length=None):
+        await asyncio.sleep(self.latency.mongo)
+        return list(self.docs if length is None else self.docs[:length])
+
+class FakeUpdateResult:
+    def __init__(self, matched_count: int):
+        self.matched_count = matched_count
+
+class FakeCollection:
+    def __init__(self, latency: Latency, operations: Counter):
+        self.docs = []
+        self.latency = latency
+        self.operations = operations
+
+    @staticmethod
+    def _matches(doc, query):
+        for k, v in query.items():
+            value = doc.get(k)
+            if isinstance(v, dict):
+                if "$gte" in v and not (value is not None and value >= v["$gte"]):
+                    return False
+                if "$lte" in v and not (value is not None and value <= v["$lte"]):
+                    return False
+                if "$in" in v and value not in v["$in"]:
+                    return False
+            elif value != v:
+                return False
+        return True
+
+    @staticmethod
+    def _apply(doc, update):
+        doc.update(update.get("$set", {}))
+        for path, amount in update.get("$inc", {}).items():
+            *parents, leaf = path.split(".")
+            target = doc
+            for part in parents:
+                target = target.setdefault(part, {})
+            target[leaf] = target.get(leaf, 0) + amount
+
+    async def find_one(self, query):
+        self.operations["find_one"] += 1
+        await asyncio.sleep(self.latency.mongo)
+        for doc in self.docs:
+            if self._matches(doc, query):
+                return dict(doc)
+        return None
+
+    def find(self, query=None, projection=None):
+        self.operations["find"] += 1
+        return FakeCursor([dict(d) for d in self.docs if self._matches(d, query or {})], self.latency)
+
+    async def insert_one(self, doc):
+        self.operations["insert_one"] += 1
+        await asyncio.sleep(self.latency.mongo)
+        self.docs.append(dict(doc))
+
+    def _update(self, query, update, upsert) -> int:
+        for doc in self.docs:
+            if self._matches(doc, query):
+                self._apply(doc, update)
+                return 1
+        if upsert:
+            doc = dict(query)
+            self._apply(doc, update)
+            self.docs.append(doc)
+        return 0
+
+    async def update_one(self, query, update, upsert=False):
+        self.operations["update_one"] += 1
+        await asyncio.sleep(self.latency.mongo)
+        return FakeUpdateResult(self._update(query, update, upsert))
+
+    def _replace(self, query, replacement, upsert):
+        for index, doc in enumerate(self.docs):
+            if self._matches(doc, query):
+                self.docs[index] = dict(replacement)
+                return
+        if upsert:
+            self.docs.append(dict(replacement))
+
+    async def bulk_write(self, requests, ordered=True):
+        # One round trip; reads pymongo's UpdateOne/ReplaceOne fields
+        self.operations["bulk_write"] += 1
+        await asyncio.sleep(self.latency.mongo)
+        for request in requests:
+            if isinstance(request, ReplaceOne):
+                self._replace(request._filter, request._doc, request._upsert)
+            else:
+                self._update(request._filter, request._doc, request._upsert)
+
+class FakeMongoDatabase:
+    def __init__(self, latency: Latency):
+        self.latency = latency
+        self.collections = {}
+        self.operations = Counter()
+
+    def __getattr__(self, name):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        if name not in self.collections:
+            self.collections[name] = FakeCollection(self.latency, self.operations)
+        return self.collections[name]
+
+    __getitem__ = __getattr__
+
+class FakeMongoClient:
+    def __init__(self, latency: Latency):
+        self.db = FakeMongoDatabase(latency)
+
+    def get_database(self, name=None):
+        return self.db
+
+    def close(self):
+        pass
+
+# Neo4j
+
+class FakeCounters:
+    def __init__(self, nodes_created: int):
+        self.nodes_created = nodes_created
+
+class FakeSummary:
+    def __init__(self, nodes_created: int):
+        self.counters = FakeCounters(nodes_created)
+
+class FakeResult:
+    def __init__(self, records, nodes_created: int = 0):
+        self.records = records
+        self.nodes_created = nodes_created
+
+    async def data(self):
+        return list(self.records)
+
+    async def single(self):
+        return self.records[0] if self.records else None
+
+    async def consume(self):
+        return FakeSummary(self.nodes_created)
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def _iterate(self):
+        for record in self.records:
+            yield record
+
+class FakeGraph:
+    """
+    A tiny model of the session/event graph: enough to answer the app's
+    queries with realistic result sizes and to count Cypher statements.
+    """
+    def __init__(self):
+        self.sessions = defaultdict(list)
+        self.events = {}
+        self.statements = Counter()
+
+    def seed(self, session_id: str, events):
+        for event in events:
+            self.events[event["event_id"]] = event
+            self.sessions[session_id].append(event)
+
+    def run(self, query: str, params: dict) -> FakeResult:
+        kind = classify(query)
+        self.statements[kind] += 1
+
+        if kind in ("store_event", "append_event"):
+            if kind == "append_event" and params["prev_event_id"] not in self.events:
+                return FakeResult([])
+            event = {k: params[k] for k in ("event_id", "event_type", "timestamp", "payload")}
+            session_id = params.get("session_id") or self.events[params["prev_event_id"]].get("session_id")
+            event["session_id"] = session_id
+            previous = self.sessions[session_id][-1]["event_type"] if self.sessions.get(session_id) else None
+            self.seed(session_id, [event])
+            return FakeResult([{"event_id": event["event_id"], "prev_type": previous}], nodes_created=1)
+
+        if kind == "event_exists":
+            return FakeResult([{"found": params["event_id"] in self.events}])
+
+        session = self.sessions.get(params.get("session_id"), [])
+        if kind == "event_flow":
+            return FakeResult([{"event": e} for e in session])
+        if kind == "latest_event":
+            return FakeResult([{"latest": session[-1]}] if session else [])
+        if kind == "event_counts":
+            counts = Counter(e["event_type"] for e in session)
+            return FakeResult([{"event_type": t, "count": c} for t, c in counts.items()])
+        return FakeResult([])
+
+QUERY_KINDS = (
+    ("append_event", re.compile(r"\$prev_event_id")),
+    ("store_event", re.compile(r"MERGE \(s:Session")),
+    ("event_exists", re.compile(r"AS found")),
+    ("session_lookup", re.compile(r"\{client_session_id: \$client_session_id\}")),
+    ("event_flow", re.compile(r"RETURN event ORDER BY")),
+    ("latest_event", re.compile(r"RETURN latest")),
+    ("event_counts", re.compile(r"e\.event_type AS event_type")),
+    ("last_event_flush", re.compile(r"MERGE \(s\)-\[:LAST_EVENT\]->\(e\)")),
+    ("schema", re.compile(r"^\s*(CREATE|DROP) (CONSTRAINT|INDEX)")),
+)
+
+def classify(query: str) -> str:
+    for kind, pattern in QUERY_KINDS:
+        if pattern.search(query):
+            return kind
+    return "other"
+
+class FakeNeo4jSession:
+    def __init__(self, graph: FakeGraph, latency: Latency):
+        self.graph = graph
+        self.latency = latency
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    async def run(self, query, parameters=None, **params):
+        await asyncio.sleep(self.latency.neo4j)
+        return self.graph.run(query, {**(parameters or {}), **params})
+
+    async def execute_read(self, transaction_function, *args, **kwargs):
+        # The session doubles as the managed transaction: both expose run()
+        return await transaction_function(self, *args, **kwargs)
+
+    async def execute_write(self, transaction_function, *args, **kwargs):
+        return await transaction_function(self, *args, **kwargs)
+
+class FakeNeo4jDriver:
+    def __init__(self, graph: FakeGraph, latency: Latency):
+        self.graph = graph
+        self.latency = latency
+
+    def session(self, default_access_mode=None, **kwargs):
+        return FakeNeo4jSession(self.graph, self.latency)
+
+    async def close(self):
+        pass
+
+# RabbitMQ
+
+class FakeExchange:
+    def __init__(self, latency: Latency):
+        self.latency = latency
+        self.published = []
+
+    async def publish(self, message, routing_key):
+        await asyncio.sleep(self.latency.broker)
+        self.published.append((routing_key, message))
+
+class FakeChannel:
+    def __init__(self, latency: Latency):
+        self.latency = latency
+        self.default_exchange = FakeExchange(latency)
+        self.exchanges = {}
+        self.is_closed = False
+
+    async def declare_exchange(self, name, type=None, **kwargs):
+        if name not in self.exchanges:
+            self.exchanges[name] = FakeExchange(self.latency)
+        return self.exchanges[name]
+
+class FakeIncomingMessage:
+    """
+    What the consumer sees for a published message.
+    """
+    _tags = 0
+
+    def __init__(self, message):
+        FakeIncomingMessage._tags += 1
+        self.delivery_tag = FakeIncomingMessage._tags
+        self.body = message.body
+        self.headers = message.headers
+        self.content_type = message.content_type
+        self.app_id = message.app_id
+        self.message_id = message.message_id
+        self.timestamp = message.timestamp
+        self.settled = None
+
+    async def ack(self):
+        self.settled = "ack"
+
+    async def nack(self, requeue=True):
+        self.settled = "nack"
+
+def install(latency: Latency):
+    """
+    Replaces the app's Mongo, Neo4j and RabbitMQ clients with stand-ins.
+    Returns the fakes so callers can seed data and inspect traffic.
+    """
+    from app.core.database import MongoDB, Neo4jDB
+    from app.api.v1.events.services import EventQueue
+
+    mongo = FakeMongoClient(latency)
+    graph = FakeGraph()
+    channel = FakeChannel(latency)
+
+    MongoDB.client = mongo
+    Neo4jDB.driver = FakeNeo4jDriver(graph, latency)
+
+    async def get_channel():
+        return channel
+
+    EventQueue.get_channel = staticmethod(get_channel)
+    return mongo.db, graph, channel
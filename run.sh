@@ -1,2 +1,12 @@
 #!/bin/bash
-uvicorn app.main:app --reload --host 0.0.0.0 --port 8000
\ No newline at end of file
+# ./run.sh          API (set RELOAD=1 for auto-reload in development)
+# ./run.sh worker   standalone event consumer, see `python -m app.worker --help`
+if [ "$1" = "worker" ]; then
+    shift
+    exec python -m app.worker "$@"
+fi
+
+if [ "$RELOAD" = "1" ]; then
+    exec uvicorn app.main:app --reload --host 0.0.0.0 --port 8000
+fi
+exec uvicorn app.main:app --host 0.0.0.0 --port 8000 --workers "${API_WORKERS:-1}"
@@ -0,0 +1,56 @@
+import gzip
+from datetime import datetime, timedelta, timezone
+import pytest
+from pydantic import ValidationError
+from app.cli.backfill import BackfillEvent, batches, read_shard, sessionize, shard_of
+from app.core.config import settings
+
+START = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+def event(event_id: str, seconds: float, session_id: str = "s1", **fields) -> BackfillEvent:
+    return BackfillEvent(
+        event_id=event_id, session_id=session_id, app_id="app", event_type="view",
+        payload={}, timestamp=fields.pop("timestamp", START + timedelta(seconds=seconds)), **fields,
+    )
+
+def test_one_server_session_without_gaps():
+    events = [event(f"e{i}", i * 60) for i in range(5)]
+    [(session, chunk)] = sessionize(events)
+    assert (session.session_id, session.client_session_id, session.segment) == ("s1", "s1", 0)
+    assert chunk == events
+
+def test_inactivity_splits_sessions():
+    gap = settings.SESSION_INACTIVITY_SECONDS
+    events = [event("a", 0), event("b", gap), event("c", 2 * gap + 1), event("d", 4 * gap + 2)]
+    sessions = sessionize(events)
+    assert [session.session_id for session, _ in sessions] == ["s1", "s1#1", "s1#2"]
+    assert [[e.event_id for e in chunk] for _, chunk in sessions] == [["a", "b"], ["c"], ["d"]]
+
+def test_naive_timestamps_are_utc():
+    gap = settings.SESSION_INACTIVITY_SECONDS
+    naive = (START + timedelta(seconds=gap + 1)).replace(tzinfo=None)
+    sessions = sessionize([event("a", 0), event("b", 0, timestamp=naive)])
+    assert len(sessions) == 2
+
+def test_read_shard_orders_and_drops_repeats(tmp_path):
+    path = tmp_path / "shard.ndjson.gz"
+    events = [event("b", 20), event("a", 10), event("b", 20), event("x", 5, session_id="s2")]
+    with gzip.open(path, "wt", encoding="utf-8") as f:
+        for e in events:
+            f.write(e.model_dump_json() + "\n")
+    sessions = {session.session_id: [e.event_id for e in chunk] for session, chunk in read_shard(str(path))}
+    assert sessions == {"s1": ["a", "b"], "s2": ["x"]}
+
+def test_batches_keep_sessions_whole():
+    sessions = [(n, [None] * n) for n in (3, 3, 5, 1)]
+    assert [[n for n, _ in batch] for batch in batches(sessions, 6)] == [[3, 3], [5, 1]]
+
+def test_shard_is_stable_per_session():
+    assert shard_of("app", "s1", 64) == shard_of("app", "s1", 64)
+    assert len({shard_of("app", f"s{i}", 64) for i in range(1000)}) == 64
+
+def test_weight_is_optional_and_positive():
+    assert event("a", 0).weight is None
+    assert event("a", 0, weight=4).weight == 4
+    with pytest.raises(ValidationError):
+        event("a", 0, weight=0)
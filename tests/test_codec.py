@@ -0,0 +1,53 @@
+import json
+from datetime import datetime, timezone
+import pytest
+from app.api.v1.events import codec
+from app.api.v1.events.models import EventModel
+
+EVENT = {"event_id": "e1", "session_id": "s1", "event_type": "click", "payload": {"x": [1, "a"]}}
+
+def raw(event_id: str, **fields) -> codec.RawEvent:
+    body = json.dumps({**EVENT, "event_id": event_id, **fields}).encode()
+    return codec.RawEvent(body, "app", event_id, 1700000000.25)
+
+def test_event_round_trip():
+    event = EventModel(app_id="app", timestamp=datetime(2025, 1, 1, tzinfo=timezone.utc), **EVENT)
+    [decoded] = codec.decode(codec.encode([event]))
+    assert EventModel.model_validate(decoded) == event
+
+@pytest.mark.parametrize("compress", [False, True])
+def test_raw_batch_round_trip(compress):
+    events = [raw(f"e{i}") for i in range(50)]
+    message = codec.encode(events, compress=compress)
+    assert codec.unpack(message) == events
+    assert (len(message) < sum(len(event.body) for event in events)) == compress
+
+def test_raw_event_data():
+    data = codec.event_data(raw("e1", app_id="spoofed"))
+    assert data["app_id"] == "app"
+    assert data["payload"] == EVENT["payload"]
+    assert data["timestamp"].timestamp() == 1700000000.25
+
+def test_raw_event_keeps_a_sent_timestamp():
+    data = codec.event_data(raw("e1", timestamp="2025-01-01T00:00:00+00:00"))
+    assert data["timestamp"] == "2025-01-01T00:00:00+00:00"
+
+def test_truncated_header():
+    message = codec.encode([raw("e1")])
+    with pytest.raises(codec.CodecError, match="header"):
+        codec.decode(message[:codec.HEADER.size - 1])
+
+def test_unknown_version():
+    message = bytearray(codec.encode([raw("e1")]))
+    message[2] = codec.VERSION + 1
+    with pytest.raises(codec.CodecError, match="version"):
+        codec.decode(bytes(message))
+
+def test_bad_magic():
+    with pytest.raises(codec.CodecError):
+        codec.decode(b"{}" + codec.encode([raw("e1")])[2:])
+
+def test_truncated_body():
+    message = codec.encode([raw("e1"), raw("e2")])
+    with pytest.raises(codec.CodecError):
+        codec.decode(message[:-5])
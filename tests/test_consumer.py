@@ -0,0 +1,70 @@
+import asyncio
+import json
+import time
+from datetime import datetime, timezone
+from types import SimpleNamespace
+import aio_pika
+from app.api.v1.events import codec, consumer
+from app.api.v1.events.consumer import decode_events
+from app.api.v1.events.services import RECEIVED_AT_HEADER
+
+def message(event: dict, **headers) -> aio_pika.Message:
+    return aio_pika.Message(
+        body=json.dumps(event).encode(),
+        content_type="application/json",
+        app_id="app",
+        headers=headers,
+    )
+
+EVENT = {"event_id": "e1", "session_id": "s1", "event_type": "click", "payload": {}}
+
+def test_app_id_comes_from_the_message():
+    [event] = decode_events(message({**EVENT, "app_id": "spoofed"}))
+    assert event.app_id == "app"
+
+def test_missing_timestamp_is_the_ingest_time():
+    received_at = time.time() - 3600
+    [event] = decode_events(message(EVENT, **{RECEIVED_AT_HEADER: received_at}))
+    assert event.timestamp.tzinfo is not None
+    assert abs(event.timestamp.timestamp() - received_at) < 1e-3
+
+def test_sent_timestamp_is_kept():
+    sent = "2025-01-01T00:00:00+00:00"
+    [event] = decode_events(message({**EVENT, "timestamp": sent}, **{RECEIVED_AT_HEADER: time.time()}))
+    assert event.timestamp == datetime(2025, 1, 1, tzinfo=timezone.utc)
+
+class Delivery(SimpleNamespace):
+    async def ack(self):
+        self.settled = "ack"
+
+    async def nack(self, requeue: bool):
+        self.settled = "nack"
+
+class Exchange:
+    def __init__(self):
+        self.published = []
+
+    async def publish(self, message, routing_key):
+        self.published.append((routing_key, message))
+
+def test_batch_parks_only_the_failed_event(monkeypatch):
+    stored = []
+    async def handle_event(event):
+        stored.append(event.event_id)
+    monkeypatch.setattr(consumer, "handle_event", handle_event)
+
+    bad = codec.RawEvent(b'{"event_id": "e2"}', "app", "e2", time.time())
+    events = [codec.RawEvent(json.dumps({**EVENT, "event_id": "e1"}).encode(), "app", "e1", time.time()), bad]
+    delivery = Delivery(
+        body=codec.encode(events), content_type=codec.CONTENT_TYPE_BINARY, headers={},
+        delivery_tag=1, app_id=None, message_id=None, timestamp=None,
+    )
+    channel = SimpleNamespace(default_exchange=Exchange())
+    asyncio.run(consumer.process_batch(channel, [delivery]))
+
+    assert stored == ["e1"]
+    assert delivery.settled == "ack"
+    [(routing_key, parked)] = channel.default_exchange.published
+    assert routing_key.endswith(".dead")
+    assert parked.message_id == "e2"
+    assert codec.unpack(parked.body) == [bad]
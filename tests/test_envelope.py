@@ -0,0 +1,71 @@
+import json
+import pytest
+from fastapi import HTTPException
+from app.api.v1.events.envelope import check_envelope
+from app.core.config import settings
+
+def body(**fields) -> bytes:
+    event = {"event_id": "e1", "session_id": "s1", "event_type": "click", "payload": {}}
+    event.update(fields)
+    return json.dumps({k: v for k, v in event.items() if v is not None}).encode()
+
+def rejected(raw: bytes) -> HTTPException:
+    with pytest.raises(HTTPException) as info:
+        check_envelope(raw)
+    return info.value
+
+def test_returns_event_id():
+    assert check_envelope(body()) == "e1"
+
+def test_accepts_surrounding_whitespace():
+    assert check_envelope(b"  \n" + body() + b"\n") == "e1"
+
+def test_field_nested_in_payload_does_not_count():
+    error = rejected(body(session_id=None, payload={"session_id": "x"}))
+    assert error.status_code == 422
+    assert error.detail == 'Missing field "session_id"'
+
+def test_nested_event_id_is_not_the_event_id():
+    raw = b'{"payload": {"event_id": "nested"}, "event_id": "top", "session_id": "s", "event_type": "t"}'
+    assert check_envelope(raw) == "top"
+
+def test_key_names_inside_string_values_do_not_count():
+    error = rejected(body(event_type=None, payload={"note": '"event_type": "x"'}))
+    assert error.detail == 'Missing field "event_type"'
+
+def test_duplicate_keys_resolve_like_the_consumer():
+    raw = b'{"event_id": "a", "event_id": "b", "session_id": "s", "event_type": "t", "payload": {}}'
+    assert check_envelope(raw) == json.loads(raw)["event_id"] == "b"
+
+def test_event_id_must_be_a_short_non_empty_string():
+    for event_id in (42, "", "x" * 129, "é" * 65):
+        assert rejected(body(event_id=event_id)).detail == "Invalid event_id"
+    assert check_envelope(body(event_id="x" * 128)) == "x" * 128
+
+def test_not_an_object():
+    assert rejected(b'["event_id"]').detail == "Event body must be a JSON object"
+
+def test_malformed_bodies():
+    for raw in (
+        b'{"event_id": "e1", "payload": {"a": 1}',
+        b'{"event_id": "e1}',
+        b'{"a": 1}{"event_id": "e1", "session_id": "s", "event_type": "t", "payload": {}}',
+        b'',
+    ):
+        assert rejected(raw).detail.startswith("Malformed event body")
+
+def test_too_large():
+    raw = body(payload={"blob": "x" * settings.MAX_EVENT_BYTES})
+    assert rejected(raw).status_code == 413
+
+def test_payload_before_the_envelope_keys():
+    raw = b'{"payload": {"event_id": "nested", "list": [1, {"a": "}"}]}, "event_id": "top", "session_id": "s", "event_type": "t"}'
+    assert check_envelope(raw) == "top"
+
+def test_escaped_event_id():
+    assert check_envelope(body(event_id='a"b\\u00e9')) == 'a"b\\u00e9'
+    assert check_envelope(b'{"event_id": "\\u00e9", "session_id": "s", "event_type": "t", "payload": {}}') == "é"
+
+def test_keys_after_the_payload():
+    raw = b'{"event_id": "e1", "payload": {"session_id": "x"}, "event_type": "t", "session_id": "s"}'
+    assert check_envelope(raw) == "e1"
@@ -0,0 +1,126 @@
+import asyncio
+import base64
+import gzip
+import json
+from datetime import datetime, timedelta, timezone
+import pytest
+from fastapi import FastAPI, HTTPException
+from fastapi.testclient import TestClient
+from app.api.v1.apps.services import AppService
+from app.api.v1.auth.dependencies import verify_api_key
+from app.api.v1.events import export
+from app.api.v1.events.analytics import analytics_router
+from app.api.v1.events.export import decode_cursor, encode_cursor, time_bound, to_line
+from app.cli.backfill import BackfillEvent
+
+RECORD = {
+    "event_id": "e1", "session_id": "s1", "event_type": "click",
+    "timestamp": "2024-01-01T00:00:00+00:00", "payload": '{"button": "buy"}', "weight": None,
+}
+
+def test_cursor_round_trip():
+    for timestamp, event_id in [("2024-01-01T00:00:00+00:00", "e1"), ("", ""), ("t", 'id "with" quotes/+')]:
+        assert decode_cursor(encode_cursor(timestamp, event_id)) == (timestamp, event_id)
+
+def test_no_cursor_starts_at_the_beginning():
+    assert decode_cursor(None) == decode_cursor("") == ("", "")
+
+def test_invalid_cursors():
+    for cursor in ("not base64!", base64.urlsafe_b64encode(b'{"a": 1}').decode(),
+                   base64.urlsafe_b64encode(b"[1, 2, 3]").decode()):
+        with pytest.raises(HTTPException) as info:
+            decode_cursor(cursor)
+        assert info.value.status_code == 400
+
+def test_time_bounds_are_utc():
+    local = datetime(2024, 1, 1, 2, tzinfo=timezone(timedelta(hours=2)))
+    assert time_bound(local, "") == "2024-01-01T00:00:00+00:00"
+    assert time_bound(None, export.OPEN_END) == export.OPEN_END
+
+def test_line_is_an_importable_event():
+    line = to_line(RECORD, "app")
+    assert line.endswith("\n")
+    data = json.loads(line)
+    assert data["payload"] == {"button": "buy"} and data["app_id"] == "app"
+    assert "weight" not in data
+    assert BackfillEvent.model_validate_json(line).event_id == "e1"
+
+def test_line_carries_the_weight_when_sampled():
+    data = json.loads(to_line({**RECORD, "weight": 4.0}, "app"))
+    assert data["weight"] == 4.0
+
+def test_line_with_missing_or_decoded_payload():
+    assert json.loads(to_line({**RECORD, "payload": None}, "app"))["payload"] == {}
+    assert json.loads(to_line({**RECORD, "payload": {"a": 1}}, "app"))["payload"] == {"a": 1}
+
+def stored_events(count: int) -> list:
+    # Two events per timestamp, so pages break between equal timestamps too
+    return [
+        {**RECORD, "event_id": f"e{i:03d}", "timestamp": f"2024-01-01T00:00:{i // 2:02d}+00:00"}
+        for i in range(count)
+    ]
+
+@pytest.fixture
+def graph(monkeypatch):
+    events = []
+
+    async def read(query_class, query, app_id, start, end, after_timestamp, after_event_id, limit):
+        matching = [
+            e for e in events
+            if start <= e["timestamp"] < end and (e["timestamp"], e["event_id"]) > (after_timestamp, after_event_id)
+        ]
+        return sorted(matching, key=lambda e: (e["timestamp"], e["event_id"]))[:limit]
+
+    monkeypatch.setattr(export, "read", read)
+    monkeypatch.setattr(export.settings, "EXPORT_PAGE_SIZE", 3)
+    return events
+
+async def collect(**kwargs) -> list:
+    return [page async for page in export.export_pages("app", **kwargs)]
+
+def test_pages_cover_every_event_once(graph):
+    graph.extend(stored_events(8))
+    pages = asyncio.run(collect())
+    lines = [json.loads(line) for text, _ in pages for line in text.splitlines()]
+    assert [line["event_id"] for line in lines] == [f"e{i:03d}" for i in range(8)]
+    assert len(pages) == 3
+
+def test_resuming_from_a_page_cursor(graph):
+    graph.extend(stored_events(8))
+    _, cursor = asyncio.run(collect())[0]
+    resumed = asyncio.run(collect(cursor=cursor))
+    assert [json.loads(line)["event_id"] for text, _ in resumed for line in text.splitlines()][0] == "e003"
+
+def test_gzip_stream_decompresses(graph):
+    graph.extend(stored_events(5))
+
+    async def stream():
+        return b"".join([chunk async for chunk in export.gzip_ndjson("app")])
+
+    assert len(gzip.decompress(asyncio.run(stream())).splitlines()) == 5
+
+@pytest.fixture
+def client(graph, monkeypatch):
+    async def get_app(app_id, user_id):
+        return {"app_id": app_id}
+    monkeypatch.setattr(AppService, "get_app", get_app)
+    app = FastAPI()
+    app.include_router(analytics_router)
+    app.dependency_overrides[verify_api_key] = lambda: {"user_id": "user"}
+    return TestClient(app)
+
+def exported(response) -> list:
+    assert response.status_code == 200
+    return [json.loads(line) for line in gzip.decompress(response.content).splitlines()]
+
+def test_resuming_over_http_after_the_last_received_line(client, graph):
+    graph.extend(stored_events(8))
+    received = exported(client.get("/apps/app/export"))[:4]
+    last = received[-1]
+    params = {"after_timestamp": last["timestamp"], "after_event_id": last["event_id"]}
+    resumed = exported(client.get("/apps/app/export", params=params))
+    assert [line["event_id"] for line in received + resumed] == [f"e{i:03d}" for i in range(8)]
+
+def test_resuming_over_http_needs_both_keys(client):
+    assert client.get("/apps/app/export", params={"after_event_id": "e1"}).status_code == 400
+    assert client.get("/apps/app/export", params={"cursor": "not base64!"}).status_code == 400
@@ -0,0 +1,85 @@
+import random
+from collections import Counter
+from app.api.v1.events.heavy_hitters import SpaceSaving
+
+def summary_of(values, capacity: int) -> SpaceSaving:
+    summary = SpaceSaving(capacity)
+    for value in values:
+        summary.add(value)
+    return summary
+
+def skewed_stream(seed: int, length: int = 5000) -> list:
+    rng = random.Random(seed)
+    heavy = ["home"] * 1000 + ["search"] * 600 + ["cart"] * 400
+    tail = [f"page-{rng.randrange(2000)}" for _ in range(length - len(heavy))]
+    stream = heavy + tail
+    rng.shuffle(stream)
+    return stream
+
+def test_exact_below_capacity():
+    summary = summary_of(["a", "b", "a", "c", "a", "b"], capacity=5)
+    assert summary.counts == {"a": 3, "b": 2, "c": 1}
+    assert set(summary.errors.values()) == {0}
+    assert summary.top(2) == [("a", 3), ("b", 2)]
+
+def test_new_value_replaces_the_minimum():
+    summary = summary_of(["a", "a", "b", "c"], capacity=2)
+    # "b" (count 1) is evicted; "c" inherits its count as error
+    assert summary.counts == {"a": 2, "c": 2}
+    assert summary.errors == {"a": 0, "c": 1}
+
+def test_weighted_amounts():
+    summary = SpaceSaving(3)
+    summary.add("a", 2.5)
+    summary.add("a", 0.5)
+    summary.add("b", 4)
+    assert summary.counts == {"a": 3.0, "b": 4}
+
+def test_bounds_hold_past_capacity():
+    stream = skewed_stream(seed=1)
+    actual = Counter(stream)
+    summary = summary_of(stream, capacity=50)
+    assert len(summary.counts) == 50
+    for value, count in summary.counts.items():
+        assert count - summary.errors[value] <= actual[value] <= count
+    # Every value above total / capacity is kept
+    for value, n in actual.items():
+        if n > len(stream) / 50:
+            assert value in summary.counts
+    assert [value for value, _ in summary.top(3)] == ["home", "search", "cart"]
+
+def test_merge_sums_counts_and_errors():
+    first = summary_of(["a", "a", "b"], capacity=4)
+    second = summary_of(["a", "c", "c", "c"], capacity=4)
+    merged = SpaceSaving.merge(4, [first, second])
+    assert merged.counts == {"a": 3, "b": 1, "c": 3}
+    assert set(merged.errors.values()) == {0}
+
+def test_merge_keeps_the_largest_and_bounds_hold():
+    streams = [skewed_stream(seed) for seed in (2, 3, 4)]
+    actual = Counter(value for stream in streams for value in stream)
+    merged = SpaceSaving.merge(50, [summary_of(stream, capacity=50) for stream in streams])
+    assert len(merged.counts) == 50
+    for value, count in merged.counts.items():
+        assert count - merged.errors[value] <= actual[value] <= count
+    assert [value for value, _ in merged.top(3)] == ["home", "search", "cart"]
+
+def test_merge_bounds_values_a_full_summary_evicted():
+    # "b" is evicted from the first summary after being counted twice
+    first = summary_of(["a", "a", "a", "b", "b", "c", "c", "c"], capacity=2)
+    second = summary_of(["b"] * 4, capacity=2)
+    actual = Counter(["a", "a", "a", "b", "b", "c", "c", "c"] + ["b"] * 4)
+    merged = SpaceSaving.merge(2, [first, second])
+    assert set(merged.counts) == {"b", "c"}
+    for value, count in merged.counts.items():
+        assert count - merged.errors[value] <= actual[value] <= count
+    for value, n in actual.items():
+        if n > sum(actual.values()) / 2:
+            assert value in merged.counts
+
+def test_dump_and_load_round_trip():
+    summary = summary_of(skewed_stream(seed=5), capacity=20)
+    loaded = SpaceSaving.load(20, summary.dump())
+    assert loaded.counts == summary.counts and loaded.errors == summary.errors
+    loaded.add("new-value")
+    assert len(loaded.counts) == 20
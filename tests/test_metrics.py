@@ -0,0 +1,32 @@
+import asyncio
+from app.core import metrics
+from app.core.config import settings
+
+def test_label_values_are_escaped():
+    counter = metrics.Counter("test_escaped_total", "Escaping test", ("reason",))
+    metrics.REGISTRY.remove(counter)
+    counter.inc('a "quoted" \\ value\nwith a newline')
+    assert list(counter.render())[-1] == 'test_escaped_total{reason="a \\"quoted\\" \\\\ value\\nwith a newline"} 1'
+
+def scrape(*headers: str) -> bytes:
+    async def run():
+        server = await metrics.serve(0, host="127.0.0.1")
+        port = server.sockets[0].getsockname()[1]
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        writer.write("".join(f"{line}\r\n" for line in ("GET /metrics HTTP/1.1", *headers, "")).encode())
+        response = await reader.read()
+        writer.close()
+        server.close()
+        await server.wait_closed()
+        return response
+    return asyncio.run(run())
+
+def test_scrapes_are_open_without_a_token(monkeypatch):
+    monkeypatch.setattr(settings, "METRICS_TOKEN", "")
+    assert scrape().startswith(b"HTTP/1.1 200")
+
+def test_scrapes_need_the_token_when_set(monkeypatch):
+    monkeypatch.setattr(settings, "METRICS_TOKEN", "secret")
+    assert scrape().startswith(b"HTTP/1.1 401")
+    assert scrape("Authorization: Bearer wrong").startswith(b"HTTP/1.1 401")
+    assert scrape("Authorization: Bearer secret").startswith(b"HTTP/1.1 200")
@@ -0,0 +1,58 @@
+import pytest
+from fastapi import HTTPException, Response
+from app.api.v1.events.quotas import IngestQuotas, TokenBucket
+from app.core.config import settings
+
+@pytest.fixture(autouse=True)
+def single_worker(monkeypatch):
+    monkeypatch.setattr(IngestQuotas, "limits", {})
+    monkeypatch.setattr(settings, "API_WORKERS", 1)
+    monkeypatch.setattr(settings, "INGEST_RATE_LIMIT", 100)
+    monkeypatch.setattr(settings, "INGEST_BURST", 0)
+
+def bucket_at(rate: float, burst: float, now: float = 0.0) -> TokenBucket:
+    bucket = TokenBucket(rate, burst)
+    bucket.updated = now
+    return bucket
+
+def test_starts_full_then_drains():
+    bucket = bucket_at(rate=1, burst=3)
+    assert [bucket.take(0.0) for _ in range(4)] == [True, True, True, False]
+
+def test_refills_at_the_rate():
+    bucket = bucket_at(rate=10, burst=1)
+    assert bucket.take(0.0)
+    assert not bucket.take(0.05)
+    assert bucket.wait() == pytest.approx(0.05)
+    assert bucket.take(0.1)
+
+def test_refill_is_capped_at_the_burst():
+    bucket = bucket_at(rate=10, burst=2)
+    assert sum(bucket.take(1000.0) for _ in range(5)) == 2
+
+def test_quota_is_split_across_workers(monkeypatch):
+    monkeypatch.setattr(settings, "API_WORKERS", 4)
+    bucket = IngestQuotas.bucket({"app_id": "app", "ingest_rate_limit": 400, "ingest_burst": 800})
+    assert (bucket.rate, bucket.burst) == (100, 200)
+
+def test_defaults_and_unlimited(monkeypatch):
+    bucket = IngestQuotas.bucket({"app_id": "a"})
+    assert (bucket.rate, bucket.burst) == (100, 200)
+    monkeypatch.setattr(settings, "INGEST_RATE_LIMIT", 0)
+    assert IngestQuotas.bucket({"app_id": "b"}) is None
+
+def test_bucket_is_rebuilt_when_the_quota_changes():
+    first = IngestQuotas.bucket({"app_id": "app", "ingest_rate_limit": 5})
+    assert IngestQuotas.bucket({"app_id": "app", "ingest_rate_limit": 5}) is first
+    assert IngestQuotas.bucket({"app_id": "app", "ingest_rate_limit": 6}).rate == 6
+
+def test_check_sets_headers_then_rejects():
+    app = {"app_id": "app", "ingest_rate_limit": 1, "ingest_burst": 1}
+    response = Response()
+    IngestQuotas.check(app, response)
+    assert response.headers["x-ratelimit-limit"] == "1"
+    assert response.headers["x-ratelimit-remaining"] == "0"
+    with pytest.raises(HTTPException) as info:
+        IngestQuotas.check(app, Response())
+    assert info.value.status_code == 429
+    assert info.value.headers["Retry-After"] == "1"
@@ -0,0 +1,70 @@
+import asyncio
+import time
+from collections import OrderedDict
+import pytest
+from fastapi import HTTPException
+from app.api.v1.events.rates import ALL_TYPES, RateQueries, RateStore, Ring
+from app.core.config import settings
+
+@pytest.fixture(autouse=True)
+def empty_store(monkeypatch):
+    monkeypatch.setattr(RateStore, "series", OrderedDict())
+
+def test_add_and_read():
+    ring = Ring(width=1, size=5)
+    ring.add(100, 2)
+    ring.add(100.5, 1)
+    ring.add(102, 4)
+    assert ring.head == 102
+    assert ring.read(98, 102) == [0, 0, 3, 0, 4]
+
+def test_buckets_outside_the_ring_read_as_zero():
+    ring = Ring(width=1, size=5)
+    for second in range(100, 105):
+        ring.add(second, 1)
+    assert ring.read(99, 106) == [0, 1, 1, 1, 1, 1, 0, 0]
+
+def test_advancing_the_head_clears_skipped_buckets():
+    ring = Ring(width=1, size=5)
+    for second in range(100, 105):
+        ring.add(second, 1)
+    ring.add(107, 3)
+    assert ring.read(102, 107) == [0, 1, 1, 0, 0, 3]
+    ring.add(200, 1)
+    assert ring.read(196, 200) == [0, 0, 0, 0, 1]
+
+def test_adds_older_than_the_ring_are_dropped():
+    ring = Ring(width=1, size=5)
+    ring.add(110, 1)
+    ring.add(105, 7)
+    ring.add(106, 2)
+    assert ring.read(105, 110) == [0, 2, 0, 0, 0, 1]
+
+def test_wider_buckets():
+    ring = Ring(width=60, size=3)
+    ring.add(60, 1)
+    ring.add(119, 1)
+    ring.add(120, 5)
+    assert ring.read(1, 2) == [2, 5]
+
+def test_store_drops_the_least_recently_updated_series(monkeypatch):
+    monkeypatch.setattr(settings, "TIMESERIES_MAX_SERIES", 2)
+    RateStore.add("app", "a", 100, 1)
+    RateStore.add("app", "b", 100, 1)
+    RateStore.add("app", "a", 101, 1)
+    RateStore.add("app", "c", 101, 1)
+    assert list(RateStore.series) == [("app", "a"), ("app", "c")]
+
+def test_query_sums_steps():
+    now = time.time()
+    RateStore.add("app", ALL_TYPES, now, 3)
+    RateStore.add("app", ALL_TYPES, now - 60, 2)
+    rates = asyncio.run(RateQueries.get_event_rates("app", resolution="second", window=120, step=60))
+    assert rates["total"] == 5
+    assert len(rates["points"]) == 2
+
+def test_query_window_beyond_the_ring_is_rejected():
+    RateStore.add("app", ALL_TYPES, time.time(), 1)
+    with pytest.raises(HTTPException) as info:
+        asyncio.run(RateQueries.get_event_rates("app", resolution="second", window=settings.TIMESERIES_SECONDS + 1))
+    assert info.value.status_code == 400
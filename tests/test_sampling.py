@@ -0,0 +1,86 @@
+import asyncio
+from types import SimpleNamespace
+import pytest
+from app.api.v1.events import sampling
+from app.api.v1.events.sampling import Sampler, session_fraction
+from app.core.config import settings
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self) -> float:
+        return self.now
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(sampling, "time", SimpleNamespace(monotonic=clock.monotonic))
+    monkeypatch.setattr(Sampler, "rules", {})
+    monkeypatch.setattr(Sampler, "arrivals", {})
+    monkeypatch.setattr(settings, "WORKER_PROCESSES", 1)
+    monkeypatch.setattr(settings, "API_WORKERS", 1)
+    monkeypatch.setattr(settings, "SAMPLING_WINDOW_SECONDS", 1.0)
+    monkeypatch.setattr(settings, "SAMPLING_MIN_RATE", 0.001)
+    return clock
+
+def arrive(clock: Clock, rule: dict, per_second: int, seconds: int) -> float:
+    """
+    Feeds `per_second` events a second for `seconds` seconds; returns the last rate.
+    """
+    for _ in range(seconds * per_second):
+        clock.now += 1 / per_second
+        rate = Sampler.rate("app", "scroll", rule)
+    return rate
+
+def test_fixed_rate(clock):
+    assert Sampler.rate("app", "scroll", {"rate": 0.25}) == 0.25
+    assert Sampler.rate("app", "scroll", {"rate": None}) == 1.0
+    assert not Sampler.arrivals
+
+def test_adaptive_rate_follows_the_target(clock):
+    rule = {"rate": 1.0, "max_events_per_second": 100}
+    assert arrive(clock, rule, per_second=50, seconds=3) == 1.0
+    assert arrive(clock, rule, per_second=1000, seconds=10) == pytest.approx(0.1, rel=0.05)
+
+def test_adaptive_rate_never_exceeds_the_rule(clock):
+    rule = {"rate": 0.05, "max_events_per_second": 100}
+    assert arrive(clock, rule, per_second=200, seconds=5) == 0.05
+
+def test_adaptive_rate_has_a_floor(clock):
+    rule = {"rate": 1.0, "max_events_per_second": 1}
+    assert arrive(clock, rule, per_second=5000, seconds=3) == settings.SAMPLING_MIN_RATE
+
+def test_target_is_split_across_workers(clock, monkeypatch):
+    monkeypatch.setattr(settings, "EMBEDDED_CONSUMER", False)
+    monkeypatch.setattr(settings, "WORKER_PROCESSES", 4)
+    monkeypatch.setattr(settings, "API_WORKERS", 2)
+    rule = {"rate": 1.0, "max_events_per_second": 400}
+    assert arrive(clock, rule, per_second=1000, seconds=10) == pytest.approx(0.1, rel=0.05)
+
+def test_embedded_target_is_split_across_api_workers(clock, monkeypatch):
+    monkeypatch.setattr(settings, "EMBEDDED_CONSUMER", True)
+    monkeypatch.setattr(settings, "WORKER_PROCESSES", 2)
+    monkeypatch.setattr(settings, "API_WORKERS", 4)
+    rule = {"rate": 1.0, "max_events_per_second": 400}
+    assert arrive(clock, rule, per_second=1000, seconds=10) == pytest.approx(0.1, rel=0.05)
+
+def test_session_fraction_is_deterministic_and_uniform():
+    fractions = [session_fraction(f"s{i}") for i in range(10_000)]
+    assert fractions[:100] == [session_fraction(f"s{i}") for i in range(100)]
+    assert all(0 <= f < 1 for f in fractions)
+    assert sum(f < 0.1 for f in fractions) == pytest.approx(1000, rel=0.1)
+
+def test_weight_keeps_whole_sessions(clock):
+    Sampler.rules["app"] = (clock.now, {"*": {"event_type": "*", "rate": 0.5}})
+    weights = {
+        session: asyncio.run(Sampler.weight("app", "click", session))
+        for session in (f"s{i}" for i in range(200))
+    }
+    for session, weight in weights.items():
+        assert weight == (2.0 if session_fraction(session) < 0.5 else None)
+        assert asyncio.run(Sampler.weight("app", "view", session)) == weight
+
+def test_types_without_a_rule_are_kept(clock):
+    Sampler.rules["app"] = (clock.now, {"scroll": {"event_type": "scroll", "rate": 0.01}})
+    assert asyncio.run(Sampler.weight("app", "click", "s1")) == 1.0
@@ -0,0 +1,42 @@
+from app.api.v1.events.sketches import RELATIVE_ERROR, HyperLogLog
+
+def sketch_of(values) -> HyperLogLog:
+    sketch = HyperLogLog()
+    for value in values:
+        sketch.add(value)
+    return sketch
+
+def within(estimate: int, actual: int, errors: float = 3) -> bool:
+    return abs(estimate - actual) <= errors * RELATIVE_ERROR * actual
+
+def test_empty_sketch_counts_zero():
+    assert HyperLogLog().count() == 0
+
+def test_small_counts_are_nearly_exact():
+    assert abs(sketch_of(f"s{i}" for i in range(100)).count() - 100) <= 2
+
+def test_large_count_within_error():
+    assert within(sketch_of(f"s{i}" for i in range(20_000)).count(), 20_000)
+
+def test_repeated_values_count_once():
+    values = [f"s{i}" for i in range(500)]
+    assert sketch_of(values * 3).count() == sketch_of(values).count()
+
+def test_merge_is_the_union():
+    first = sketch_of(f"s{i}" for i in range(0, 6000))
+    second = sketch_of(f"s{i}" for i in range(4000, 10_000))
+    merged = HyperLogLog(first.registers).merge(second)
+    assert within(merged.count(), 10_000)
+    assert merged.registers == sketch_of(f"s{i}" for i in range(10_000)).registers
+
+def test_merge_is_commutative_and_idempotent():
+    first = sketch_of(f"a{i}" for i in range(300))
+    second = sketch_of(f"b{i}" for i in range(300))
+    forward = HyperLogLog(first.registers).merge(second)
+    backward = HyperLogLog(second.registers).merge(first)
+    assert forward.registers == backward.registers
+    assert HyperLogLog(forward.registers).merge(second).registers == forward.registers
+
+def test_dump_and_load_round_trip():
+    sketch = sketch_of(f"s{i}" for i in range(1000))
+    assert HyperLogLog.load(sketch.dump()).registers == sketch.registers
@@ -0,0 +1,49 @@
+import asyncio
+import pytest
+from app.api.v1.events.services import EventQueue
+from app.api.v1.events.spool import EventSpool
+from app.core.config import settings
+
+@pytest.fixture(autouse=True)
+def empty_spool(monkeypatch, tmp_path):
+    monkeypatch.setattr(settings, "SPOOL_DIR", str(tmp_path))
+    monkeypatch.setattr(settings, "SPOOL_SEGMENT_BYTES", 4096)
+    monkeypatch.setattr(settings, "SPOOL_DRAIN_BATCH", 2)
+    for name, value in (("directory", None), ("_lock", None), ("active", None), ("sealed", []), ("sealed_bytes", 0), ("next_seq", 0)):
+        monkeypatch.setattr(EventSpool, name, value)
+    yield
+    if EventSpool.active is not None:
+        EventSpool.active.seal()
+    if EventSpool._lock is not None:
+        EventSpool._lock.close()
+
+def spool(event_id: str):
+    assert EventSpool.append(b"{}", "app", event_id, 1.0)
+
+def test_events_spooled_during_a_drain_are_drained_before_handing_back(monkeypatch):
+    published = []
+    async def push_raw_events(events):
+        published.extend(event.event_id for event in events)
+        # Ingest keeps spooling while the backlog is replayed
+        if len(published) <= 4:
+            spool(f"late{len(published)}")
+    monkeypatch.setattr(EventQueue, "push_raw_events", push_raw_events)
+
+    for event_id in ("e1", "e2", "e3"):
+        spool(event_id)
+    asyncio.run(EventSpool.drain())
+
+    assert published == ["e1", "e2", "e3", "late2", "late3"]
+    assert not EventSpool.pending()
+
+def test_repeated_event_ids_are_replayed_once(monkeypatch):
+    published = []
+    async def push_raw_events(events):
+        published.extend(event.event_id for event in events)
+    monkeypatch.setattr(EventQueue, "push_raw_events", push_raw_events)
+
+    for event_id in ("e1", "e2", "e1"):
+        spool(event_id)
+    asyncio.run(EventSpool.drain())
+
+    assert published == ["e1", "e2"]
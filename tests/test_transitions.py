@@ -0,0 +1,59 @@
+import asyncio
+from collections import Counter
+from datetime import datetime, timezone
+from types import SimpleNamespace
+import pytest
+from pymongo.errors import BulkWriteError
+from app.api.v1.events.transitions import START, TransitionMatrix
+from app.core.database import MongoDB
+
+DAY = datetime(2025, 1, 31, tzinfo=timezone.utc)
+
+def event(event_type: str) -> SimpleNamespace:
+    return SimpleNamespace(app_id="app", timestamp=DAY, event_type=event_type)
+
+class Collection:
+    def __init__(self, errors=()):
+        self.errors = list(errors)
+        self.written = []
+
+    async def bulk_write(self, operations, ordered):
+        self.written.append(operations)
+        if self.errors:
+            raise BulkWriteError({"writeErrors": self.errors})
+
+@pytest.fixture
+def collection(monkeypatch):
+    collection = Collection()
+    monkeypatch.setattr(MongoDB, "get_db", lambda: SimpleNamespace(event_transitions=collection))
+    monkeypatch.setattr(TransitionMatrix, "pending", {})
+    return collection
+
+def test_event_types_mongo_cannot_store_are_not_counted(collection):
+    for event_type in ("", "a\x00b", "\ud800"):
+        TransitionMatrix.observe(event(event_type), "click")
+        if event_type:
+            TransitionMatrix.observe(event("click"), event_type)
+    assert TransitionMatrix.pending == {}
+
+def test_flush_upserts_one_document_per_previous_type(collection):
+    TransitionMatrix.observe(event("view"), None)
+    TransitionMatrix.observe(event("buy.now"), "view")
+    TransitionMatrix.observe(event("exit"), "view", weight=2)
+    asyncio.run(TransitionMatrix.flush())
+
+    [operations] = collection.written
+    updates = {op._filter["from"]: op._doc["$inc"] for op in operations}
+    assert updates == {START: {"to.view": 1}, "view": {"to.buy%2Enow": 1, "to.exit": 2}}
+    assert TransitionMatrix.pending == {}
+
+def test_only_failed_operations_are_requeued(collection):
+    for prev_type in ("a", "b", "c"):
+        TransitionMatrix.observe(event("next"), prev_type)
+    collection.errors = [
+        {"index": 0, "code": 11000, "errmsg": "duplicate key"},
+        {"index": 2, "code": 56, "errmsg": "empty field name"},
+    ]
+    asyncio.run(TransitionMatrix.flush())
+
+    assert TransitionMatrix.pending == {("app", "2025-01-31"): Counter({("a", "next"): 1})}